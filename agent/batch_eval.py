@@ -0,0 +1,245 @@
+"""Đánh giá hàng loạt CV theo một mô tả công việc.
+
+Các lời gọi `evaluate_cv` chạy song song với số lượng giới hạn; mỗi kết quả được
+ghi ngay vào file JSONL nên khi chạy lại, các CV đã đánh giá thành công được bỏ
+qua (CV bị lỗi sẽ được thử lại).
+
+    python -m agent.batch_eval cvs/ --jd-file jd.txt --output ket_qua.jsonl
+    python -m agent.batch_eval cvs.jsonl --jd "Backend Python 3 năm" --concurrency 32
+
+Thư mục CV gồm các file .txt/.md (id là tên file); file JSONL có các trường `id`
+và `cv_text` (hoặc `text`).
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+
+from agent.job_agent import CVModule
+from agent.llm_cache import CACHE_DIR
+from agent.llm_client import get_module
+from agent.rate_limiter import BATCH, priority
+
+CONCURRENCY = int(os.getenv("BATCH_EVAL_CONCURRENCY", "16"))
+BATCH_DIR = os.path.join(CACHE_DIR, "batches")
+CV_EXTENSIONS = (".txt", ".md")
+
+
+def normalize_cvs(items: Sequence[Any]) -> List[Dict[str, str]]:
+    """Đưa đầu vào về dạng [{"id", "cv_text"}]; id trùng nhau chỉ giữ bản đầu tiên"""
+    cvs: Dict[str, Dict[str, str]] = {}
+    for i, item in enumerate(items):
+        if isinstance(item, dict):
+            cv_id = str(item.get("id", i))
+            text = str(item.get("cv_text") or item.get("text") or "")
+        else:
+            cv_id, text = str(i), str(item)
+        if text.strip():
+            cvs.setdefault(cv_id, {"id": cv_id, "cv_text": text})
+    return list(cvs.values())
+
+
+def load_cvs(path: str) -> List[Dict[str, str]]:
+    """Đọc CV từ thư mục (.txt/.md) hoặc file JSONL"""
+    if os.path.isdir(path):
+        items = []
+        for name in sorted(os.listdir(path)):
+            if name.lower().endswith(CV_EXTENSIONS):
+                with open(os.path.join(path, name), encoding="utf-8") as f:
+                    items.append({"id": os.path.splitext(name)[0], "cv_text": f.read()})
+        return normalize_cvs(items)
+    with open(path, encoding="utf-8") as f:
+        return normalize_cvs([json.loads(line) for line in f if line.strip()])
+
+
+def batch_id(cvs: Sequence[Dict[str, str]], job_description: str) -> str:
+    """Id ổn định của một lô (cùng JD và cùng danh sách CV thì cùng id)"""
+    digest = hashlib.sha256(job_description.encode("utf-8"))
+    for cv in cvs:
+        digest.update(b"\0" + cv["id"].encode("utf-8") + b"\0" + cv["cv_text"].encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class Checkpoint:
+    """File JSONL lưu kết quả từng CV, dùng để tiếp tục lô đang dở"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """Kết quả thành công đã có theo id CV"""
+        done: Dict[str, Dict[str, Any]] = {}
+        if not self.path or not os.path.exists(self.path):
+            return done
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Dòng cuối bị ghi dở khi tiến trình dừng đột ngột
+                    continue
+                if record.get("status") == "ok":
+                    done[record["id"]] = record
+        return done
+
+    def append(self, record: Dict[str, Any]) -> None:
+        """Ghi thêm một kết quả"""
+        if not self.path:
+            return
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def _record(cv: Dict[str, str], start: float, evaluation: Optional[str] = None, error: Optional[Exception] = None) -> Dict[str, Any]:
+    record = {"id": cv["id"], "latency": round(time.perf_counter() - start, 3)}
+    if error is None:
+        record.update(status="ok", evaluation=evaluation)
+    else:
+        record.update(status="error", error=str(error))
+    return record
+
+
+def iter_evaluate(
+    cvs: Sequence[Dict[str, str]],
+    job_description: str,
+    checkpoint: Checkpoint,
+    concurrency: int = CONCURRENCY,
+) -> Iterator[Dict[str, Any]]:
+    """Đánh giá các CV bằng thread pool, trả về từng kết quả ngay khi xong (kết quả cũ trước)"""
+    done = checkpoint.load()
+    for cv in cvs:
+        if cv["id"] in done:
+            yield dict(done[cv["id"]], resumed=True)
+    pending = [cv for cv in cvs if cv["id"] not in done]
+    if not pending:
+        return
+
+    cv_module = get_module(CVModule)
+
+    def evaluate(cv: Dict[str, str]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            # Nhường lượt gọi LLM cho các request từ giao diện
+            with priority(BATCH):
+                record = _record(cv, start, evaluation=cv_module.evaluate_cv(cv["cv_text"], job_description))
+        except Exception as e:
+            record = _record(cv, start, error=e)
+        # Ghi ngay cả khi không còn ai đọc kết quả, để lần chạy lại không phải gọi lại
+        checkpoint.append(record)
+        return record
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = [pool.submit(evaluate, cv) for cv in pending]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # Client ngắt kết nối: bỏ các CV chưa chạy, CV đang chạy vẫn được ghi lại
+            for future in futures:
+                future.cancel()
+
+
+async def aiter_evaluate(
+    cvs: Sequence[Dict[str, str]],
+    job_description: str,
+    checkpoint: Checkpoint,
+    concurrency: int = CONCURRENCY,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Đánh giá các CV bất đồng bộ, trả về từng kết quả ngay khi xong (kết quả cũ trước)"""
+    done = checkpoint.load()
+    for cv in cvs:
+        if cv["id"] in done:
+            yield dict(done[cv["id"]], resumed=True)
+    pending = [cv for cv in cvs if cv["id"] not in done]
+    if not pending:
+        return
+
+    cv_module = get_module(CVModule)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def evaluate(cv: Dict[str, str]) -> Dict[str, Any]:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                with priority(BATCH):
+                    record = _record(cv, start, evaluation=await cv_module.aevaluate_cv(cv["cv_text"], job_description))
+            except Exception as e:
+                record = _record(cv, start, error=e)
+            checkpoint.append(record)
+            return record
+
+    tasks = [asyncio.ensure_future(evaluate(cv)) for cv in pending]
+    try:
+        for future in asyncio.as_completed(tasks):
+            yield await future
+    finally:
+        # Client ngắt kết nối: dừng các CV còn lại
+        for task in tasks:
+            task.cancel()
+
+
+def summarize(records: Sequence[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    """Thống kê một lần chạy: số CV, lỗi, thông lượng và độ trễ"""
+    evaluated = [r for r in records if not r.get("resumed")]
+    latencies = sorted(r["latency"] for r in evaluated)
+    return {
+        "total": len(records),
+        "evaluated": len(evaluated),
+        "resumed": len(records) - len(evaluated),
+        "failed": sum(r["status"] != "ok" for r in records),
+        "elapsed_s": round(elapsed, 2),
+        "throughput_per_min": round(len(evaluated) / elapsed * 60, 1) if elapsed > 0 else 0.0,
+        "latency_p50_s": latencies[len(latencies) // 2] if latencies else 0.0,
+        "latency_p95_s": latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+    }
+
+
+async def _run(cvs: List[Dict[str, str]], job_description: str, output: str, concurrency: int) -> Dict[str, Any]:
+    """Chạy lô từ CLI, in tiến độ"""
+    records = []
+    start = time.perf_counter()
+    async for record in aiter_evaluate(cvs, job_description, Checkpoint(output), concurrency):
+        records.append(record)
+        if record["status"] != "ok":
+            print(f"Lỗi khi đánh giá {record['id']}: {record['error']}", file=sys.stderr)
+        if len(records) % 10 == 0 or len(records) == len(cvs):
+            rate = sum(not r.get("resumed") for r in records) / max(time.perf_counter() - start, 1e-9) * 60
+            print(f"{len(records)}/{len(cvs)} CV ({rate:.0f} CV/phút)")
+    return summarize(records, time.perf_counter() - start)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m agent.batch_eval", description="Đánh giá hàng loạt CV theo một JD")
+    parser.add_argument("cvs", help="Thư mục CV (.txt/.md) hoặc file JSONL")
+    jd = parser.add_mutually_exclusive_group()
+    jd.add_argument("--jd", default="", help="Mô tả công việc")
+    jd.add_argument("--jd-file", help="File chứa mô tả công việc")
+    parser.add_argument("--output", default="batch_eval.jsonl", help="File JSONL kết quả (chạy lại để tiếp tục)")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    args = parser.parse_args(argv)
+
+    job_description = args.jd
+    if args.jd_file:
+        with open(args.jd_file, encoding="utf-8") as f:
+            job_description = f.read()
+
+    cvs = load_cvs(args.cvs)
+    report = asyncio.run(_run(cvs, job_description, args.output, args.concurrency))
+    print(f"Tổng số CV:     {report['total']} (đánh giá mới {report['evaluated']}, đã có {report['resumed']}, lỗi {report['failed']})")
+    print(f"Thời gian:      {report['elapsed_s']}s")
+    print(f"Thông lượng:    {report['throughput_per_min']} CV/phút")
+    print(f"Độ trễ p50/p95: {report['latency_p50_s']}s / {report['latency_p95_s']}s")
+    print(f"Kết quả:        {args.output}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,424 @@
+"""Dữ liệu công ty cục bộ và số liệu thống kê cho trang thống kê công ty.
+
+Bộ dữ liệu công ty (CSV hoặc Parquet, `COMPANY_DATA`) được nạp bằng pandas một lần
+mỗi process và chuẩn hóa thành các cột mã category: ngành, địa điểm (so khớp như
+`agent.job_index`, "TP.HCM" và "Hồ Chí Minh" là một), nhóm quy mô và bảng kỹ năng
+(mỗi dòng một cặp công ty - kỹ năng). Thống kê của toàn bộ dữ liệu được tính sẵn
+khi nạp; thống kê theo bộ lọc (ngành, địa điểm, kỹ năng) chỉ là phép lọc trên mã
+category và `np.bincount`, được nhớ theo bộ lọc (`COMPANY_STATS_CACHE_SIZE`), nên
+số liệu cho biểu đồ có trong vài mili giây mà không gọi LLM. LLM chỉ viết đoạn
+nhận xét ngắn từ các số liệu này (`describe`).
+
+Bảng đã chuẩn hóa và thống kê tính sẵn được ghi vào `CACHE_DIR/company_data/`
+(theo đường dẫn, kích thước và thời điểm sửa file dữ liệu): worker khởi động lại
+không phải đọc và chuẩn hóa lại CSV; sửa file dữ liệu thì được nạp lại ở request sau.
+
+Cột của file (các tên thường gặp khác cũng được nhận, xem `FIELD_ALIASES`): name,
+industry, location, size (số nhân viên hoặc khoảng "100-499"), skills (phân tách
+bằng dấu phẩy hoặc chấm phẩy), open_positions (không bắt buộc).
+
+    python -m agent.company_data build                  # đọc dữ liệu và ghi cache
+    python -m agent.company_data stats --industry "công nghệ" --skills "Python, AWS"
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from agent.job_index import normalize_location
+from agent.llm_cache import CACHE_DIR
+from agent.utils import fold_accents
+
+DATA_PATH = os.getenv("COMPANY_DATA", os.path.join("data", "companies.csv"))
+CACHE_PATH = os.path.join(CACHE_DIR, "company_data")
+STATS_CACHE_SIZE = int(os.getenv("COMPANY_STATS_CACHE_SIZE", "256"))
+TOP_N = int(os.getenv("COMPANY_STATS_TOP_N", "10"))
+
+# Đổi khi thay cách chuẩn hóa để bỏ cache cũ
+CACHE_VERSION = 3
+
+# Tên cột thường gặp -> tên trường chuẩn
+FIELD_ALIASES = {
+    "name": ("name", "company", "company_name", "cong_ty", "ten_cong_ty"),
+    "industry": ("industry", "sector", "nganh", "linh_vuc"),
+    "location": ("location", "city", "address", "dia_diem"),
+    "size": ("size", "employees", "company_size", "quy_mo"),
+    "skills": ("skills", "tags", "tech_stack", "ky_nang"),
+    "open_positions": ("open_positions", "jobs", "vacancies", "so_vi_tri"),
+}
+# Trường số: ô dạng số được dùng trực tiếp
+NUMERIC_FIELDS = ("size", "open_positions")
+
+# Nhóm quy mô: (số nhân viên tối đa, nhãn)
+SIZE_BANDS: List[Tuple[float, str]] = [
+    (50, "1-50"), (200, "51-200"), (1000, "201-1000"), (5000, "1001-5000"), (float("inf"), "Trên 5000"),
+]
+UNKNOWN = "Không rõ"
+
+# Tên viết tắt của ngành (đã bỏ dấu) -> tên đầy đủ
+INDUSTRY_ALIASES = {
+    "it": "cong nghe thong tin", "cntt": "cong nghe thong tin", "ict": "cong nghe thong tin",
+}
+
+
+def parse_size(text: Any) -> float:
+    """Số nhân viên từ ô dữ liệu (số hoặc văn bản tự do "120", "1.000+"), NaN nếu không rõ
+
+    Khoảng ("100-499") lấy cận dưới để công ty rơi vào đúng nhóm quy mô mà khoảng đó
+    bắt đầu, thay vì trung bình (299,5) lệch sang nhóm lớn hơn. Dấu "." và "," chỉ là
+    phân cách hàng nghìn khi đứng trước đúng ba chữ số ("1200.0" là 1200).
+    """
+    if isinstance(text, (int, float)) and not isinstance(text, bool):
+        return float(text)
+    numbers = [float(n) for n in re.findall(r"\d+", re.sub(r"[.,](?=\d{3}\b)", "", str(text)))]
+    if not numbers:
+        return float("nan")
+    return numbers[0]
+
+
+def size_band(size: float) -> int:
+    """Chỉ số nhóm quy mô trong `SIZE_BANDS`, len(SIZE_BANDS) nếu không rõ"""
+    if size != size:
+        return len(SIZE_BANDS)
+    return next(i for i, (limit, _) in enumerate(SIZE_BANDS) if size <= limit)
+
+
+def skill_key(text: str) -> str:
+    return " ".join(fold_accents(text).split())
+
+
+def industry_key(text: str) -> str:
+    key = " ".join(re.sub(r"[^\w]+", " ", fold_accents(text)).split())
+    return INDUSTRY_ALIASES.get(key, key)
+
+
+def _word_match(words: List[str], query: str) -> bool:
+    """Mọi từ của `query` là đầu của một từ trong `words`; từ ngắn (1-2 ký tự) phải trùng hẳn"""
+    return all(any(w == t or (len(t) > 2 and w.startswith(t)) for w in words) for t in query.split())
+
+
+def split_skills(text: Any) -> List[str]:
+    return [s.strip() for s in re.split(r"[,;|\n]", str(text or "")) if s.strip()]
+
+
+def _categorize(values: Sequence[str], key) -> Tuple[np.ndarray, List[str], List[str]]:
+    """Mã category của từng giá trị theo `key`; nhãn là cách viết phổ biến nhất của mỗi khóa"""
+    counts: Dict[str, int] = {}
+    for value in values:
+        counts[value] = counts.get(value, 0) + 1
+    key_of = {value: key(value) if value else "" for value in counts}
+    code_of: Dict[str, int] = {}
+    labels: List[str] = []
+    for value, _ in sorted(counts.items(), key=lambda item: -item[1]):
+        k = key_of[value]
+        if k not in code_of:
+            code_of[k] = len(labels)
+            labels.append(value or UNKNOWN)
+    codes = np.fromiter((code_of[key_of[value]] for value in values), dtype=np.int32, count=len(values))
+    return codes, labels, list(code_of)
+
+
+def _counts(codes: np.ndarray, labels: List[str], top: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Số công ty theo từng category, nhiều nhất trước"""
+    counts = np.bincount(codes, minlength=len(labels))
+    order = np.argsort(-counts, kind="stable")
+    return [{"label": labels[i], "count": int(counts[i])} for i in order[:top] if counts[i]]
+
+
+class CompanyData:
+    """Bảng công ty đã chuẩn hóa (mã category) và thống kê theo bộ lọc"""
+
+    def __init__(self, state: Dict[str, Any], signature: str = ""):
+        self.signature = signature
+        self.companies = state["companies"]
+        self.names: List[str] = state["names"]
+        self.size: np.ndarray = state["size"]
+        self.size_code: np.ndarray = state["size_code"]
+        self.open_positions: np.ndarray = state["open_positions"]
+        self.industry_code, self.industry_labels, self.industry_keys = state["industry"]
+        self.location_code, self.location_labels, self.location_keys = state["location"]
+        self.skill_labels: List[str] = state["skill_labels"]
+        self.skill_keys: List[str] = state["skill_keys"]
+        self.skill_company: np.ndarray = state["skill_company"]
+        self.skill_code: np.ndarray = state["skill_code"]
+        self.base: Dict[str, Any] = state.get("base") or self._stats(np.ones(len(self.names), dtype=bool))
+        self._memo: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @classmethod
+    def from_frame(cls, frame: Any, signature: str = "") -> "CompanyData":
+        """Chuẩn hóa DataFrame đọc từ file dữ liệu"""
+        columns = {name: _column(frame, name, numeric=name in NUMERIC_FIELDS) for name in FIELD_ALIASES}
+        keep = [i for i, name in enumerate(columns["name"]) if name]
+        columns = {name: [values[i] for i in keep] for name, values in columns.items()}
+
+        size = np.array([parse_size(value) for value in columns["size"]], dtype=np.float64)
+        skill_company: List[int] = []
+        skill_values: List[str] = []
+        skills_text: List[str] = []
+        for i, text in enumerate(columns["skills"]):
+            skills = list(dict.fromkeys(split_skills(text)))
+            skill_company.extend([i] * len(skills))
+            skill_values.extend(skills)
+            skills_text.append(", ".join(skills))
+        skill_code, skill_labels, skill_keys = _categorize(skill_values, skill_key)
+
+        state = {
+            "companies": {"industry": columns["industry"], "location": columns["location"], "skills": skills_text},
+            "names": columns["name"],
+            "size": size,
+            "size_code": np.array([size_band(value) for value in size], dtype=np.int32),
+            "open_positions": np.array([parse_size(value) for value in columns["open_positions"]], dtype=np.float64),
+            "industry": _categorize(columns["industry"], industry_key),
+            "location": _categorize(columns["location"], normalize_location),
+            "skill_labels": skill_labels,
+            "skill_keys": skill_keys,
+            "skill_company": np.array(skill_company, dtype=np.int32),
+            "skill_code": skill_code,
+        }
+        return cls(state, signature)
+
+    def state(self) -> Dict[str, Any]:
+        """Dữ liệu cần ghi cache (gồm thống kê tính sẵn)"""
+        return {
+            "version": CACHE_VERSION,
+            "companies": self.companies,
+            "names": self.names,
+            "size": self.size,
+            "size_code": self.size_code,
+            "open_positions": self.open_positions,
+            "industry": (self.industry_code, self.industry_labels, self.industry_keys),
+            "location": (self.location_code, self.location_labels, self.location_keys),
+            "skill_labels": self.skill_labels,
+            "skill_keys": self.skill_keys,
+            "skill_company": self.skill_company,
+            "skill_code": self.skill_code,
+            "base": self.base,
+        }
+
+    def _match(self, keys: List[str], queries: List[str]) -> np.ndarray:
+        """Category có khóa khớp theo từ với một trong các truy vấn ("ngan hang" khớp "tai chinh ngan hang", "an" thì không)"""
+        return np.array([any(_word_match(k.split(), q) for q in queries) for k in keys], dtype=bool)
+
+    def stats(self, industry: str = "", location: str = "", skills: str = "") -> Dict[str, Any]:
+        """Thống kê các công ty khớp bộ lọc (trống: toàn bộ dữ liệu, đã tính sẵn)"""
+        industries = [industry_key(q) for q in split_skills(industry) if industry_key(q)]
+        locations = [normalize_location(q) for q in split_skills(location) if normalize_location(q)]
+        wanted = tuple(sorted({skill_key(q) for q in split_skills(skills)} - {""}))
+        key = (tuple(industries), tuple(locations), wanted)
+        if key == ((), (), ()):
+            return self.base
+        with self._lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                return self._memo[key]
+
+        mask = np.ones(len(self.names), dtype=bool)
+        if industries:
+            mask &= self._match(self.industry_keys, industries)[self.industry_code]
+        if locations:
+            mask &= self._match(self.location_keys, locations)[self.location_code]
+        matched = None
+        if wanted:
+            codes = np.array([i for i, k in enumerate(self.skill_keys) if k in wanted], dtype=np.int32)
+            rows = np.isin(self.skill_code, codes)
+            matched = np.bincount(self.skill_company[rows], minlength=len(self.names))
+            mask &= matched > 0
+        result = self._stats(mask, matched)
+
+        with self._lock:
+            self._memo[key] = result
+            while len(self._memo) > STATS_CACHE_SIZE:
+                self._memo.popitem(last=False)
+        return result
+
+    def _stats(self, mask: np.ndarray, matched: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        rows = np.flatnonzero(mask)
+        skill_rows = mask[self.skill_company]
+        open_positions = self.open_positions[rows]
+        sizes = self.size[rows]
+        size_labels = [label for _, label in SIZE_BANDS] + [UNKNOWN]
+        size_counts = np.bincount(self.size_code[rows], minlength=len(size_labels))
+
+        # Công ty tiêu biểu: khớp nhiều kỹ năng nhất, rồi nhiều vị trí đang tuyển, rồi quy mô lớn
+        keys = [-np.nan_to_num(self.size[rows]), -np.nan_to_num(open_positions)]
+        if matched is not None:
+            keys.append(-matched[rows])
+        top = rows[np.lexsort(keys)[:TOP_N]]
+
+        return {
+            "total": int(len(rows)),
+            "dataset_total": len(self.names),
+            "open_positions": int(np.nansum(open_positions)),
+            "median_size": None if np.isnan(sizes).all() else int(np.nanmedian(sizes)),
+            "by_industry": _counts(self.industry_code[rows], self.industry_labels, TOP_N),
+            "by_location": _counts(self.location_code[rows], self.location_labels, TOP_N),
+            "by_size": [
+                {"label": label, "count": int(count)}
+                for label, count in zip(size_labels, size_counts)
+                if label != UNKNOWN or count
+            ],
+            "by_skill": _counts(self.skill_code[skill_rows], self.skill_labels, TOP_N + 5),
+            "top_companies": [self._company(i, matched) for i in top],
+        }
+
+    def _company(self, i: int, matched: Optional[np.ndarray]) -> Dict[str, Any]:
+        size, open_positions = self.size[i], self.open_positions[i]
+        company = {
+            "name": self.names[i],
+            "industry": self.companies["industry"][i] or UNKNOWN,
+            "location": self.companies["location"][i] or UNKNOWN,
+            "size": None if np.isnan(size) else int(size),
+            "open_positions": None if np.isnan(open_positions) else int(open_positions),
+            "skills": self.companies["skills"][i],
+        }
+        if matched is not None:
+            company["matched_skills"] = int(matched[i])
+        return company
+
+
+def _column(frame: Any, name: str, numeric: bool = False) -> List[Any]:
+    """Giá trị dạng chuỗi của trường chuẩn `name` theo các tên cột thường gặp
+
+    Với `numeric`, ô đã là số (cột số của Parquet) được giữ nguyên để không phải đọc lại từ chuỗi.
+    """
+    for alias in FIELD_ALIASES[name]:
+        if alias in frame.columns:
+            return [
+                "" if value != value or value is None
+                else value if numeric and isinstance(value, (int, float)) and not isinstance(value, bool)
+                else str(value).strip()
+                for value in frame[alias].tolist()
+            ]
+    return [""] * len(frame)
+
+
+def read_frame(path: str) -> Any:
+    """Đọc file dữ liệu công ty thành DataFrame (Parquet cần pyarrow hoặc fastparquet)"""
+    import pandas as pd
+
+    if path.lower().endswith((".parquet", ".pq")):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, dtype=str, keep_default_na=False, encoding="utf-8-sig")
+
+
+def signature(path: str) -> str:
+    """Khóa cache của file dữ liệu: đường dẫn, kích thước và thời điểm sửa"""
+    stat = os.stat(path)
+    raw = f"{CACHE_VERSION}|{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def load(path: str = DATA_PATH, cache_dir: Optional[str] = CACHE_PATH) -> CompanyData:
+    """Nạp dữ liệu công ty, dùng cache đã chuẩn hóa nếu file dữ liệu không đổi"""
+    import pandas as pd
+
+    key = signature(path)
+    cache_file = os.path.join(cache_dir, f"{key}.pkl") if cache_dir else ""
+    if cache_file and os.path.exists(cache_file):
+        try:
+            state = pd.read_pickle(cache_file)
+            if state.get("version") == CACHE_VERSION:
+                return CompanyData(state, key)
+        except Exception as e:
+            print(f"Không đọc được cache dữ liệu công ty {cache_file}: {e}")
+
+    data = CompanyData.from_frame(read_frame(path), key)
+    if cache_file:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = f"{cache_file}.{os.getpid()}.tmp"
+            pd.to_pickle(data.state(), tmp)
+            os.replace(tmp, cache_file)
+        except OSError as e:
+            print(f"Không ghi được cache dữ liệu công ty: {e}")
+    return data
+
+
+def describe(stats: Dict[str, Any]) -> str:
+    """Số liệu thống kê dạng văn bản ngắn để đưa vào prompt nhận xét"""
+    def joined(items: List[Dict[str, Any]], limit: int = 5) -> str:
+        return ", ".join(f"{item['label']} ({item['count']})" for item in items[:limit]) or UNKNOWN
+
+    lines = [
+        f"Số công ty phù hợp: {stats['total']}/{stats['dataset_total']}, tổng số vị trí đang tuyển: {stats['open_positions']}",
+        f"Quy mô trung vị: {stats['median_size'] or UNKNOWN} nhân viên",
+        f"Ngành: {joined(stats['by_industry'])}",
+        f"Địa điểm: {joined(stats['by_location'])}",
+        f"Quy mô: {joined(stats['by_size'], len(SIZE_BANDS) + 1)}",
+        f"Kỹ năng phổ biến: {joined(stats['by_skill'], 8)}",
+        "Công ty tiêu biểu: " + ("; ".join(
+            f"{c['name']} ({c['industry']}, {c['location']}, {c['size'] or '?'} nhân viên, {c['open_positions'] or 0} vị trí)"
+            for c in stats["top_companies"][:5]
+        ) or UNKNOWN),
+    ]
+    return "\n".join(lines)
+
+
+_data: Optional[CompanyData] = None
+_lock = threading.Lock()
+
+
+def get_company_data() -> Optional[CompanyData]:
+    """Dữ liệu dùng chung của process, None nếu chưa có file `COMPANY_DATA`; nạp lại khi file đổi"""
+    global _data
+    try:
+        key = signature(DATA_PATH)
+    except OSError:
+        return None
+    if _data is None or _data.signature != key:
+        with _lock:
+            if _data is None or _data.signature != key:
+                _data = load(DATA_PATH)
+    return _data
+
+
+def _reset() -> None:
+    """Tiến trình con không kế thừa khóa đang bị giữ"""
+    global _lock
+    _lock = threading.Lock()
+    if _data is not None:
+        _data._lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m agent.company_data", description="Dữ liệu và thống kê công ty")
+    parser.add_argument("--file", default=DATA_PATH, help="File dữ liệu CSV/Parquet (mặc định COMPANY_DATA)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("build", help="Đọc dữ liệu, chuẩn hóa và ghi cache")
+    stats = commands.add_parser("stats", help="In thống kê theo bộ lọc")
+    stats.add_argument("--industry", default="")
+    stats.add_argument("--location", default="")
+    stats.add_argument("--skills", default="")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    data = load(args.file)
+    loaded = time.perf_counter() - start
+    if args.command == "build":
+        print(f"Đã nạp {len(data)} công ty, {len(data.skill_labels)} kỹ năng trong {loaded:.2f}s")
+        return
+    start = time.perf_counter()
+    result = data.stats(args.industry, args.location, args.skills)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    print(f"{len(data)} công ty, nạp {loaded:.2f}s, thống kê {elapsed:.1f} ms")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,71 @@
+"""Tạo CV theo từng mục để khi sửa một trường chỉ sinh lại các mục liên quan.
+
+Mỗi mục chỉ phụ thuộc vào một số trường của form (`SECTIONS`). Thông tin cá nhân
+được ghép cục bộ, không gọi LLM; mục có mọi trường phụ thuộc để trống thì bị bỏ qua.
+Các mục còn lại được sinh đồng thời, mỗi mục một lời gọi `create_cv_section` với
+prompt chỉ chứa các trường nó phụ thuộc, nên khóa cache (`agent.llm_cache`, hash của
+prompt) chính là hash của các trường đó: đổi số điện thoại không gọi LLM lần nào,
+đổi kỹ năng chỉ sinh lại mục tiêu nghề nghiệp và kỹ năng.
+
+`CREATE_CV_MODE=full` để quay về cách cũ (một lời gọi sinh cả CV).
+"""
+import os
+from typing import Dict, List, Optional, Tuple
+
+MODE = os.getenv("CREATE_CV_MODE", "sections")
+
+# (tên mục, tiêu đề, các trường phụ thuộc); prompt của mục là `create_cv.<tên>`
+SECTIONS: List[Tuple[str, str, Tuple[str, ...]]] = [
+    ("personal", "THÔNG TIN CÁ NHÂN", ("name", "email", "phone")),
+    ("objective", "MỤC TIÊU NGHỀ NGHIỆP", ("experience", "skills")),
+    ("education", "HỌC VẤN", ("education",)),
+    ("experience", "KINH NGHIỆM LÀM VIỆC", ("experience",)),
+    ("skills", "KỸ NĂNG", ("skills",)),
+    ("achievements", "THÀNH TÍCH", ("education", "experience")),
+]
+
+# Mục được ghép cục bộ
+LOCAL = {"personal"}
+
+
+class Part:
+    """Một mục của CV: nội dung đã có (`text`) hoặc prompt cần gọi LLM (`prompt`, `values`)"""
+
+    __slots__ = ("name", "title", "text", "prompt", "values")
+
+    def __init__(self, name: str, title: str, text: Optional[str] = None,
+                 prompt: Optional[str] = None, values: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.title = title
+        self.text = text
+        self.prompt = prompt
+        self.values = values or {}
+
+
+def render_personal(name: str, email: str, phone: str) -> str:
+    """Thông tin cá nhân, chỉ gồm các trường có giá trị"""
+    lines = [("Họ và tên", name), ("Email", email), ("Số điện thoại", phone)]
+    return "\n".join(f"{label}: {value.strip()}" for label, value in lines if value and value.strip())
+
+
+def plan(name: str, email: str, phone: str, education: str, experience: str, skills: str) -> List[Part]:
+    """Các mục của CV theo thứ tự hiển thị, bỏ qua mục không có dữ liệu"""
+    fields = {
+        "name": name or "", "email": email or "", "phone": phone or "",
+        "education": education or "", "experience": experience or "", "skills": skills or "",
+    }
+    parts = []
+    for section, title, depends in SECTIONS:
+        values = {field: fields[field].strip() for field in depends}
+        if not any(values.values()):
+            continue
+        if section in LOCAL:
+            parts.append(Part(section, title, text=render_personal(**values)))
+        else:
+            parts.append(Part(section, title, prompt=f"create_cv.{section}", values=values))
+    return parts
+
+
+def render_part(title: str, text: str) -> str:
+    """Một mục đã có nội dung: tiêu đề và nội dung, cách mục sau một dòng trống"""
+    return f"{title}\n{text.strip()}\n\n"
@@ -0,0 +1,301 @@
+"""Tách CV dài thành các mục để đánh giá song song (map-reduce) trong `CVModule`.
+
+CV ngắn vẫn được đánh giá bằng một prompt như cũ. Khi CV dài hơn `CV_LONG_TOKENS`
+(ước lượng ~3 ký tự/token như `agent.rate_limiter`):
+
+1. Tách thành các mục (kinh nghiệm, học vấn, kỹ năng, ...) theo tiêu đề tiếng Việt
+   và tiếng Anh, không gọi LLM.
+2. Bỏ phần rập khuôn (số trang, lời cam đoan, "references available upon request",
+   đường kẻ), dòng trùng lặp và header/footer lặp lại ở mỗi trang.
+3. Nếu phần còn lại không quá `CV_MAP_TOKENS`, vẫn đánh giá bằng một prompt (thêm
+   một bước tổng hợp tốn thời gian sinh văn bản hơn phần prompt tiết kiệm được),
+   giữ trong ngân sách `CV_MAX_TOKENS` của prompt đó. Nếu dài hơn, gom các mục
+   thành các phần không quá `CV_PART_TOKENS` (mục dài được chia theo đoạn) để nhận
+   xét đồng thời rồi tổng hợp thành đánh giá cuối cùng. Thời gian tăng theo số đợt
+   (số phần chia cho `CV_SECTION_CONCURRENCY`) chứ không theo số token của CV.
+   Chỉ CV vượt `CV_MAP_MAX_TOKENS` mới bị rút gọn: bỏ các mục ít quan trọng (sở
+   thích, hoạt động, ...) rồi cắt bớt phần cuối của các mục dài.
+
+    python -m agent.cv_sections cv.txt   # xem các mục, phần và số token
+"""
+import os
+import re
+import sys
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+LONG_MODE = os.getenv("CV_LONG_MODE", "1") == "1"
+LONG_TOKENS = int(os.getenv("CV_LONG_TOKENS", "3000"))
+MAP_TOKENS = int(os.getenv("CV_MAP_TOKENS", "10000"))
+PART_TOKENS = int(os.getenv("CV_PART_TOKENS", "2000"))
+# Ngân sách khi đánh giá bằng một prompt
+MAX_TOKENS = int(os.getenv("CV_MAX_TOKENS", "12000"))
+# Ngân sách khi đánh giá theo từng phần (giới hạn số lời gọi), 0 là không giới hạn
+MAP_MAX_TOKENS = int(os.getenv("CV_MAP_MAX_TOKENS", "60000"))
+CONCURRENCY = int(os.getenv("CV_SECTION_CONCURRENCY", "8"))
+
+# Tên mục -> (tiêu đề hiển thị, các tiêu đề thường gặp)
+SECTIONS: Dict[str, Tuple[str, List[str]]] = {
+    "contact": ("Thông tin cá nhân", [
+        "thông tin cá nhân", "thông tin liên hệ", "liên hệ", "personal information", "personal details",
+        "contact", "contact information",
+    ]),
+    "summary": ("Mục tiêu nghề nghiệp", [
+        "mục tiêu nghề nghiệp", "mục tiêu", "giới thiệu", "giới thiệu bản thân", "tóm tắt", "tóm tắt bản thân",
+        "objective", "career objective", "summary", "professional summary", "profile", "about me",
+    ]),
+    "experience": ("Kinh nghiệm làm việc", [
+        "kinh nghiệm làm việc", "kinh nghiệm", "quá trình công tác", "quá trình làm việc", "lịch sử làm việc",
+        "experience", "work experience", "professional experience", "employment history", "work history",
+    ]),
+    "projects": ("Dự án", [
+        "dự án", "dự án tiêu biểu", "các dự án", "dự án đã tham gia", "projects", "personal projects", "key projects",
+    ]),
+    "education": ("Học vấn", [
+        "học vấn", "trình độ học vấn", "quá trình học tập", "đào tạo", "education", "academic background",
+    ]),
+    "skills": ("Kỹ năng", [
+        "kỹ năng", "kĩ năng", "kỹ năng chuyên môn", "kỹ năng mềm", "kỹ năng kỹ thuật",
+        "skills", "technical skills", "core competencies",
+    ]),
+    "certifications": ("Chứng chỉ", ["chứng chỉ", "bằng cấp", "certifications", "certificates", "licenses"]),
+    "awards": ("Giải thưởng", ["giải thưởng", "thành tích", "awards", "achievements", "honors"]),
+    "languages": ("Ngoại ngữ", ["ngoại ngữ", "ngôn ngữ", "languages"]),
+    "activities": ("Hoạt động", [
+        "hoạt động", "hoạt động ngoại khóa", "hoạt động xã hội", "activities", "volunteer", "volunteering",
+        "extracurricular activities",
+    ]),
+    "interests": ("Sở thích", ["sở thích", "interests", "hobbies"]),
+    "references": ("Người tham chiếu", ["người tham chiếu", "người giới thiệu", "tham chiếu", "references", "referees"]),
+}
+
+# Mục được bỏ trước khi vượt ngân sách token (ít quan trọng nhất trước)
+DROP_ORDER = ["references", "interests", "activities", "awards", "languages", "certifications"]
+
+BOILERPLATE = [
+    re.compile(r"^(trang|page)\s*\d+(\s*(/|of|trên)\s*\d+)?$"),
+    re.compile(r"^(curriculum vitae|cv|resume|sơ yếu lý lịch)$"),
+    re.compile(r"tôi xin cam (đoan|kết)"),
+    re.compile(r"(available|cung cấp).*(upon request|on request|khi (được )?yêu cầu)"),
+    re.compile(r"^[\W_]+$"),
+]
+
+_ALIASES = {alias: name for name, (_, aliases) in SECTIONS.items() for alias in aliases}
+_BULLET = re.compile(r"^(?:[#*•\-–—▪●○■□]+|\d{1,2}[.)]|[ivx]{1,4}[.)])\s*")
+
+
+class Section:
+    """Một mục của CV"""
+
+    __slots__ = ("name", "title", "lines")
+
+    def __init__(self, name: str, title: str, lines: Optional[List[str]] = None):
+        self.name = name
+        self.title = title
+        self.lines = lines if lines is not None else []
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.lines).strip()
+
+    @property
+    def tokens(self) -> int:
+        return count_tokens(self.text)
+
+
+def count_tokens(text: str) -> int:
+    """Số token ước lượng (~3 ký tự/token với tiếng Việt)"""
+    return len(text) // 3
+
+
+def is_long(cv_text: str) -> bool:
+    """CV đủ dài để đánh giá theo từng phần"""
+    return LONG_MODE and count_tokens(cv_text) > LONG_TOKENS
+
+
+def _normalize(line: str) -> str:
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", line).casefold()).strip()
+
+
+def _heading(line: str) -> Optional[Tuple[str, str]]:
+    """(tên mục, nội dung sau dấu ':') nếu dòng là tiêu đề mục"""
+    text = _BULLET.sub("", _normalize(line))
+    head, colon, rest = text.partition(":")
+    head = head.strip(" .")
+    if len(head) > 50:
+        return None
+    if head in _ALIASES:
+        # "Kỹ năng: Python, SQL" vừa là tiêu đề vừa có nội dung
+        return _ALIASES[head], line.split(":", 1)[1].strip() if colon else ""
+    if colon:
+        return None
+    # "Kinh nghiệm làm việc (5 năm)", "Skills & Tools"
+    for alias in sorted(_ALIASES, key=len, reverse=True):
+        if head.startswith(alias + " ") and len(head.split()) - len(alias.split()) <= 3:
+            return _ALIASES[alias], ""
+    return None
+
+
+def parse_sections(cv_text: str) -> List[Section]:
+    """Tách CV theo tiêu đề; phần trước tiêu đề đầu tiên là thông tin cá nhân"""
+    sections = [Section("contact", SECTIONS["contact"][0])]
+    for raw in cv_text.splitlines():
+        line = raw.rstrip()
+        heading = _heading(line) if line.strip() else None
+        if heading is None:
+            sections[-1].lines.append(line)
+            continue
+        name, rest = heading
+        sections.append(Section(name, SECTIONS[name][0], [rest] if rest else []))
+    return [section for section in sections if section.text]
+
+
+def clean_sections(sections: List[Section]) -> List[Section]:
+    """Bỏ dòng rập khuôn, dòng trùng lặp và header/footer lặp lại giữa các trang"""
+    counts: Dict[str, int] = {}
+    for section in sections:
+        for line in section.lines:
+            key = _normalize(line)
+            counts[key] = counts.get(key, 0) + 1
+    seen = set()
+    cleaned = []
+    for section in sections:
+        lines = []
+        for line in section.lines:
+            key = _normalize(line)
+            if not key:
+                # Giữ một dòng trống để phân đoạn
+                if lines and lines[-1]:
+                    lines.append("")
+                continue
+            if any(pattern.search(key) for pattern in BOILERPLATE):
+                continue
+            # Dòng ngắn (ngày tháng, tên công ty) chỉ coi là trùng khi lặp ở nhiều trang
+            if key in seen and (len(key) >= 25 or counts[key] >= 3):
+                continue
+            seen.add(key)
+            lines.append(line.strip())
+        section = Section(section.name, section.title, lines)
+        if section.text:
+            cleaned.append(section)
+    return cleaned
+
+
+def _truncate(section: Section, budget: int) -> Section:
+    """Giữ các dòng đầu của mục (thường là nội dung gần đây nhất) trong `budget` token"""
+    lines, used = [], 0
+    for line in section.lines:
+        used += count_tokens(line) + 1
+        if used > budget:
+            lines.append("[...]")
+            break
+        lines.append(line)
+    return Section(section.name, section.title, lines)
+
+
+def fit_budget(sections: List[Section], budget: int = MAX_TOKENS) -> List[Section]:
+    """Giữ tổng số token trong `budget`: bỏ mục ít quan trọng trước, sau đó cắt các mục dài"""
+    sections = list(sections)
+    total = sum(section.tokens for section in sections)
+    for name in DROP_ORDER:
+        if total <= budget:
+            return sections
+        dropped = [section for section in sections if section.name == name]
+        sections = [section for section in sections if section.name != name]
+        total -= sum(section.tokens for section in dropped)
+    if total <= budget:
+        return sections
+    # Chia đều phần ngân sách còn lại, mục ngắn được giữ nguyên
+    shares, remaining = {}, budget
+    by_size = sorted(range(len(sections)), key=lambda i: sections[i].tokens)
+    for rank, i in enumerate(by_size):
+        shares[i] = min(sections[i].tokens, remaining // (len(sections) - rank))
+        remaining -= shares[i]
+    return [section if section.tokens <= shares[i] else _truncate(section, shares[i]) for i, section in enumerate(sections)]
+
+
+def _blocks(section: Section, limit: int) -> List[str]:
+    """Chia mục thành các đoạn (theo dòng trống), đoạn quá dài được chia theo dòng"""
+    blocks, current = [], []
+    for line in section.lines + [""]:
+        if line:
+            current.append(line)
+        elif current:
+            blocks.append("\n".join(current))
+            current = []
+    result = []
+    for block in blocks:
+        if count_tokens(block) <= limit:
+            result.append(block)
+            continue
+        piece: List[str] = []
+        for line in block.splitlines():
+            if piece and count_tokens("\n".join(piece + [line])) > limit:
+                result.append("\n".join(piece))
+                piece = []
+            piece.append(line)
+        if piece:
+            result.append("\n".join(piece))
+    return result
+
+
+def split_parts(sections: List[Section], limit: int = PART_TOKENS) -> List[Tuple[str, str]]:
+    """Gom các mục liên tiếp thành các phần [(tiêu đề, nội dung)] không quá `limit` token"""
+    parts: List[Tuple[List[str], List[str]]] = []
+    titles: List[str] = []
+    chunks: List[str] = []
+    used = 0
+    for section in sections:
+        for block in _blocks(section, limit):
+            size = count_tokens(block)
+            if chunks and used + size > limit:
+                parts.append((titles, chunks))
+                titles, chunks, used = [], [], 0
+            if not titles or titles[-1] != section.title:
+                titles.append(section.title)
+                chunks.append(section.title.upper())
+            chunks.append(block)
+            used += size
+    if chunks:
+        parts.append((titles, chunks))
+    return [(", ".join(titles), "\n\n".join(chunks)) for titles, chunks in parts]
+
+
+def outline(sections: List[Section]) -> str:
+    """Cấu trúc của CV (thứ tự các mục và độ dài) để đánh giá phần trình bày"""
+    return "\n".join(f"- {section.title}: {len([line for line in section.lines if line])} dòng" for section in sections)
+
+
+def prepare(cv_text: str) -> Tuple[str, List[Tuple[str, str]]]:
+    """(cấu trúc CV, các phần cần đánh giá) của một CV dài; một phần nếu đủ ngắn sau khi làm sạch"""
+    parsed = parse_sections(cv_text)
+    sections = clean_sections(parsed)
+    if sum(section.tokens for section in sections) <= MAP_TOKENS:
+        # Một prompt: chỉ giữ trong ngân sách của prompt đó
+        return outline(parsed), split_parts(fit_budget(sections, MAX_TOKENS), MAP_TOKENS)
+    if MAP_MAX_TOKENS:
+        sections = fit_budget(sections, MAP_MAX_TOKENS)
+    return outline(parsed), split_parts(sections)
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        print("Cách dùng: python -m agent.cv_sections <file CV .txt>")
+        return 2
+    with open(argv[0], encoding="utf-8") as f:
+        cv_text = f.read()
+    parsed = parse_sections(cv_text)
+    cleaned = clean_sections(parsed)
+    print(f"CV: {count_tokens(cv_text)} token, {'dài' if is_long(cv_text) else 'ngắn'} (ngưỡng {LONG_TOKENS})")
+    print(outline(parsed))
+    total = sum(s.tokens for s in cleaned)
+    mode = "một prompt" if total <= MAP_TOKENS else "từng phần"
+    print(f"Sau khi làm sạch: {total} token, đánh giá {mode} (ngưỡng {MAP_TOKENS})")
+    for i, (title, text) in enumerate(prepare(cv_text)[1], 1):
+        print(f"Phần {i}: {title} ({count_tokens(text)} token)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
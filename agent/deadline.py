@@ -0,0 +1,84 @@
+"""Thời hạn (deadline) của request, truyền xuống từng lời gọi LLM.
+
+Mỗi request HTTP có một ngân sách thời gian (`REQUEST_TIMEOUT`, stream dùng
+`REQUEST_TIMEOUT_STREAM`); client có thể rút ngắn bằng header `X-Request-Timeout`
+(giây). Thời hạn được giữ trong contextvar nên các node của đồ thị và lời gọi LLM
+bên dưới đều thấy mà không cần truyền tham số. Mỗi lời gọi LLM còn bị giới hạn
+bởi timeout trong cấu hình model của nó (`agent.model_config`, tính từ lúc đến lượt
+gọi theo rate limiter), lấy giá trị nhỏ hơn.
+
+Hết thời hạn, lời gọi dừng chờ và ném `DeadlineExceeded` (API trả về 504) thay vì
+giữ worker vô thời hạn.
+"""
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "120"))
+STREAM_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT_STREAM", "300"))
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Hết thời gian cho phép của request hoặc của lời gọi LLM"""
+
+    def __init__(self, budget: Optional[float] = None):
+        message = "Hết thời gian xử lý yêu cầu"
+        if budget is not None:
+            message += f" ({budget:.1f}s)"
+        super().__init__(message)
+        self.budget = budget
+
+
+def request_budget(stream: bool = False, header: Optional[str] = None) -> float:
+    """Ngân sách của request; header X-Request-Timeout chỉ được rút ngắn, không kéo dài"""
+    budget = STREAM_TIMEOUT if stream else REQUEST_TIMEOUT
+    try:
+        requested = float(header) if header else None
+    except ValueError:
+        requested = None
+    if requested is not None and requested > 0:
+        budget = min(budget, requested)
+    return budget
+
+
+def start_deadline(seconds: Optional[float]) -> None:
+    """Đặt thời hạn cho request hiện tại (gọi ở đầu request, không cần khôi phục)
+
+    Thời hạn vẫn còn hiệu lực sau khi handler trả về để phần thân của response
+    stream cũng bị giới hạn.
+    """
+    _deadline.set(time.monotonic() + seconds if seconds and seconds > 0 else None)
+
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[None]:
+    """Thu hẹp thời hạn trong khối lệnh (không bao giờ nới rộng thời hạn đang có)"""
+    if not seconds or seconds <= 0:
+        yield
+        return
+    current = _deadline.get()
+    new = time.monotonic() + seconds
+    token = _deadline.set(new if current is None else min(current, new))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Số giây còn lại, None nếu không có thời hạn"""
+    current = _deadline.get()
+    if current is None:
+        return None
+    return current - time.monotonic()
+
+
+def check() -> None:
+    """Ném DeadlineExceeded nếu đã hết thời hạn"""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded()
@@ -0,0 +1,465 @@
+"""Hedge lời gọi LLM chậm và dừng lời gọi khi hết thời hạn của request.
+
+Một phần nhỏ lời gọi chậm gấp 5-10 lần trung vị và quyết định p99. Khi bật
+`LLM_HEDGE=1`, nếu lời gọi chưa có token đầu tiên (với stream) hoặc chưa xong
+(không stream) sau ngưỡng bằng p95 (`LLM_HEDGE_QUANTILE`) quan sát được của cùng
+model và lời gọi (thời gian đến token đầu tiên và thời gian hoàn tất được thống
+kê riêng), một bản sao được gửi đi và kết quả nào về trước được dùng; bản còn
+lại bị hủy (bất đồng bộ) hoặc bị bỏ qua (đồng bộ, thread tự dừng ở đoạn kế
+tiếp). Số bản sao không vượt `LLM_HEDGE_MAX_RATIO` số lời gọi để chi phí tăng
+không quá tỉ lệ này.
+
+Mọi lời gọi đều dừng chờ khi hết thời hạn (`agent.deadline`) và ném
+`DeadlineExceeded`. Lời gọi đồng bộ chỉ chạy trong thread riêng khi có thể hedge;
+nếu không, lời gọi chạy ngay trong thread hiện tại và dừng nhờ timeout HTTP đã
+được rút về thời gian còn lại (`agent.llm_client`), nên không có thread nào bị
+bỏ lại tiếp tục tốn token. Stream không hedge chỉ kiểm tra thời hạn giữa các
+đoạn; stream bị treo dừng theo timeout của HTTP client.
+"""
+import asyncio
+import contextvars
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from agent.deadline import DeadlineExceeded, remaining
+from agent.metrics import LLM_DEADLINE_EXCEEDED, LLM_HEDGE_WINS, LLM_HEDGES
+
+T = TypeVar("T")
+
+ENABLED = os.getenv("LLM_HEDGE", "0") == "1"
+QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "95"))
+# Số mẫu tối thiểu của một (model, lời gọi) trước khi hedge
+MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.3"))
+MAX_RATIO = float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.1"))
+WINDOW = int(os.getenv("LLM_HEDGE_WINDOW", "500"))
+# Số bản sao được phép gửi liên tiếp khi nhiều lời gọi cùng chậm
+BURST = 5.0
+# Tính lại ngưỡng sau mỗi chừng này mẫu mới
+RECOMPUTE_EVERY = 10
+
+
+# Loại mẫu độ trễ: thời gian đến token đầu tiên (stream) hoặc đến khi xong (không stream)
+TTFT = "ttft"
+FULL = "full"
+
+
+class LatencyTracker:
+    """Độ trễ gần đây theo (model, lời gọi, loại); hai loại có phân phối khác hẳn nhau nên không trộn mẫu"""
+
+    def __init__(self):
+        self._samples: Dict[Tuple[str, str, str], Deque[float]] = {}
+        self._seen: Dict[Tuple[str, str, str], int] = {}
+        self._thresholds: Dict[Tuple[str, str, str], Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, model: str, call: str, kind: str, seconds: float) -> None:
+        key = (model, call, kind)
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=WINDOW)
+            samples.append(seconds)
+            self._seen[key] = self._seen.get(key, 0) + 1
+
+    def threshold(self, model: str, call: str, kind: str) -> Optional[float]:
+        """Ngưỡng hedge (phân vị QUANTILE), None khi chưa đủ mẫu"""
+        key = (model, call, kind)
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None or len(samples) < MIN_SAMPLES:
+                return None
+            seen = self._seen[key]
+            cached = self._thresholds.get(key)
+            if cached is None or seen - cached[0] >= RECOMPUTE_EVERY:
+                ordered = sorted(samples)
+                cached = (seen, ordered[min(len(ordered) - 1, int(len(ordered) * QUANTILE / 100))])
+                self._thresholds[key] = cached
+        return max(MIN_DELAY, cached[1])
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            keys = list(self._samples)
+        return {f"{model}/{call}/{kind}": {"samples": len(self._samples[(model, call, kind)]), "threshold": self.threshold(model, call, kind)}
+                for model, call, kind in keys}
+
+
+class HedgeBudget:
+    """Mỗi lời gọi góp MAX_RATIO lượt, mỗi bản sao dùng một lượt"""
+
+    def __init__(self):
+        self._tokens = 1.0
+        self._lock = threading.Lock()
+
+    def add(self) -> None:
+        with self._lock:
+            self._tokens = min(BURST, self._tokens + MAX_RATIO)
+
+    def take(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+_tracker = LatencyTracker()
+_budget = HedgeBudget()
+
+
+def get_tracker() -> LatencyTracker:
+    return _tracker
+
+
+def _hedge_delay(model: str, call: str, kind: str) -> Optional[float]:
+    if not ENABLED:
+        return None
+    _budget.add()
+    return _tracker.threshold(model, call, kind)
+
+
+def _observe(model: str, call: str, kind: str, seconds: float) -> None:
+    if ENABLED:
+        _tracker.observe(model, call, kind, seconds)
+
+
+def _exceeded(model: str, call: str) -> DeadlineExceeded:
+    LLM_DEADLINE_EXCEEDED.inc(model, call)
+    return DeadlineExceeded()
+
+
+def _wait_time(*moments: Optional[float]) -> Optional[float]:
+    """Số giây đến mốc gần nhất (ngưỡng hedge hoặc thời hạn), None nếu không có mốc nào"""
+    now = time.monotonic()
+    waits = [moment - now for moment in moments if moment is not None]
+    return max(0.0, min(waits)) if waits else None
+
+
+def _moments(delay: Optional[float], left: Optional[float]) -> Tuple[Optional[float], Optional[float]]:
+    now = time.monotonic()
+    return (now + delay if delay is not None else None), (now + left if left is not None else None)
+
+
+def _spawn(func: Callable[[], T]) -> "Future[T]":
+    """Chạy `func` trong thread riêng với bản sao context hiện tại (trace, số liệu, độ ưu tiên)"""
+    future: "Future[T]" = Future()
+    context = contextvars.copy_context()
+
+    def target() -> None:
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(context.run(func))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=target, name="llm-call", daemon=True).start()
+    return future
+
+
+def run(model: str, call: str, attempt: Callable[[], T]) -> T:
+    """Gọi `attempt` (một lời gọi LLM đầy đủ), hedge nếu chậm hơn ngưỡng và dừng chờ khi hết hạn"""
+    delay = _hedge_delay(model, call, FULL)
+    left = remaining()
+
+    def timed() -> T:
+        start = time.monotonic()
+        result = attempt()
+        _observe(model, call, FULL, time.monotonic() - start)
+        return result
+
+    if left is not None and left <= 0:
+        raise _exceeded(model, call)
+    if delay is None:
+        # Không hedge: gọi tại chỗ, timeout HTTP đã bị giới hạn theo thời hạn
+        try:
+            return timed()
+        except Exception:
+            left = remaining()
+            if left is not None and left <= 0:
+                raise _exceeded(model, call) from None
+            raise
+
+    hedge_at, deadline_at = _moments(delay, left)
+    futures: Dict[Future, str] = {_spawn(timed): "primary"}
+    hedged = False
+    error: Optional[BaseException] = None
+    while futures:
+        done, _ = wait(list(futures), timeout=_wait_time(hedge_at, deadline_at), return_when=FIRST_COMPLETED)
+        for future in done:
+            role = futures.pop(future)
+            if future.exception() is None:
+                if hedged:
+                    LLM_HEDGE_WINS.inc(model, call, role)
+                return future.result()
+            error = future.exception()
+        if not futures:
+            break
+        now = time.monotonic()
+        if deadline_at is not None and now >= deadline_at:
+            raise _exceeded(model, call)
+        if hedge_at is not None and now >= hedge_at:
+            hedge_at = None
+            if _budget.take():
+                hedged = True
+                LLM_HEDGES.inc(model, call)
+                futures[_spawn(timed)] = "hedge"
+    raise error
+
+
+async def arun(model: str, call: str, attempt: Callable[[], Awaitable[T]]) -> T:
+    """Như `run` cho lời gọi bất đồng bộ; bản chậm hơn bị hủy"""
+    delay = _hedge_delay(model, call, FULL)
+    left = remaining()
+
+    async def timed() -> T:
+        start = time.monotonic()
+        result = await attempt()
+        _observe(model, call, FULL, time.monotonic() - start)
+        return result
+
+    if delay is None and left is None:
+        return await timed()
+    if left is not None and left <= 0:
+        raise _exceeded(model, call)
+
+    hedge_at, deadline_at = _moments(delay, left)
+    tasks: Dict[asyncio.Task, str] = {asyncio.ensure_future(timed()): "primary"}
+    hedged = False
+    error: Optional[BaseException] = None
+    try:
+        while tasks:
+            done, _ = await asyncio.wait(list(tasks), timeout=_wait_time(hedge_at, deadline_at), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                role = tasks.pop(task)
+                if task.exception() is None:
+                    if hedged:
+                        LLM_HEDGE_WINS.inc(model, call, role)
+                    return task.result()
+                error = task.exception()
+            if not tasks:
+                break
+            now = time.monotonic()
+            if deadline_at is not None and now >= deadline_at:
+                raise _exceeded(model, call)
+            if hedge_at is not None and now >= hedge_at:
+                hedge_at = None
+                if _budget.take():
+                    hedged = True
+                    LLM_HEDGES.inc(model, call)
+                    tasks[asyncio.ensure_future(timed())] = "hedge"
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+class _Racer:
+    """Một lần gọi stream trong cuộc đua đến token đầu tiên"""
+
+    def __init__(self, role: str):
+        self.role = role
+        self.start = time.monotonic()
+        self.stopped = threading.Event()
+        self.task: Optional[asyncio.Task] = None
+
+
+def _first_timed(model: str, call: str, chunks: Iterator[T], deadline_at: Optional[float] = None) -> Iterator[T]:
+    start = time.monotonic()
+    first = True
+    try:
+        for chunk in chunks:
+            if first:
+                _observe(model, call, TTFT, time.monotonic() - start)
+                first = False
+            if deadline_at is not None and time.monotonic() >= deadline_at:
+                raise _exceeded(model, call)
+            yield chunk
+    finally:
+        chunks.close()
+
+
+def stream(model: str, call: str, attempt: Callable[[], Iterator[T]]) -> Iterator[T]:
+    """Stream từ `attempt`, hedge nếu chưa có đoạn đầu tiên sau ngưỡng, dừng khi hết hạn"""
+    delay = _hedge_delay(model, call, TTFT)
+    left = remaining()
+    if left is not None and left <= 0:
+        raise _exceeded(model, call)
+    if delay is None:
+        # Không hedge: kiểm tra thời hạn giữa các đoạn, không tốn thêm thread cho mỗi stream
+        yield from _first_timed(model, call, attempt(), _moments(None, left)[1])
+        return
+
+    events: "queue.Queue[Tuple[_Racer, str, Any]]" = queue.Queue()
+    racers: List[_Racer] = []
+
+    def pump(racer: _Racer) -> None:
+        chunks = attempt()
+        try:
+            for chunk in chunks:
+                if racer.stopped.is_set():
+                    return
+                events.put((racer, "chunk", chunk))
+            events.put((racer, "end", None))
+        except BaseException as e:
+            events.put((racer, "error", e))
+        finally:
+            # Đóng trong chính thread này để lời gọi bị hủy được ghi nhận và trả lượt
+            chunks.close()
+
+    def start(role: str) -> None:
+        racer = _Racer(role)
+        racers.append(racer)
+        _spawn(lambda: pump(racer))
+
+    hedge_at, deadline_at = _moments(delay, left)
+    winner: Optional[_Racer] = None
+    active = 1
+    start("primary")
+    try:
+        while True:
+            try:
+                racer, kind, item = events.get(timeout=_wait_time(hedge_at if winner is None else None, deadline_at))
+            except queue.Empty:
+                now = time.monotonic()
+                if deadline_at is not None and now >= deadline_at:
+                    raise _exceeded(model, call)
+                if winner is None and hedge_at is not None and now >= hedge_at:
+                    hedge_at = None
+                    if _budget.take():
+                        LLM_HEDGES.inc(model, call)
+                        active += 1
+                        start("hedge")
+                continue
+            if winner is None:
+                if kind == "error":
+                    active -= 1
+                    if active == 0:
+                        raise item
+                    continue
+                winner = racer
+                _observe(model, call, TTFT, time.monotonic() - racer.start)
+                if len(racers) > 1:
+                    LLM_HEDGE_WINS.inc(model, call, racer.role)
+                for other in racers:
+                    if other is not racer:
+                        other.stopped.set()
+            if racer is not winner:
+                continue
+            if kind == "chunk":
+                yield item
+            elif kind == "end":
+                return
+            else:
+                raise item
+    finally:
+        for racer in racers:
+            racer.stopped.set()
+
+
+async def _afirst_timed(model: str, call: str, chunks: AsyncIterator[T], deadline_at: Optional[float] = None) -> AsyncIterator[T]:
+    start = time.monotonic()
+    first = True
+    try:
+        async for chunk in chunks:
+            if first:
+                _observe(model, call, TTFT, time.monotonic() - start)
+                first = False
+            if deadline_at is not None and time.monotonic() >= deadline_at:
+                raise _exceeded(model, call)
+            yield chunk
+    finally:
+        await chunks.aclose()
+
+
+async def astream(model: str, call: str, attempt: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+    """Như `stream` cho lời gọi bất đồng bộ; stream thua bị hủy ngay"""
+    delay = _hedge_delay(model, call, TTFT)
+    left = remaining()
+    if left is not None and left <= 0:
+        raise _exceeded(model, call)
+    if delay is None:
+        async for chunk in _afirst_timed(model, call, attempt(), _moments(None, left)[1]):
+            yield chunk
+        return
+
+    events: "asyncio.Queue[Tuple[_Racer, str, Any]]" = asyncio.Queue()
+    racers: List[_Racer] = []
+
+    async def pump(racer: _Racer) -> None:
+        chunks = attempt()
+        try:
+            async for chunk in chunks:
+                events.put_nowait((racer, "chunk", chunk))
+            events.put_nowait((racer, "end", None))
+        except asyncio.CancelledError:
+            raise
+        except BaseException as e:
+            events.put_nowait((racer, "error", e))
+        finally:
+            await chunks.aclose()
+
+    def start(role: str) -> None:
+        racer = _Racer(role)
+        racer.task = asyncio.ensure_future(pump(racer))
+        racers.append(racer)
+
+    hedge_at, deadline_at = _moments(delay, left)
+    winner: Optional[_Racer] = None
+    active = 1
+    start("primary")
+    try:
+        while True:
+            try:
+                racer, kind, item = await asyncio.wait_for(events.get(), _wait_time(hedge_at if winner is None else None, deadline_at))
+            except asyncio.TimeoutError:
+                now = time.monotonic()
+                if deadline_at is not None and now >= deadline_at:
+                    raise _exceeded(model, call)
+                if winner is None and hedge_at is not None and now >= hedge_at:
+                    hedge_at = None
+                    if _budget.take():
+                        LLM_HEDGES.inc(model, call)
+                        active += 1
+                        start("hedge")
+                continue
+            if winner is None:
+                if kind == "error":
+                    active -= 1
+                    if active == 0:
+                        raise item
+                    continue
+                winner = racer
+                _observe(model, call, TTFT, time.monotonic() - racer.start)
+                if len(racers) > 1:
+                    LLM_HEDGE_WINS.inc(model, call, racer.role)
+                for other in racers:
+                    if other is not racer:
+                        other.task.cancel()
+            if racer is not winner:
+                continue
+            if kind == "chunk":
+                yield item
+            elif kind == "end":
+                return
+            else:
+                raise item
+    finally:
+        for racer in racers:
+            racer.task.cancel()
+
+
+def _reset() -> None:
+    """Lock có thể đang bị giữ bởi thread của tiến trình cha"""
+    global _tracker, _budget
+    _tracker = LatencyTracker()
+    _budget = HedgeBudget()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset)
@@ -0,0 +1,134 @@
+"""Bộ định tuyến ý định chạy cục bộ, không cần gọi LLM.
+
+Mô hình tuyến tính trên đặc trưng từ khóa / n-gram của văn bản tiếng Việt đã bỏ
+dấu. Chỉ trả về kết quả khi đủ chắc chắn; các yêu cầu mơ hồ vẫn được chuyển cho
+LLM trong `process_query`.
+
+Đánh giá độ chính xác và độ trễ trên tập dữ liệu gán nhãn:
+    python -m agent.intent_router [đường_dẫn_eval.jsonl]
+"""
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+from agent.utils import tokenize_vi
+
+# Trọng số của các n-gram (đã bỏ dấu) cho từng chức năng
+INTENT_FEATURES: Dict[str, Dict[str, float]] = {
+    "find_jobs": {
+        "tim viec": 4, "viec lam": 3, "tim job": 4, "kiem viec": 4, "xin viec": 1,
+        "cong viec": 1.5, "job": 1.5, "tuyen": 0.5, "luong": 1, "trieu": 1, "tr": 0.5,
+        "fresher": 1, "intern": 1, "thuc tap": 1, "remote": 1, "part time": 1,
+        "vi tri": 0.5, "nam kinh nghiem": 1, "o ha noi": 0.5, "tai ha noi": 0.5,
+        "tp hcm": 0.5, "viec": 1, "dang tuyen": 2, "co viec": 2, "goi y viec": 3,
+        "co job": 2, "job nao": 2,
+    },
+    "write_email": {
+        "email": 4, "mail": 4, "thu xin viec": 5, "thu ung tuyen": 5, "cover letter": 5,
+        "viet thu": 3, "thu gui": 2, "thu": 1, "gui nha tuyen dung": 2, "thu gioi thieu": 4,
+        "viet email": 2, "soan email": 2, "email ung tuyen": 3, "email xin viec": 3, "apply": 1,
+    },
+    "evaluate_cv": {
+        "danh gia cv": 6, "nhan xet cv": 6, "review cv": 6, "cham cv": 6, "cham diem cv": 6,
+        "gop y cv": 6, "sua cv": 4, "cai thien cv": 5, "cv cua toi": 2, "cv cua minh": 2,
+        "danh gia": 3, "nhan xet": 3, "review": 3, "gop y": 3, "cai thien": 2,
+        "diem manh": 2, "diem yeu": 2, "phu hop voi": 1, "cv": 1, "ho so": 0.5,
+    },
+    "find_companies": {
+        "cong ty": 2.5, "tim cong ty": 3, "doanh nghiep": 3, "top cong ty": 5, "cong ty nao": 5,
+        "thong ke cong ty": 6, "danh sach cong ty": 5, "to chuc": 1, "tap doan": 3,
+        "startup": 3, "noi lam viec": 2, "moi truong lam viec": 2, "cong ty tot": 3,
+    },
+    "create_cv": {
+        "tao cv": 6, "viet cv": 6, "lam cv": 6, "soan cv": 6, "mau cv": 4, "tao ho so": 5,
+        "viet giup cv": 6, "lam giup cv": 6, "tao giup cv": 6, "xay dung cv": 6,
+        "resume": 1, "cv": 1, "ho so": 0.5, "ten toi la": 2, "toi ten": 2,
+    },
+}
+
+MAX_NGRAM = max(len(feature.split()) for weights in INTENT_FEATURES.values() for feature in weights)
+
+# Tắt bộ định tuyến cục bộ bằng LOCAL_ROUTER=0
+ENABLED = os.getenv("LOCAL_ROUTER", "1") != "0"
+# Cần ít nhất bấy nhiêu điểm cho chức năng tốt nhất mới tin kết quả
+MIN_SCORE = float(os.getenv("LOCAL_ROUTER_MIN_SCORE", "3"))
+# Độ tin cậy tối thiểu (khoảng cách tương đối giữa hai chức năng điểm cao nhất)
+CONFIDENCE_THRESHOLD = float(os.getenv("LOCAL_ROUTER_THRESHOLD", "0.5"))
+
+DEFAULT_EVAL_PATH = os.path.join(os.path.dirname(__file__), "data", "intent_eval.jsonl")
+
+
+def _ngrams(tokens: List[str]) -> List[str]:
+    """Sinh các n-gram từ 1 đến MAX_NGRAM"""
+    grams = []
+    for n in range(1, MAX_NGRAM + 1):
+        for i in range(len(tokens) - n + 1):
+            grams.append(" ".join(tokens[i:i + n]))
+    return grams
+
+
+def score_intents(query: str) -> Dict[str, float]:
+    """Tính điểm của từng chức năng cho một yêu cầu"""
+    grams = _ngrams(tokenize_vi(query))
+    return {
+        intent: sum(weights.get(gram, 0.0) for gram in grams)
+        for intent, weights in INTENT_FEATURES.items()
+    }
+
+
+def classify_intent(query: str) -> Tuple[str, float]:
+    """Trả về (chức năng có điểm cao nhất, độ tin cậy trong khoảng 0..1)"""
+    ranked = sorted(score_intents(query).items(), key=lambda item: item[1], reverse=True)
+    (best, best_score), (_, second_score) = ranked[0], ranked[1]
+    if best_score < MIN_SCORE:
+        return best, 0.0
+    return best, (best_score - max(second_score, 0.0)) / best_score
+
+
+def route_locally(query: str) -> Optional[str]:
+    """Chức năng cần thực hiện nếu đủ chắc chắn, ngược lại None để dùng LLM"""
+    intent, confidence = classify_intent(query)
+    if confidence >= CONFIDENCE_THRESHOLD:
+        return intent
+    return None
+
+
+def evaluate(path: str = DEFAULT_EVAL_PATH, repeat: int = 200) -> Dict[str, float]:
+    """Đánh giá độ chính xác và độ trễ trên tập dữ liệu gán nhãn (JSONL: query, label)"""
+    with open(path, encoding="utf-8") as f:
+        samples = [json.loads(line) for line in f if line.strip()]
+
+    routed = correct = 0
+    for sample in samples:
+        intent = route_locally(sample["query"])
+        if intent is not None:
+            routed += 1
+            correct += intent == sample["label"]
+
+    # Đo độ trễ trên toàn bộ tập, lặp lại nhiều lần
+    timings = []
+    for _ in range(repeat):
+        for sample in samples:
+            start = time.perf_counter_ns()
+            route_locally(sample["query"])
+            timings.append(time.perf_counter_ns() - start)
+    timings.sort()
+
+    return {
+        "samples": len(samples),
+        "coverage": routed / len(samples),
+        "precision": correct / routed if routed else 0.0,
+        "fallback": len(samples) - routed,
+        "latency_p50_us": timings[len(timings) // 2] / 1000,
+        "latency_p99_us": timings[int(len(timings) * 0.99)] / 1000,
+    }
+
+
+if __name__ == "__main__":
+    report = evaluate(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_EVAL_PATH)
+    print(f"Số mẫu:             {report['samples']}")
+    print(f"Định tuyến cục bộ:  {report['coverage']:.1%} (chuyển LLM: {report['fallback']})")
+    print(f"Độ chính xác:       {report['precision']:.1%} trên các mẫu định tuyến cục bộ")
+    print(f"Độ trễ p50 / p99:   {report['latency_p50_us']:.1f} / {report['latency_p99_us']:.1f} µs")
@@ -1,14 +1,35 @@
-from typing import Dict, List, Any, Annotated, TypedDict
+from typing import Dict, AsyncIterator, Iterator, List, Any, Annotated, Literal, Optional, Type, TypedDict
+import asyncio
+import contextvars
 import os
 import json
-from langchain_openai import ChatOpenAI
-from langchain.prompts import PromptTemplate
-from langgraph.graph import StateGraph, END
-from pydantic import BaseModel
-from langchain_core.tools import tool
+from concurrent.futures import ThreadPoolExecutor
 from pydantic import BaseModel, Field
-from ddgs import DDGS
-from agent.utils import get_openai_api_key, extract_json_from_text, format_job_results, format_company_results
+from agent.llm_client import (
+    get_module, llm_for, invoke_llm, stream_llm, ainvoke_llm, astream_llm, invoke_structured, ainvoke_structured
+)
+from agent.cv_builder import MODE as CREATE_CV_MODE, Part, plan, render_part
+from agent.cv_sections import CONCURRENCY as SECTION_CONCURRENCY, is_long, prepare
+from agent.metrics import instrument_node
+from agent.prompts import PROMPTS
+from agent.tracing import span, traced
+from agent.rate_limiter import LLMOverloaded
+from agent.semantic_cache import get_semantic_cache
+from agent.intent_router import ENABLED as LOCAL_ROUTER_ENABLED, route_locally
+from agent.company_data import describe as describe_company_stats
+from agent.job_index import get_job_index
+from agent.utils import extract_json_from_text, format_job_results, format_company_results
+
+# Chế độ trả về dữ liệu có cấu trúc cho tìm việc / tìm công ty (STRUCTURED_OUTPUT=1)
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "0") == "1"
+
+# langchain, langgraph và ddgs chỉ được import khi dùng lần đầu (xem agent.warmup)
+_web_search = None
+
+
+def _job_context(job_description: str) -> str:
+    """Dòng mô tả công việc ứng tuyển cho các prompt đánh giá CV ("" nếu không có)"""
+    return f"Mô tả công việc ứng tuyển: {job_description}" if job_description else ""
 
 # Định nghĩa các trạng thái
 class AgentState(TypedDict):
@@ -21,152 +42,357 @@ class AgentState(TypedDict):
 class WebSearchInput(BaseModel):
     input:str = Field(description="Nội dung cần tìm kiếm trên internet để cập nhật thêm thông tin trả lời.")
 
-@tool("web_search", args_schema=WebSearchInput, return_direct=True)
-def web_search(input: str):
+def _search_web(input: str):
     """
     Tìm kiếm thông tin trên internet dựa vào nội dung người dùng cung cấp.
     """
+    from ddgs import DDGS
     results = DDGS().text(input, max_results=5, region="vn-vi")
     return results
 
 
+def __getattr__(name: str):
+    # Tool `web_search` được tạo khi được truy cập lần đầu
+    global _web_search
+    if name == "web_search":
+        if _web_search is None:
+            from langchain_core.tools import tool
+            _web_search = tool("web_search", args_schema=WebSearchInput, return_direct=True)(_search_web)
+        return _web_search
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Tham số của từng chức năng, dùng cho chế độ định tuyến một lần gọi (fused)
+class FindJobsArgs(BaseModel):
+    job_description: str = Field(description="Mô tả công việc cần tìm")
+    salary: str = Field(default="", description="Mức lương mong muốn (nếu có)")
+    location: str = Field(default="", description="Địa điểm làm việc (nếu có)")
+    experience: int = Field(default=0, description="Số năm kinh nghiệm (nếu có, chỉ số)")
+
+class WriteEmailArgs(BaseModel):
+    job_title: str = Field(description="Vị trí công việc")
+    company: str = Field(default="Công ty", description="Tên công ty")
+    skills: str = Field(description="Kỹ năng và kinh nghiệm của ứng viên")
+
+class EvaluateCVArgs(BaseModel):
+    cv_text: str = Field(description="Nội dung CV")
+    job_description: str = Field(default="", description="Mô tả công việc ứng tuyển (nếu có)")
+
+class FindCompaniesArgs(BaseModel):
+    skills: str = Field(description="Kỹ năng và kinh nghiệm của ứng viên")
+    industry: str = Field(default="Công nghệ thông tin", description="Ngành nghề quan tâm")
+    location: str = Field(default="", description="Địa điểm làm việc (nếu có)")
+
+class CreateCVArgs(BaseModel):
+    name: str = Field(description="Họ và tên")
+    email: str = Field(default="", description="Email")
+    phone: str = Field(default="", description="Số điện thoại (nếu có)")
+    education: str = Field(default="", description="Học vấn (nếu có)")
+    experience: str = Field(default="", description="Kinh nghiệm làm việc")
+    skills: str = Field(default="", description="Kỹ năng")
+
+class RoutedQuery(BaseModel):
+    """Chức năng cần thực hiện cùng tham số của chức năng đó"""
+    route: Literal["find_jobs", "write_email", "evaluate_cv", "find_companies", "create_cv"] = Field(
+        description="Chức năng cần thực hiện"
+    )
+    find_jobs: Optional[FindJobsArgs] = Field(default=None, description="Tham số khi route là find_jobs")
+    write_email: Optional[WriteEmailArgs] = Field(default=None, description="Tham số khi route là write_email")
+    evaluate_cv: Optional[EvaluateCVArgs] = Field(default=None, description="Tham số khi route là evaluate_cv")
+    find_companies: Optional[FindCompaniesArgs] = Field(default=None, description="Tham số khi route là find_companies")
+    create_cv: Optional[CreateCVArgs] = Field(default=None, description="Tham số khi route là create_cv")
+
+# Schema tham số của từng chức năng, dùng khi chức năng đã được định tuyến cục bộ
+ROUTE_ARGS: Dict[str, Type[BaseModel]] = {
+    "find_jobs": FindJobsArgs,
+    "write_email": WriteEmailArgs,
+    "evaluate_cv": EvaluateCVArgs,
+    "find_companies": FindCompaniesArgs,
+    "create_cv": CreateCVArgs,
+}
+
+
+# Kết quả có cấu trúc: model chỉ trả về dữ liệu, HTML được render phía server
+class JobResult(BaseModel):
+    title: str = Field(description="Tên vị trí")
+    company: str = Field(description="Công ty")
+    salary: str = Field(description="Mức lương ước tính")
+    requirements: str = Field(description="Yêu cầu chính, một câu ngắn")
+    reason: str = Field(description="Lý do phù hợp, một câu ngắn")
+
+class JobResults(BaseModel):
+    """Danh sách công việc phù hợp"""
+    jobs: List[JobResult] = Field(description="5 công việc phù hợp nhất")
+    conclusion: str = Field(default="", description="Kết luận ngắn gọn, tối đa 2 câu")
+
+class CompanyResult(BaseModel):
+    name: str = Field(description="Tên công ty")
+    industry: str = Field(description="Lĩnh vực hoạt động chính")
+    size: str = Field(description="Quy mô công ty, vd. 1000-5000 nhân viên")
+    employees: int = Field(default=0, description="Số nhân viên ước tính (chỉ số)")
+    match_score: int = Field(default=0, description="Mức độ phù hợp với ứng viên, từ 0 đến 100")
+    reason: str = Field(description="Lý do phù hợp với kỹ năng của ứng viên, một câu ngắn")
+    opportunities: str = Field(description="Cơ hội phát triển, một câu ngắn")
+
+class CompanyResults(BaseModel):
+    """Danh sách công ty phù hợp"""
+    companies: List[CompanyResult] = Field(description="10 công ty phù hợp nhất")
+    summary: str = Field(default="", description="Nhận xét chung ngắn gọn, tối đa 2 câu")
+
+class CompanyParagraph(BaseModel):
+    company: str = Field(description="Tên công ty, đúng như trong danh sách")
+    paragraph: str = Field(description="Đoạn 2-3 câu dành riêng cho công ty này")
+
+class CompanyParagraphs(BaseModel):
+    """Đoạn văn riêng cho từng công ty trong email ứng tuyển hàng loạt"""
+    paragraphs: List[CompanyParagraph] = Field(description="Mỗi công ty trong danh sách một phần tử")
+
+
 # Định nghĩa các module chức năng
 class JobModule:
-    def __init__(self):
-        api_key = get_openai_api_key()
-        self.llm = ChatOpenAI(api_key=api_key, model="gpt-4.1", temperature=0.7)
-    
-    def find_jobs(self, job_description: str, salary: str = "", location: str = "", experience: int = 0) -> str:
-        """Tìm kiếm công việc phù hợp dựa trên mô tả và yêu cầu"""
-        prompt = PromptTemplate.from_template(
-            """Bạn là một trợ lý tìm việc chuyên nghiệp. Hãy giúp tôi tìm kiếm công việc phù hợp dựa trên thông tin sau:
-            Mô tả công việc: {job_description}
-            Mức lương mong muốn: {salary}
-            Địa điểm: {location}
-            Kinh nghiệm: {experience} năm
-            
-            Hãy liệt kê 5 công việc phù hợp nhất, bao gồm:
-            1. Tên vị trí
-            2. Công ty
-            3. Mức lương ước tính
-            4. Yêu cầu chính
-            5. Lý do phù hợp
-            
-            Trả lời bằng tiếng Việt và định dạng rõ ràng.
-            Yêu cầu: trả về kết quả dưới dạng HTML (không được hiển thị các text kiểu thẻ trong html, nội dung phải chính xác chỉn chu từng câu chữ do kết quả trả về sẽ được tôi dùng để hiển thị trực tiếp lên cho người dùng đọc)
-            , gạch thành các ý, format giao diện dễ đọc, có kết luận cuối cùng, hightline vào các ý chính, màu sắc của tiêu đề và nội dung bên trong không được trùng nhau
-            
-            Luôn trả về dạng HTML
-            """
+    def _postings_context(self, job_description: str, salary: str = "", location: str = "", experience: int = 0) -> str:
+        """Các tin tuyển dụng thật lấy từ chỉ mục cục bộ để đưa vào prompt ("" nếu chưa có chỉ mục)"""
+        index = get_job_index()
+        if index is None:
+            return ""
+        try:
+            years = float(experience or 0)
+        except (TypeError, ValueError):
+            years = 0
+        postings = index.search(job_description, salary=salary, location=location, experience=years or None)
+        if not postings:
+            return ""
+        lines = [
+            f"- [{p['id']}] {p['title']} | {p['company']} | {p['location'] or 'Không rõ địa điểm'} | "
+            f"Lương: {p['salary'] or 'Thỏa thuận'} | Kinh nghiệm: {p['experience'] or 'Không rõ'} | "
+            f"Kỹ năng: {p['skills']} | {str(p['requirements'] or p['description'])[:300]}"
+            for p in postings
+        ]
+        return (
+            "\n\nDanh sách tin tuyển dụng thực tế (chỉ chọn trong danh sách này, giữ nguyên tên vị trí, "
+            "công ty và mức lương):\n" + "\n".join(lines)
         )
-        
-        formatted_prompt = prompt.format(
+    
+    def _find_jobs_prompt(self, job_description: str, salary: str = "", location: str = "", experience: int = 0) -> str:
+        """Tạo prompt tìm việc"""
+        return PROMPTS["find_jobs"].format(
             job_description=job_description,
             salary=salary,
             location=location,
-            experience=experience
+            experience=experience,
+            postings=self._postings_context(job_description, salary, location, experience)
         )
+    
+    def find_jobs(self, job_description: str, salary: str = "", location: str = "", experience: int = 0) -> str:
+        """Tìm kiếm công việc phù hợp dựa trên mô tả và yêu cầu"""
+        formatted_prompt = self._find_jobs_prompt(job_description, salary, location, experience)
         
         # react_agent = self.llm.bind_tools([web_search])
         
         # response = react_agent.invoke(formatted_prompt)
         
         
-        response = self.llm.invoke(formatted_prompt)
-        return response.content
+        return invoke_llm(llm_for("find_jobs"), formatted_prompt, cache_namespace="find_jobs")
+    
+    def stream_find_jobs(self, job_description: str, salary: str = "", location: str = "", experience: int = 0) -> Iterator[str]:
+        """Tìm kiếm công việc, trả về từng đoạn văn bản ngay khi model sinh ra"""
+        formatted_prompt = self._find_jobs_prompt(job_description, salary, location, experience)
+        return stream_llm(llm_for("find_jobs"), formatted_prompt, cache_namespace="find_jobs")
+    
+    async def afind_jobs(self, job_description: str, salary: str = "", location: str = "", experience: int = 0) -> str:
+        """Tìm kiếm công việc phù hợp (bất đồng bộ)"""
+        formatted_prompt = self._find_jobs_prompt(job_description, salary, location, experience)
+        return await ainvoke_llm(llm_for("find_jobs"), formatted_prompt, cache_namespace="find_jobs")
+    
+    def astream_find_jobs(self, job_description: str, salary: str = "", location: str = "", experience: int = 0) -> AsyncIterator[str]:
+        """Tìm kiếm công việc, stream bất đồng bộ từng đoạn văn bản"""
+        formatted_prompt = self._find_jobs_prompt(job_description, salary, location, experience)
+        return astream_llm(llm_for("find_jobs"), formatted_prompt, cache_namespace="find_jobs")
+    
+    def _find_jobs_structured_prompt(self, job_description: str, salary: str = "", location: str = "", experience: int = 0) -> str:
+        """Tạo prompt tìm việc cho chế độ trả về dữ liệu có cấu trúc"""
+        return PROMPTS["find_jobs_structured"].format(
+            job_description=job_description,
+            salary=salary,
+            location=location,
+            experience=experience,
+            postings=self._postings_context(job_description, salary, location, experience)
+        )
+    
+    def find_jobs_structured(self, job_description: str, salary: str = "", location: str = "", experience: int = 0) -> Dict[str, Any]:
+        """Tìm kiếm công việc, trả về dữ liệu dạng {"jobs": [...], "conclusion": ...}"""
+        formatted_prompt = self._find_jobs_structured_prompt(job_description, salary, location, experience)
+        result = invoke_structured(llm_for("find_jobs_structured"), formatted_prompt, JobResults, cache_namespace="find_jobs_structured")
+        return result.model_dump()
+    
+    async def afind_jobs_structured(self, job_description: str, salary: str = "", location: str = "", experience: int = 0) -> Dict[str, Any]:
+        """Tìm kiếm công việc, trả về dữ liệu có cấu trúc (bất đồng bộ)"""
+        formatted_prompt = self._find_jobs_structured_prompt(job_description, salary, location, experience)
+        result = await ainvoke_structured(llm_for("find_jobs_structured"), formatted_prompt, JobResults, cache_namespace="find_jobs_structured")
+        return result.model_dump()
 
 class EmailModule:
-    def __init__(self):
-        api_key = get_openai_api_key()
-        self.llm = ChatOpenAI(api_key=api_key, model="gpt-4.1", temperature=0.7)
+    def _application_email_prompt(self, job_title: str, company: str, skills: str) -> str:
+        """Tạo prompt viết email ứng tuyển"""
+        return PROMPTS["write_application_email"].format(
+            job_title=job_title,
+            company=company,
+            skills=skills
+        )
     
     def write_application_email(self, job_title: str, company: str, skills: str) -> str:
         """Viết email ứng tuyển dựa trên thông tin công việc và kỹ năng"""
-        prompt = PromptTemplate.from_template(
-            """Bạn là một chuyên gia viết email ứng tuyển. Hãy viết một email ứng tuyển chuyên nghiệp dựa trên thông tin sau:
-            
-            Vị trí ứng tuyển: {job_title}
-            Công ty: {company}
-            Kỹ năng và kinh nghiệm của ứng viên: {skills}
-            
-            Email cần có:
-            1. Lời chào và giới thiệu bản thân
-            2. Lý do quan tâm đến công ty và vị trí
-            3. Tóm tắt kỹ năng và kinh nghiệm phù hợp
-            4. Kết thúc lịch sự và mong muốn phỏng vấn
-            
-            Trả lời bằng tiếng Việt và định dạng rõ ràng."""
+        formatted_prompt = self._application_email_prompt(job_title, company, skills)
+        return invoke_llm(llm_for("write_application_email"), formatted_prompt, cache_namespace="write_application_email")
+    
+    def stream_application_email(self, job_title: str, company: str, skills: str) -> Iterator[str]:
+        """Viết email ứng tuyển, trả về từng đoạn văn bản ngay khi model sinh ra"""
+        formatted_prompt = self._application_email_prompt(job_title, company, skills)
+        return stream_llm(llm_for("write_application_email"), formatted_prompt, cache_namespace="write_application_email")
+    
+    async def awrite_application_email(self, job_title: str, company: str, skills: str) -> str:
+        """Viết email ứng tuyển (bất đồng bộ)"""
+        formatted_prompt = self._application_email_prompt(job_title, company, skills)
+        return await ainvoke_llm(llm_for("write_application_email"), formatted_prompt, cache_namespace="write_application_email")
+    
+    def astream_application_email(self, job_title: str, company: str, skills: str) -> AsyncIterator[str]:
+        """Viết email ứng tuyển, stream bất đồng bộ từng đoạn văn bản"""
+        formatted_prompt = self._application_email_prompt(job_title, company, skills)
+        return astream_llm(llm_for("write_application_email"), formatted_prompt, cache_namespace="write_application_email")
+    
+    def _merge_body_prompt(self, job_title: str, skills: str) -> str:
+        """Tạo prompt viết phần chung của email ứng tuyển hàng loạt (có chỗ trống cho từng công ty)"""
+        return PROMPTS["mail_merge_body"].format(job_title=job_title, skills=skills)
+    
+    def _merge_paragraphs_prompt(self, job_title: str, skills: str, companies: List[Dict[str, str]]) -> str:
+        """Tạo prompt viết đoạn riêng cho một nhóm công ty"""
+        listing = "\n".join(
+            f"{i}. {company['company']}" + (f" ({company['note']})" if company.get("note") else "")
+            for i, company in enumerate(companies, 1)
         )
-        
-        formatted_prompt = prompt.format(
+        return PROMPTS["mail_merge_paragraphs"].format(
             job_title=job_title,
-            company=company,
-            skills=skills
+            skills=skills,
+            count=len(companies),
+            companies=listing
         )
-        
-        response = self.llm.invoke(formatted_prompt)
-        return response.content
+    
+    def merge_body(self, job_title: str, skills: str) -> str:
+        """Phần chung của email ứng tuyển hàng loạt, sinh một lần cho mọi công ty (xem `agent.mail_merge`)"""
+        formatted_prompt = self._merge_body_prompt(job_title, skills)
+        return invoke_llm(llm_for("mail_merge_body"), formatted_prompt, cache_namespace="mail_merge_body")
+    
+    def merge_paragraphs(self, job_title: str, skills: str, companies: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Đoạn riêng [{"company", "paragraph"}] cho các công ty của một nhóm, trong cùng một lời gọi"""
+        formatted_prompt = self._merge_paragraphs_prompt(job_title, skills, companies)
+        result = invoke_structured(llm_for("mail_merge_paragraphs"), formatted_prompt, CompanyParagraphs, cache_namespace="mail_merge_paragraphs")
+        return [item.model_dump() for item in result.paragraphs]
+    
+    async def amerge_body(self, job_title: str, skills: str) -> str:
+        """Phần chung của email ứng tuyển hàng loạt (bất đồng bộ)"""
+        formatted_prompt = self._merge_body_prompt(job_title, skills)
+        return await ainvoke_llm(llm_for("mail_merge_body"), formatted_prompt, cache_namespace="mail_merge_body")
+    
+    async def amerge_paragraphs(self, job_title: str, skills: str, companies: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Đoạn riêng cho từng công ty của một nhóm (bất đồng bộ)"""
+        formatted_prompt = self._merge_paragraphs_prompt(job_title, skills, companies)
+        result = await ainvoke_structured(llm_for("mail_merge_paragraphs"), formatted_prompt, CompanyParagraphs, cache_namespace="mail_merge_paragraphs")
+        return [item.model_dump() for item in result.paragraphs]
 
 class CVModule:
-    def __init__(self):
-        api_key = get_openai_api_key()
-        self.llm = ChatOpenAI(api_key=api_key, model="gpt-4.1", temperature=0.7)
+    def _evaluate_cv_prompt(self, cv_text: str, job_description: str = "") -> str:
+        """Tạo prompt đánh giá CV"""
+        return PROMPTS["evaluate_cv"].format(
+            cv_text=cv_text,
+            job_context=_job_context(job_description)
+        )
     
-    def evaluate_cv(self, cv_text: str, job_description: str = "") -> str:
-        """Đánh giá CV và đưa ra gợi ý cải thiện"""
-        prompt = PromptTemplate.from_template(
-            """Bạn là một chuyên gia tuyển dụng và đánh giá CV. Hãy đánh giá CV sau và đưa ra gợi ý cải thiện:
-            
-            CV: {cv_text}
-            
-            {job_context}
-            
-            Hãy đánh giá các khía cạnh sau:
-            1. Định dạng và trì bày
-            2. Nội dung và cách diễn đạt
-            3. Kỹ năng và kinh nghiệm nổi bật
-            4. Điểm cần cải thiện
-            5. Gợi ý cụ thể để nâng cao chất lượng CV
-            
-            Trả lời bằng tiếng Việt và định dạng rõ ràng."""
+    def _cv_section_prompt(self, title: str, text: str, job_description: str = "") -> str:
+        """Tạo prompt nhận xét một phần của CV dài (bước map)"""
+        return PROMPTS["evaluate_cv_section"].format(title=title, text=text, job_context=_job_context(job_description))
+    
+    def _cv_summary_prompt(self, structure: str, notes: List[str], titles: List[str], job_description: str = "") -> str:
+        """Tạo prompt tổng hợp các nhận xét thành đánh giá CV hoàn chỉnh (bước reduce)"""
+        return PROMPTS["evaluate_cv_summary"].format(
+            structure=structure,
+            notes="\n\n".join(f"[{title}]\n{note}" for title, note in zip(titles, notes)),
+            job_context=_job_context(job_description)
         )
+    
+    def _long_cv_prompt(self, cv_text: str, job_description: str = "") -> str:
+        """Prompt đánh giá CV dài: CV đã làm sạch, hoặc tổng hợp nhận xét đồng thời của từng phần"""
+        structure, parts = prepare(cv_text)
+        if len(parts) == 1:
+            return self._evaluate_cv_prompt(parts[0][1], job_description)
+        llm = llm_for("evaluate_cv_section")
         
-        job_context = ""
-        if job_description:
-            job_context = f"Mô tả công việc ứng tuyển: {job_description}"
-        
-        formatted_prompt = prompt.format(
-            cv_text=cv_text,
-            job_context=job_context
-        )
+        def review(title: str, text: str) -> str:
+            return invoke_llm(llm, self._cv_section_prompt(title, text, job_description), "evaluate_cv_section")
         
-        response = self.llm.invoke(formatted_prompt)
-        return response.content
+        # Mỗi phần chạy với bản sao context (thời hạn, độ ưu tiên, trace) của request
+        with ThreadPoolExecutor(max_workers=max(1, min(len(parts), SECTION_CONCURRENCY))) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, review, title, text) for title, text in parts]
+            notes = [future.result() for future in futures]
+        return self._cv_summary_prompt(structure, notes, [title for title, _ in parts], job_description)
     
-    def create_cv(self, name: str, email: str, phone: str, education: str, experience: str, skills: str) -> str:
-        """Tạo CV dựa trên thông tin cung cấp"""
-        prompt = PromptTemplate.from_template(
-            """Bạn là một chuyên gia tạo CV. Hãy tạo một CV chuyên nghiệp dựa trên thông tin sau:
-            
-            Họ và tên: {name}
-            Email: {email}
-            Số điện thoại: {phone}
-            Học vấn: {education}
-            Kinh nghiệm làm việc: {experience}
-            Kỹ năng: {skills}
-            
-            Hãy tạo một CV với định dạng rõ ràng, chuyên nghiệp, bao gồm:
-            1. Thông tin cá nhân
-            2. Mục tiêu nghề nghiệp
-            3. Học vấn
-            4. Kinh nghiệm làm việc
-            5. Kỹ năng
-            6. Thành tích (nếu có thể suy luận từ thông tin cung cấp)
-            
-            Trả lời bằng tiếng Việt và định dạng rõ ràng."""
-        )
+    async def _along_cv_prompt(self, cv_text: str, job_description: str = "") -> str:
+        """Như `_long_cv_prompt` (bất đồng bộ)"""
+        structure, parts = prepare(cv_text)
+        if len(parts) == 1:
+            return self._evaluate_cv_prompt(parts[0][1], job_description)
+        llm = llm_for("evaluate_cv_section")
+        semaphore = asyncio.Semaphore(max(1, SECTION_CONCURRENCY))
+        
+        async def review(title: str, text: str) -> str:
+            async with semaphore:
+                return await ainvoke_llm(llm, self._cv_section_prompt(title, text, job_description), "evaluate_cv_section")
         
-        formatted_prompt = prompt.format(
+        notes = await asyncio.gather(*[review(title, text) for title, text in parts])
+        return self._cv_summary_prompt(structure, notes, [title for title, _ in parts], job_description)
+    
+    def evaluate_cv(self, cv_text: str, job_description: str = "") -> str:
+        """Đánh giá CV và đưa ra gợi ý cải thiện (CV dài được nhận xét song song theo từng phần)"""
+        if is_long(cv_text):
+            formatted_prompt = self._long_cv_prompt(cv_text, job_description)
+        else:
+            formatted_prompt = self._evaluate_cv_prompt(cv_text, job_description)
+        return invoke_llm(llm_for("evaluate_cv"), formatted_prompt, cache_namespace="evaluate_cv")
+    
+    def stream_evaluate_cv(self, cv_text: str, job_description: str = "") -> Iterator[str]:
+        """Đánh giá CV, trả về từng đoạn văn bản ngay khi model sinh ra"""
+        if is_long(cv_text):
+            return self._stream_long_cv(cv_text, job_description)
+        formatted_prompt = self._evaluate_cv_prompt(cv_text, job_description)
+        return stream_llm(llm_for("evaluate_cv"), formatted_prompt, cache_namespace="evaluate_cv")
+    
+    def _stream_long_cv(self, cv_text: str, job_description: str = "") -> Iterator[str]:
+        # Các phần được nhận xét khi bắt đầu đọc stream, chỉ bước tổng hợp được stream
+        formatted_prompt = self._long_cv_prompt(cv_text, job_description)
+        yield from stream_llm(llm_for("evaluate_cv"), formatted_prompt, cache_namespace="evaluate_cv")
+    
+    async def aevaluate_cv(self, cv_text: str, job_description: str = "") -> str:
+        """Đánh giá CV (bất đồng bộ)"""
+        if is_long(cv_text):
+            formatted_prompt = await self._along_cv_prompt(cv_text, job_description)
+        else:
+            formatted_prompt = self._evaluate_cv_prompt(cv_text, job_description)
+        return await ainvoke_llm(llm_for("evaluate_cv"), formatted_prompt, cache_namespace="evaluate_cv")
+    
+    def astream_evaluate_cv(self, cv_text: str, job_description: str = "") -> AsyncIterator[str]:
+        """Đánh giá CV, stream bất đồng bộ từng đoạn văn bản"""
+        if is_long(cv_text):
+            return self._astream_long_cv(cv_text, job_description)
+        formatted_prompt = self._evaluate_cv_prompt(cv_text, job_description)
+        return astream_llm(llm_for("evaluate_cv"), formatted_prompt, cache_namespace="evaluate_cv")
+    
+    async def _astream_long_cv(self, cv_text: str, job_description: str = "") -> AsyncIterator[str]:
+        formatted_prompt = await self._along_cv_prompt(cv_text, job_description)
+        async for chunk in astream_llm(llm_for("evaluate_cv"), formatted_prompt, cache_namespace="evaluate_cv"):
+            yield chunk
+    
+    def _create_cv_prompt(self, name: str, email: str, phone: str, education: str, experience: str, skills: str) -> str:
+        """Tạo prompt tạo CV"""
+        return PROMPTS["create_cv"].format(
             name=name,
             email=email,
             phone=phone,
@@ -174,44 +400,156 @@ class CVModule:
             experience=experience,
             skills=skills
         )
-        
-        response = self.llm.invoke(formatted_prompt)
-        return response.content
+    
+    def _cv_part_prompt(self, part: Part) -> str:
+        """Tạo prompt sinh một mục của CV (chỉ chứa các trường mà mục phụ thuộc)"""
+        return PROMPTS[part.prompt].format(**part.values)
+    
+    def _create_cv_parts(self, parts: List[Part]) -> Iterator[str]:
+        """Sinh đồng thời các mục cần gọi LLM (có cache riêng từng mục), trả về từng mục theo thứ tự ngay khi xong"""
+        llm = llm_for("create_cv_section")
+        pending = [part for part in parts if part.text is None]
+        pool = ThreadPoolExecutor(max_workers=max(1, len(pending)))
+        futures = {
+            part.name: pool.submit(contextvars.copy_context().run, invoke_llm, llm, self._cv_part_prompt(part), "create_cv_section")
+            for part in pending
+        }
+        try:
+            for part in parts:
+                text = part.text if part.text is not None else futures[part.name].result()
+                yield render_part(part.title, text)
+        finally:
+            # Client ngắt kết nối hoặc một mục bị lỗi: bỏ các mục chưa chạy và không chờ các mục đang chạy
+            # (kết quả của chúng vẫn vào cache)
+            for future in futures.values():
+                future.cancel()
+            pool.shutdown(wait=False)
+    
+    async def _acreate_cv_parts(self, parts: List[Part]) -> AsyncIterator[str]:
+        """Như `_create_cv_parts` (bất đồng bộ)"""
+        llm = llm_for("create_cv_section")
+        tasks = {
+            part.name: asyncio.ensure_future(ainvoke_llm(llm, self._cv_part_prompt(part), "create_cv_section"))
+            for part in parts if part.text is None
+        }
+        try:
+            for part in parts:
+                text = part.text if part.text is not None else await tasks[part.name]
+                yield render_part(part.title, text)
+        finally:
+            # Client ngắt kết nối hoặc một mục bị lỗi: không sinh tiếp các mục còn lại
+            for task in tasks.values():
+                task.cancel()
+    
+    def create_cv(self, name: str, email: str, phone: str, education: str, experience: str, skills: str) -> str:
+        """Tạo CV dựa trên thông tin cung cấp (theo từng mục, xem `agent.cv_builder`)"""
+        if CREATE_CV_MODE == "sections":
+            return "".join(self._create_cv_parts(plan(name, email, phone, education, experience, skills))).rstrip()
+        formatted_prompt = self._create_cv_prompt(name, email, phone, education, experience, skills)
+        return invoke_llm(llm_for("create_cv"), formatted_prompt, cache_namespace="create_cv")
+    
+    def stream_create_cv(self, name: str, email: str, phone: str, education: str, experience: str, skills: str) -> Iterator[str]:
+        """Tạo CV, trả về từng đoạn văn bản (từng mục khi tạo theo mục) ngay khi có"""
+        if CREATE_CV_MODE == "sections":
+            return self._create_cv_parts(plan(name, email, phone, education, experience, skills))
+        formatted_prompt = self._create_cv_prompt(name, email, phone, education, experience, skills)
+        return stream_llm(llm_for("create_cv"), formatted_prompt, cache_namespace="create_cv")
+    
+    async def acreate_cv(self, name: str, email: str, phone: str, education: str, experience: str, skills: str) -> str:
+        """Tạo CV (bất đồng bộ)"""
+        if CREATE_CV_MODE == "sections":
+            parts = plan(name, email, phone, education, experience, skills)
+            return "".join([text async for text in self._acreate_cv_parts(parts)]).rstrip()
+        formatted_prompt = self._create_cv_prompt(name, email, phone, education, experience, skills)
+        return await ainvoke_llm(llm_for("create_cv"), formatted_prompt, cache_namespace="create_cv")
+    
+    def astream_create_cv(self, name: str, email: str, phone: str, education: str, experience: str, skills: str) -> AsyncIterator[str]:
+        """Tạo CV, stream bất đồng bộ từng đoạn văn bản"""
+        if CREATE_CV_MODE == "sections":
+            return self._acreate_cv_parts(plan(name, email, phone, education, experience, skills))
+        formatted_prompt = self._create_cv_prompt(name, email, phone, education, experience, skills)
+        return astream_llm(llm_for("create_cv"), formatted_prompt, cache_namespace="create_cv")
 
 class CompanyModule:
-    def __init__(self):
-        api_key = get_openai_api_key()
-        self.llm = ChatOpenAI(api_key=api_key, model="gpt-4.1", temperature=0.7)
+    def _top_companies_prompt(self, skills: str, industry: str, location: str = "") -> str:
+        """Tạo prompt tìm công ty phù hợp"""
+        return PROMPTS["find_top_companies"].format(
+            skills=skills,
+            industry=industry,
+            location=location
+        )
     
     def find_top_companies(self, skills: str, industry: str, location: str = "") -> str:
         """Tìm và thống kê các công ty phù hợp với kỹ năng và ngành nghề"""
-        prompt = PromptTemplate.from_template(
-            """Bạn là một chuyên gia phân tích thị trường việc làm. Hãy liệt kê và phân tích các công ty hàng đầu phù hợp với thông tin sau:
-            
-            Kỹ năng và kinh nghiệm: {skills}
-            Ngành nghề: {industry}
-            Địa điểm: {location}
-            
-            Hãy liệt kê 10 công ty phù hợp nhất, bao gồm:
-            1. Tên công ty
-            2. Lĩnh vực hoạt động chính
-            3. Quy mô công ty
-            4. Lý do phù hợp với kỹ năng của ứng viên
-            5. Cơ hội phát triển
-            
-            Trả lời bằng tiếng Việt và định dạng rõ ràng."""
-        )
-        
-        formatted_prompt = prompt.format(
+        formatted_prompt = self._top_companies_prompt(skills, industry, location)
+        return invoke_llm(llm_for("find_top_companies"), formatted_prompt, cache_namespace="find_top_companies")
+    
+    def stream_top_companies(self, skills: str, industry: str, location: str = "") -> Iterator[str]:
+        """Tìm công ty phù hợp, trả về từng đoạn văn bản ngay khi model sinh ra"""
+        formatted_prompt = self._top_companies_prompt(skills, industry, location)
+        return stream_llm(llm_for("find_top_companies"), formatted_prompt, cache_namespace="find_top_companies")
+    
+    async def afind_top_companies(self, skills: str, industry: str, location: str = "") -> str:
+        """Tìm công ty phù hợp (bất đồng bộ)"""
+        formatted_prompt = self._top_companies_prompt(skills, industry, location)
+        return await ainvoke_llm(llm_for("find_top_companies"), formatted_prompt, cache_namespace="find_top_companies")
+    
+    def astream_top_companies(self, skills: str, industry: str, location: str = "") -> AsyncIterator[str]:
+        """Tìm công ty phù hợp, stream bất đồng bộ từng đoạn văn bản"""
+        formatted_prompt = self._top_companies_prompt(skills, industry, location)
+        return astream_llm(llm_for("find_top_companies"), formatted_prompt, cache_namespace="find_top_companies")
+    
+    def _top_companies_structured_prompt(self, skills: str, industry: str, location: str = "") -> str:
+        """Tạo prompt tìm công ty cho chế độ trả về dữ liệu có cấu trúc"""
+        return PROMPTS["find_top_companies_structured"].format(
             skills=skills,
             industry=industry,
             location=location
         )
-        
-        response = self.llm.invoke(formatted_prompt)
-        return response.content
+    
+    def find_top_companies_structured(self, skills: str, industry: str, location: str = "") -> Dict[str, Any]:
+        """Tìm công ty phù hợp, trả về dữ liệu dạng {"companies": [...], "summary": ...}"""
+        formatted_prompt = self._top_companies_structured_prompt(skills, industry, location)
+        result = invoke_structured(llm_for("find_top_companies_structured"), formatted_prompt, CompanyResults, cache_namespace="find_top_companies_structured")
+        return result.model_dump()
+    
+    async def afind_top_companies_structured(self, skills: str, industry: str, location: str = "") -> Dict[str, Any]:
+        """Tìm công ty phù hợp, trả về dữ liệu có cấu trúc (bất đồng bộ)"""
+        formatted_prompt = self._top_companies_structured_prompt(skills, industry, location)
+        result = await ainvoke_structured(llm_for("find_top_companies_structured"), formatted_prompt, CompanyResults, cache_namespace="find_top_companies_structured")
+        return result.model_dump()
+    
+    def _stats_narrative_prompt(self, stats: Dict[str, Any], skills: str = "", industry: str = "", location: str = "") -> str:
+        """Tạo prompt nhận xét số liệu thống kê công ty (số liệu lấy từ `agent.company_data`)"""
+        return PROMPTS["company_stats_narrative"].format(
+            skills=skills,
+            industry=industry,
+            location=location,
+            stats=describe_company_stats(stats)
+        )
+    
+    def narrate_stats(self, stats: Dict[str, Any], skills: str = "", industry: str = "", location: str = "") -> str:
+        """Viết đoạn nhận xét ngắn cho số liệu thống kê công ty"""
+        formatted_prompt = self._stats_narrative_prompt(stats, skills, industry, location)
+        return invoke_llm(llm_for("company_stats_narrative"), formatted_prompt, cache_namespace="company_stats_narrative")
+    
+    def stream_narrate_stats(self, stats: Dict[str, Any], skills: str = "", industry: str = "", location: str = "") -> Iterator[str]:
+        """Nhận xét số liệu thống kê công ty, trả về từng đoạn văn bản ngay khi model sinh ra"""
+        formatted_prompt = self._stats_narrative_prompt(stats, skills, industry, location)
+        return stream_llm(llm_for("company_stats_narrative"), formatted_prompt, cache_namespace="company_stats_narrative")
+    
+    async def anarrate_stats(self, stats: Dict[str, Any], skills: str = "", industry: str = "", location: str = "") -> str:
+        """Nhận xét số liệu thống kê công ty (bất đồng bộ)"""
+        formatted_prompt = self._stats_narrative_prompt(stats, skills, industry, location)
+        return await ainvoke_llm(llm_for("company_stats_narrative"), formatted_prompt, cache_namespace="company_stats_narrative")
+    
+    def astream_narrate_stats(self, stats: Dict[str, Any], skills: str = "", industry: str = "", location: str = "") -> AsyncIterator[str]:
+        """Nhận xét số liệu thống kê công ty, stream bất đồng bộ từng đoạn văn bản"""
+        formatted_prompt = self._stats_narrative_prompt(stats, skills, industry, location)
+        return astream_llm(llm_for("company_stats_narrative"), formatted_prompt, cache_namespace="company_stats_narrative")
 
 # Định nghĩa các hàm xử lý cho đồ thị LangGraph
+@traced("route_to_module")
 def route_to_module(state: AgentState) -> List[str]:
     """Định tuyến đến module xử lý phù hợp dựa trên next_step"""
     next_step = state["next_step"].strip().lower()
@@ -229,6 +567,7 @@ def route_to_module(state: AgentState) -> List[str]:
         return ["find_jobs"]  # Default fallback
 
 def _build_graph(self):
+    from langgraph.graph import StateGraph, END
     # Khởi tạo đồ thị
     workflow = StateGraph(AgentState)
     
@@ -266,59 +605,129 @@ def _build_graph(self):
     # Biên dịch đồ thị
     return workflow.compile()
 
+def _route_prompt(query: str) -> str:
+    """Tạo prompt xác định chức năng cần thực hiện"""
+    return PROMPTS["route"].format(query=query)
+
+def _route_locally(state: AgentState) -> bool:
+    """Định tuyến bằng bộ phân loại cục bộ nếu đủ chắc chắn, không cần gọi LLM"""
+    if not LOCAL_ROUTER_ENABLED:
+        return False
+    intent = route_locally(state["query"])
+    if intent is None:
+        return False
+    state["next_step"] = intent
+    state["context"]["routed_by"] = "local"
+    return True
+
+def _fused_route_prompt(query: str) -> str:
+    """Tạo prompt xác định chức năng và trích xuất tham số trong cùng một lần gọi"""
+    return PROMPTS["route_fused"].format(query=query)
+
+def _apply_args(state: AgentState, args: Optional[BaseModel]) -> AgentState:
+    """Ghi tham số đã trích xuất; None thì node thực thi tự trích xuất như chế độ two_step"""
+    if args is not None:
+        state["context"]["args"] = args.model_dump()
+    return state
+
+def _apply_routed_query(state: AgentState, routed: RoutedQuery) -> AgentState:
+    """Ghi chức năng và tham số đã được validate vào trạng thái"""
+    state["next_step"] = routed.route
+    return _apply_args(state, getattr(routed, routed.route))
+
+def _extract_args_prompt(query: str) -> str:
+    """Tạo prompt trích xuất tham số khi chức năng đã biết"""
+    return PROMPTS["extract_args"].format(query=query)
+
+def _extract_local_args(state: AgentState) -> Optional[BaseModel]:
+    """Trích xuất tham số theo schema của chức năng đã định tuyến cục bộ (một lời gọi)"""
+    llm = llm_for("node.process_query")
+    try:
+        return invoke_structured(llm, _extract_args_prompt(state["query"]), ROUTE_ARGS[state["next_step"]])
+    except LLMOverloaded:
+        raise
+    except Exception as e:
+        print(f"Lỗi khi trích xuất tham số: {e}")
+        return None
+
+async def _aextract_local_args(state: AgentState) -> Optional[BaseModel]:
+    """Trích xuất tham số theo schema của chức năng đã định tuyến cục bộ (bất đồng bộ)"""
+    llm = llm_for("node.process_query")
+    try:
+        return await ainvoke_structured(llm, _extract_args_prompt(state["query"]), ROUTE_ARGS[state["next_step"]])
+    except LLMOverloaded:
+        raise
+    except Exception as e:
+        print(f"Lỗi khi trích xuất tham số: {e}")
+        return None
+
+def process_query_fused(state: AgentState) -> AgentState:
+    """Xác định bước tiếp theo và tham số của nó chỉ với một lời gọi LLM"""
+    if _route_locally(state):
+        # Đã biết chức năng: lời gọi duy nhất chỉ trích xuất tham số của chức năng đó
+        return _apply_args(state, _extract_local_args(state))
+    
+    llm = llm_for("node.process_query")
+    try:
+        routed = invoke_structured(llm, _fused_route_prompt(state["query"]), RoutedQuery)
+    except LLMOverloaded:
+        raise
+    except Exception as e:
+        # Không nhận được kết quả hợp lệ: quay về cách định tuyến hai bước
+        print(f"Lỗi khi định tuyến một lần gọi: {e}")
+        return process_query(state)
+    return _apply_routed_query(state, routed)
+
+async def aprocess_query_fused(state: AgentState) -> AgentState:
+    """Xác định bước tiếp theo và tham số của nó chỉ với một lời gọi LLM (bất đồng bộ)"""
+    if _route_locally(state):
+        return _apply_args(state, await _aextract_local_args(state))
+    
+    llm = llm_for("node.process_query")
+    try:
+        routed = await ainvoke_structured(llm, _fused_route_prompt(state["query"]), RoutedQuery)
+    except LLMOverloaded:
+        raise
+    except Exception as e:
+        print(f"Lỗi khi định tuyến một lần gọi: {e}")
+        return await aprocess_query(state)
+    return _apply_routed_query(state, routed)
+
+def _routed_args(state: AgentState) -> Optional[Dict[str, Any]]:
+    """Tham số đã được trích xuất sẵn ở bước định tuyến (chế độ fused), nếu có"""
+    return state["context"].get("args")
+
 def process_query(state: AgentState) -> AgentState:
     """Xử lý yêu cầu ban đầu và xác định bước tiếp theo"""
-    query = state["query"]
-    api_key = get_openai_api_key()
-    llm = ChatOpenAI(api_key=api_key, model="gpt-4.1", temperature=0.2)
-    
-    prompt = PromptTemplate.from_template(
-        """Dựa vào yêu cầu của người dùng, hãy xác định chức năng cần thực hiện:
-        
-        Yêu cầu: {query}
-        
-        Trả về một trong các giá trị sau:
-        - find_jobs: Tìm kiếm việc làm
-        - write_email: Viết email ứng tuyển
-        - evaluate_cv: Đánh giá CV
-        - find_companies: Tìm công ty phù hợp
-        - create_cv: Tạo CV mới"""
-    )
+    if _route_locally(state):
+        return state
     
-    formatted_prompt = prompt.format(query=query)
-    response = llm.invoke(formatted_prompt)
+    llm = llm_for("node.process_query")
+    response = invoke_llm(llm, _route_prompt(state["query"]))
     
     # Xác định bước tiếp theo
-    state["next_step"] = response.content.strip()
+    state["next_step"] = response.strip()
     return state
 
-def execute_find_jobs(state: AgentState) -> AgentState:
-    """Thực hiện chức năng tìm việc"""
-    job_module = JobModule()
-    query = state["query"]
+async def aprocess_query(state: AgentState) -> AgentState:
+    """Xử lý yêu cầu ban đầu và xác định bước tiếp theo (bất đồng bộ)"""
+    if _route_locally(state):
+        return state
     
-    # Phân tích yêu cầu để trích xuất thông tin
-    api_key = get_openai_api_key()
-    llm = ChatOpenAI(api_key=api_key, model="gpt-4.1", temperature=0.2)
-    extract_prompt = PromptTemplate.from_template(
-        """Từ yêu cầu của người dùng, hãy trích xuất các thông tin sau về công việc cần tìm:
-        
-        Yêu cầu: {query}
-        
-        Trả về kết quả theo định dạng JSON:
-        {{
-            "job_description": "Mô tả công việc",
-            "salary": "Mức lương mong muốn (nếu có)",
-            "location": "Địa điểm làm việc (nếu có)",
-            "experience": "Số năm kinh nghiệm (nếu có, chỉ số)"
-        }}"""
-    )
-    
-    formatted_prompt = extract_prompt.format(query=query)
-    extract_response = llm.invoke(formatted_prompt)
+    llm = llm_for("node.process_query")
+    response = await ainvoke_llm(llm, _route_prompt(state["query"]))
     
+    state["next_step"] = response.strip()
+    return state
+
+def _find_jobs_extract_prompt(query: str) -> str:
+    """Tạo prompt trích xuất thông tin tìm việc từ yêu cầu"""
+    return PROMPTS["extract.find_jobs"].format(query=query)
+
+def _find_jobs_args(extract_response: str, query: str) -> Dict[str, Any]:
+    """Chuyển kết quả trích xuất thành tham số cho JobModule.find_jobs"""
     # Phân tích kết quả JSON sử dụng hàm từ utils
-    extracted_info = extract_json_from_text(extract_response.content)
+    extracted_info = extract_json_from_text(extract_response)
     if not extracted_info:
         extracted_info = {
             "job_description": query,
@@ -327,44 +736,58 @@ def execute_find_jobs(state: AgentState) -> AgentState:
             "experience": 0
         }
     
-    # Thực hiện tìm kiếm công việc
-    response = job_module.find_jobs(
-        job_description=extracted_info.get("job_description", query),
-        salary=extracted_info.get("salary", ""),
-        location=extracted_info.get("location", ""),
-        experience=int(extracted_info.get("experience", 0))
-    )
+    return {
+        "job_description": extracted_info.get("job_description", query),
+        "salary": extracted_info.get("salary", ""),
+        "location": extracted_info.get("location", ""),
+        "experience": int(extracted_info.get("experience", 0))
+    }
+
+def execute_find_jobs(state: AgentState) -> AgentState:
+    """Thực hiện chức năng tìm việc"""
+    job_module = get_module(JobModule)
+    query = state["query"]
+    
+    # Phân tích yêu cầu để trích xuất thông tin (bỏ qua nếu đã có từ bước định tuyến)
+    args = _routed_args(state)
+    if args is None:
+        llm = llm_for("node.find_jobs")
+        extract_response = invoke_llm(llm, _find_jobs_extract_prompt(query))
+        args = _find_jobs_args(extract_response, query)
     
-    state["response"] = response
+    # Thực hiện tìm kiếm công việc
+    if STRUCTURED_OUTPUT:
+        state["response"] = format_job_results(job_module.find_jobs_structured(**args))
+    else:
+        state["response"] = job_module.find_jobs(**args)
     return state
 
-def execute_write_email(state: AgentState) -> AgentState:
-    """Thực hiện chức năng viết email ứng tuyển"""
-    email_module = EmailModule()
+async def aexecute_find_jobs(state: AgentState) -> AgentState:
+    """Thực hiện chức năng tìm việc (bất đồng bộ)"""
+    job_module = get_module(JobModule)
     query = state["query"]
     
-    # Phân tích yêu cầu để trích xuất thông tin
-    llm = ChatOpenAI(model="gpt-4.1", temperature=0.2)
-    extract_prompt = PromptTemplate.from_template(
-        """Từ yêu cầu của người dùng, hãy trích xuất các thông tin sau về email ứng tuyển:
-        
-        Yêu cầu: {query}
-        
-        Trả về kết quả theo định dạng JSON:
-        {{
-            "job_title": "Vị trí công việc",
-            "company": "Tên công ty",
-            "skills": "Kỹ năng và kinh nghiệm của ứng viên"
-        }}"""
-    )
-    
-    formatted_prompt = extract_prompt.format(query=query)
-    extract_response = llm.invoke(formatted_prompt)
+    args = _routed_args(state)
+    if args is None:
+        llm = llm_for("node.find_jobs")
+        extract_response = await ainvoke_llm(llm, _find_jobs_extract_prompt(query))
+        args = _find_jobs_args(extract_response, query)
     
+    if STRUCTURED_OUTPUT:
+        state["response"] = format_job_results(await job_module.afind_jobs_structured(**args))
+    else:
+        state["response"] = await job_module.afind_jobs(**args)
+    return state
+
+def _write_email_extract_prompt(query: str) -> str:
+    """Tạo prompt trích xuất thông tin email ứng tuyển từ yêu cầu"""
+    return PROMPTS["extract.write_email"].format(query=query)
+
+def _write_email_args(extract_response: str, query: str) -> Dict[str, Any]:
+    """Chuyển kết quả trích xuất thành tham số cho EmailModule.write_application_email"""
     # Phân tích kết quả JSON (đơn giản hóa)
-    import json
     try:
-        extracted_info = json.loads(extract_response.content)
+        extracted_info = json.loads(extract_response)
     except:
         extracted_info = {
             "job_title": "Vị trí ứng tuyển",
@@ -372,84 +795,101 @@ def execute_write_email(state: AgentState) -> AgentState:
             "skills": query
         }
     
-    # Thực hiện viết email
-    response = email_module.write_application_email(
-        job_title=extracted_info.get("job_title", "Vị trí ứng tuyển"),
-        company=extracted_info.get("company", "Công ty"),
-        skills=extracted_info.get("skills", query)
-    )
+    return {
+        "job_title": extracted_info.get("job_title", "Vị trí ứng tuyển"),
+        "company": extracted_info.get("company", "Công ty"),
+        "skills": extracted_info.get("skills", query)
+    }
+
+def execute_write_email(state: AgentState) -> AgentState:
+    """Thực hiện chức năng viết email ứng tuyển"""
+    email_module = get_module(EmailModule)
+    query = state["query"]
     
-    state["response"] = response
+    # Phân tích yêu cầu để trích xuất thông tin (bỏ qua nếu đã có từ bước định tuyến)
+    args = _routed_args(state)
+    if args is None:
+        llm = llm_for("node.write_email")
+        extract_response = invoke_llm(llm, _write_email_extract_prompt(query))
+        args = _write_email_args(extract_response, query)
+    
+    # Thực hiện viết email
+    state["response"] = email_module.write_application_email(**args)
     return state
 
-def execute_evaluate_cv(state: AgentState) -> AgentState:
-    """Thực hiện chức năng đánh giá CV"""
-    cv_module = CVModule()
+async def aexecute_write_email(state: AgentState) -> AgentState:
+    """Thực hiện chức năng viết email ứng tuyển (bất đồng bộ)"""
+    email_module = get_module(EmailModule)
     query = state["query"]
     
-    # Phân tích yêu cầu để trích xuất thông tin
-    llm = ChatOpenAI(model="gpt-4.1", temperature=0.2)
-    extract_prompt = PromptTemplate.from_template(
-        """Từ yêu cầu của người dùng, hãy trích xuất các thông tin sau về CV cần đánh giá:
-        
-        Yêu cầu: {query}
-        
-        Trả về kết quả theo định dạng JSON:
-        {{
-            "cv_text": "Nội dung CV (nếu có)",
-            "job_description": "Mô tả công việc ứng tuyển (nếu có)"
-        }}"""
-    )
-    
-    formatted_prompt = extract_prompt.format(query=query)
-    extract_response = llm.invoke(formatted_prompt)
+    args = _routed_args(state)
+    if args is None:
+        llm = llm_for("node.write_email")
+        extract_response = await ainvoke_llm(llm, _write_email_extract_prompt(query))
+        args = _write_email_args(extract_response, query)
     
+    state["response"] = await email_module.awrite_application_email(**args)
+    return state
+
+def _evaluate_cv_extract_prompt(query: str) -> str:
+    """Tạo prompt trích xuất thông tin CV cần đánh giá từ yêu cầu"""
+    return PROMPTS["extract.evaluate_cv"].format(query=query)
+
+def _evaluate_cv_args(extract_response: str, query: str) -> Dict[str, Any]:
+    """Chuyển kết quả trích xuất thành tham số cho CVModule.evaluate_cv"""
     # Phân tích kết quả JSON (đơn giản hóa)
-    import json
     try:
-        extracted_info = json.loads(extract_response.content)
+        extracted_info = json.loads(extract_response)
     except:
         extracted_info = {
             "cv_text": query,
             "job_description": ""
         }
     
-    # Thực hiện đánh giá CV
-    response = cv_module.evaluate_cv(
-        cv_text=extracted_info.get("cv_text", query),
-        job_description=extracted_info.get("job_description", "")
-    )
+    return {
+        "cv_text": extracted_info.get("cv_text", query),
+        "job_description": extracted_info.get("job_description", "")
+    }
+
+def execute_evaluate_cv(state: AgentState) -> AgentState:
+    """Thực hiện chức năng đánh giá CV"""
+    cv_module = get_module(CVModule)
+    query = state["query"]
     
-    state["response"] = response
+    # Phân tích yêu cầu để trích xuất thông tin (bỏ qua nếu đã có từ bước định tuyến)
+    args = _routed_args(state)
+    if args is None:
+        llm = llm_for("node.evaluate_cv")
+        extract_response = invoke_llm(llm, _evaluate_cv_extract_prompt(query))
+        args = _evaluate_cv_args(extract_response, query)
+    
+    # Thực hiện đánh giá CV
+    state["response"] = cv_module.evaluate_cv(**args)
     return state
 
-def execute_find_companies(state: AgentState) -> AgentState:
-    """Thực hiện chức năng tìm công ty phù hợp"""
-    company_module = CompanyModule()
+async def aexecute_evaluate_cv(state: AgentState) -> AgentState:
+    """Thực hiện chức năng đánh giá CV (bất đồng bộ)"""
+    cv_module = get_module(CVModule)
     query = state["query"]
     
-    # Phân tích yêu cầu để trích xuất thông tin
-    llm = ChatOpenAI(model="gpt-4.1", temperature=0.2)
-    extract_prompt = PromptTemplate.from_template(
-        """Từ yêu cầu của người dùng, hãy trích xuất các thông tin sau về công ty cần tìm:
-        
-        Yêu cầu: {query}
-        
-        Trả về kết quả theo định dạng JSON:
-        {{
-            "skills": "Kỹ năng và kinh nghiệm của ứng viên",
-            "industry": "Ngành nghề quan tâm",
-            "location": "Địa điểm làm việc (nếu có)"
-        }}"""
-    )
-    
-    formatted_prompt = extract_prompt.format(query=query)
-    extract_response = llm.invoke(formatted_prompt)
+    args = _routed_args(state)
+    if args is None:
+        llm = llm_for("node.evaluate_cv")
+        extract_response = await ainvoke_llm(llm, _evaluate_cv_extract_prompt(query))
+        args = _evaluate_cv_args(extract_response, query)
     
+    state["response"] = await cv_module.aevaluate_cv(**args)
+    return state
+
+def _find_companies_extract_prompt(query: str) -> str:
+    """Tạo prompt trích xuất thông tin công ty cần tìm từ yêu cầu"""
+    return PROMPTS["extract.find_companies"].format(query=query)
+
+def _find_companies_args(extract_response: str, query: str) -> Dict[str, Any]:
+    """Chuyển kết quả trích xuất thành tham số cho CompanyModule.find_top_companies"""
     # Phân tích kết quả JSON (đơn giản hóa)
-    import json
     try:
-        extracted_info = json.loads(extract_response.content)
+        extracted_info = json.loads(extract_response)
     except:
         extracted_info = {
             "skills": query,
@@ -457,46 +897,57 @@ def execute_find_companies(state: AgentState) -> AgentState:
             "location": ""
         }
     
-    # Thực hiện tìm công ty
-    response = company_module.find_top_companies(
-        skills=extracted_info.get("skills", query),
-        industry=extracted_info.get("industry", "Công nghệ thông tin"),
-        location=extracted_info.get("location", "")
-    )
+    return {
+        "skills": extracted_info.get("skills", query),
+        "industry": extracted_info.get("industry", "Công nghệ thông tin"),
+        "location": extracted_info.get("location", "")
+    }
+
+def execute_find_companies(state: AgentState) -> AgentState:
+    """Thực hiện chức năng tìm công ty phù hợp"""
+    company_module = get_module(CompanyModule)
+    query = state["query"]
     
-    state["response"] = response
+    # Phân tích yêu cầu để trích xuất thông tin (bỏ qua nếu đã có từ bước định tuyến)
+    args = _routed_args(state)
+    if args is None:
+        llm = llm_for("node.find_companies")
+        extract_response = invoke_llm(llm, _find_companies_extract_prompt(query))
+        args = _find_companies_args(extract_response, query)
+    
+    # Thực hiện tìm công ty
+    if STRUCTURED_OUTPUT:
+        state["response"] = format_company_results(company_module.find_top_companies_structured(**args))
+    else:
+        state["response"] = company_module.find_top_companies(**args)
     return state
 
-def execute_create_cv(state: AgentState) -> AgentState:
-    """Thực hiện chức năng tạo CV"""
-    cv_module = CVModule()
+async def aexecute_find_companies(state: AgentState) -> AgentState:
+    """Thực hiện chức năng tìm công ty phù hợp (bất đồng bộ)"""
+    company_module = get_module(CompanyModule)
     query = state["query"]
     
-    # Phân tích yêu cầu để trích xuất thông tin
-    llm = ChatOpenAI(model="gpt-4.1", temperature=0.2)
-    extract_prompt = PromptTemplate.from_template(
-        """Từ yêu cầu của người dùng, hãy trích xuất các thông tin sau để tạo CV:
-        
-        Yêu cầu: {query}
-        
-        Trả về kết quả theo định dạng JSON:
-        {{
-            "name": "Họ và tên",
-            "email": "Email",
-            "phone": "Số điện thoại (nếu có)",
-            "education": "Học vấn (nếu có)",
-            "experience": "Kinh nghiệm làm việc",
-            "skills": "Kỹ năng"
-        }}"""
-    )
-    
-    formatted_prompt = extract_prompt.format(query=query)
-    extract_response = llm.invoke(formatted_prompt)
+    args = _routed_args(state)
+    if args is None:
+        llm = llm_for("node.find_companies")
+        extract_response = await ainvoke_llm(llm, _find_companies_extract_prompt(query))
+        args = _find_companies_args(extract_response, query)
     
+    if STRUCTURED_OUTPUT:
+        state["response"] = format_company_results(await company_module.afind_top_companies_structured(**args))
+    else:
+        state["response"] = await company_module.afind_top_companies(**args)
+    return state
+
+def _create_cv_extract_prompt(query: str) -> str:
+    """Tạo prompt trích xuất thông tin tạo CV từ yêu cầu"""
+    return PROMPTS["extract.create_cv"].format(query=query)
+
+def _create_cv_args(extract_response: str, query: str) -> Dict[str, Any]:
+    """Chuyển kết quả trích xuất thành tham số cho CVModule.create_cv"""
     # Phân tích kết quả JSON (đơn giản hóa)
-    import json
     try:
-        extracted_info = json.loads(extract_response.content)
+        extracted_info = json.loads(extract_response)
     except:
         extracted_info = {
             "name": "Nguyễn Văn A",
@@ -507,42 +958,77 @@ def execute_create_cv(state: AgentState) -> AgentState:
             "skills": ""
         }
     
+    return {
+        "name": extracted_info.get("name", "Nguyễn Văn A"),
+        "email": extracted_info.get("email", "example@email.com"),
+        "phone": extracted_info.get("phone", ""),
+        "education": extracted_info.get("education", ""),
+        "experience": extracted_info.get("experience", query),
+        "skills": extracted_info.get("skills", "")
+    }
+
+def execute_create_cv(state: AgentState) -> AgentState:
+    """Thực hiện chức năng tạo CV"""
+    cv_module = get_module(CVModule)
+    query = state["query"]
+    
+    # Phân tích yêu cầu để trích xuất thông tin (bỏ qua nếu đã có từ bước định tuyến)
+    args = _routed_args(state)
+    if args is None:
+        llm = llm_for("node.create_cv")
+        extract_response = invoke_llm(llm, _create_cv_extract_prompt(query))
+        args = _create_cv_args(extract_response, query)
+    
     # Thực hiện tạo CV
-    response = cv_module.create_cv(
-        name=extracted_info.get("name", "Nguyễn Văn A"),
-        email=extracted_info.get("email", "example@email.com"),
-        phone=extracted_info.get("phone", ""),
-        education=extracted_info.get("education", ""),
-        experience=extracted_info.get("experience", query),
-        skills=extracted_info.get("skills", "")
-    )
+    state["response"] = cv_module.create_cv(**args)
+    return state
+
+async def aexecute_create_cv(state: AgentState) -> AgentState:
+    """Thực hiện chức năng tạo CV (bất đồng bộ)"""
+    cv_module = get_module(CVModule)
+    query = state["query"]
+    
+    args = _routed_args(state)
+    if args is None:
+        llm = llm_for("node.create_cv")
+        extract_response = await ainvoke_llm(llm, _create_cv_extract_prompt(query))
+        args = _create_cv_args(extract_response, query)
     
-    state["response"] = response
+    state["response"] = await cv_module.acreate_cv(**args)
     return state
 
 # Xây dựng đồ thị LangGraph
 class JobAssistantAgent:
-    def __init__(self):
+    def __init__(self, routing_mode: Optional[str] = None):
+        # "fused": định tuyến và trích xuất tham số trong một lời gọi; "two_step": hai lời gọi riêng
+        self.routing_mode = routing_mode or os.getenv("AGENT_ROUTING_MODE", "fused")
+        
         # Khởi tạo các module
-        self.job_module = JobModule()
-        self.email_module = EmailModule()
-        self.cv_module = CVModule()
-        self.company_module = CompanyModule()
+        self.job_module = get_module(JobModule)
+        self.email_module = get_module(EmailModule)
+        self.cv_module = get_module(CVModule)
+        self.company_module = get_module(CompanyModule)
         
         # Xây dựng đồ thị
         self.workflow = self._build_graph()
     
     def _build_graph(self):
+        from langchain_core.runnables import RunnableLambda
+        from langgraph.graph import StateGraph, END
+        
         # Khởi tạo đồ thị
         workflow = StateGraph(AgentState)
         
-        # Thêm các node
-        workflow.add_node("process_query", process_query)
-        workflow.add_node("find_jobs", execute_find_jobs)
-        workflow.add_node("write_email", execute_write_email)
-        workflow.add_node("evaluate_cv", execute_evaluate_cv)
-        workflow.add_node("find_companies", execute_find_companies)
-        workflow.add_node("create_cv", execute_create_cv)
+        # Thêm các node (mỗi node có cả bản đồng bộ và bất đồng bộ để dùng được với invoke/ainvoke)
+        if self.routing_mode == "fused":
+            workflow.add_node("process_query", RunnableLambda(*instrument_node("process_query", process_query_fused, aprocess_query_fused)))
+        else:
+            workflow.add_node("process_query", RunnableLambda(*instrument_node("process_query", process_query, aprocess_query)))
+        workflow.add_node("find_jobs", RunnableLambda(*instrument_node("execute_find_jobs", execute_find_jobs, aexecute_find_jobs)))
+        workflow.add_node("write_email", RunnableLambda(*instrument_node("execute_write_email", execute_write_email, aexecute_write_email)))
+        workflow.add_node("evaluate_cv", RunnableLambda(*instrument_node("execute_evaluate_cv", execute_evaluate_cv, aexecute_evaluate_cv)))
+        workflow.add_node("find_companies", RunnableLambda(*instrument_node("execute_find_companies", execute_find_companies, aexecute_find_companies)))
+        workflow.add_node("create_cv", RunnableLambda(*instrument_node("execute_create_cv", execute_create_cv, aexecute_create_cv)))
         
         # Thêm các cạnh với conditional routing
         workflow.add_conditional_edges(
@@ -592,6 +1078,21 @@ class JobAssistantAgent:
     
     def process(self, query: str) -> str:
         """Xử lý yêu cầu từ người dùng thông qua đồ thị LangGraph"""
+        # Dùng lại câu trả lời của câu hỏi tương tự nếu có
+        semantic_cache = get_semantic_cache()
+        vector = None
+        if semantic_cache is not None:
+            try:
+                with span("semantic_cache.lookup") as lookup:
+                    vector = semantic_cache.embed(query)
+                    cached = semantic_cache.lookup(query, vector)
+                    lookup.set(hit=cached is not None)
+                if cached is not None:
+                    return cached
+            except Exception as e:
+                print(f"Lỗi khi tra cứu cache ngữ nghĩa: {e}")
+                vector = None
+        
         # Khởi tạo trạng thái
         state = {
             "query": query,
@@ -601,7 +1102,42 @@ class JobAssistantAgent:
         }
         
         # Thực thi đồ thị
-        result = self.workflow.invoke(state)
+        with span("workflow.invoke"):
+            result = self.workflow.invoke(state)
+        
+        if vector is not None:
+            semantic_cache.store(query, vector, result["response"])
         
         # Trả về kết quả
-        return result["response"]
\ No newline at end of file
+        return result["response"]
+    
+    async def aprocess(self, query: str) -> str:
+        """Xử lý yêu cầu từ người dùng thông qua đồ thị LangGraph (bất đồng bộ)"""
+        semantic_cache = get_semantic_cache()
+        vector = None
+        if semantic_cache is not None:
+            try:
+                with span("semantic_cache.lookup") as lookup:
+                    vector = await semantic_cache.aembed(query)
+                    cached = semantic_cache.lookup(query, vector)
+                    lookup.set(hit=cached is not None)
+                if cached is not None:
+                    return cached
+            except Exception as e:
+                print(f"Lỗi khi tra cứu cache ngữ nghĩa: {e}")
+                vector = None
+        
+        state = {
+            "query": query,
+            "context": {},
+            "response": "",
+            "next_step": ""
+        }
+        
+        with span("workflow.invoke"):
+            result = await self.workflow.ainvoke(state)
+        
+        if vector is not None:
+            semantic_cache.store(query, vector, result["response"])
+        
+        return result["response"]
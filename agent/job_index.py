@@ -0,0 +1,554 @@
+"""Chỉ mục tin tuyển dụng trên đĩa (BM25) cung cấp ứng viên cho `JobModule.find_jobs`.
+
+Tin tuyển dụng (JSONL/CSV) được tách từ tiếng Việt đã bỏ dấu (từ đơn và cặp từ
+liền nhau) rồi ghi thành các segment bất biến trong `JOB_INDEX_DIR`. Mỗi segment
+gồm các mảng NumPy (`.npy`) được mở bằng memory-map nên nạp chỉ mục gần như tức
+thì và các worker dùng chung page cache:
+
+- `term_hash` / `term_offsets`: từ điển (hash 64 bit của từ, đã sắp xếp) trỏ vào
+  danh sách posting `post_docs` / `post_impact` (phần tf của BM25 đã tính sẵn
+  theo độ dài tin, nên khi tìm kiếm chỉ còn nhân với idf)
+- `doc_len`, `salary_min`, `salary_max`, `experience`, `location`: dữ liệu cho
+  bộ lọc; `deleted` đánh dấu tin đã được thay bằng bản mới hơn
+
+Các từ quá phổ biến (xuất hiện trong hơn `JOB_INDEX_COMMON_RATIO` số tin) không
+dùng để chọn ứng viên mà chỉ cộng điểm cho các tin đã khớp từ hiếm hơn (như
+common-terms query của Lucene), nhờ vậy truy vấn trên hàng triệu tin vẫn chỉ mất
+vài mili giây.
+- `docs.jsonl` + `doc_offsets`: nội dung gốc của tin, đọc theo vị trí
+
+Nạp thêm dữ liệu chỉ tạo segment mới (tin trùng id ở segment cũ bị đánh dấu
+xóa), `compact` gộp tất cả về một segment.
+
+    python -m agent.job_index ingest jobs.jsonl jobs.csv
+    python -m agent.job_index search "lập trình python" --location "Hà Nội" --salary "20 triệu"
+    python -m agent.job_index compact
+    python -m agent.job_index stats
+"""
+import argparse
+import csv
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+from array import array
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from agent.utils import fold_accents, tokenize_vi
+
+INDEX_DIR = os.getenv("JOB_INDEX_DIR", os.path.join("data", "job_index"))
+TOP_K = int(os.getenv("JOB_INDEX_TOP_K", "10"))
+SEGMENT_SIZE = int(os.getenv("JOB_INDEX_SEGMENT_SIZE", "200000"))
+COMMON_RATIO = float(os.getenv("JOB_INDEX_COMMON_RATIO", "0.05"))
+
+# Tham số BM25
+K1 = 1.2
+B = 0.75
+
+# Trọng số lặp lại của các trường khi đánh chỉ mục (tiêu đề quan trọng hơn mô tả)
+FIELD_WEIGHTS = {"title": 3, "skills": 2, "company": 1, "requirements": 1, "description": 1}
+
+# Tên cột thường gặp trong các file export -> tên trường chuẩn
+FIELD_ALIASES = {
+    "id": ("id", "job_id", "url", "link"),
+    "title": ("title", "job_title", "position", "ten_vi_tri"),
+    "company": ("company", "company_name", "cong_ty"),
+    "location": ("location", "city", "address", "dia_diem"),
+    "salary": ("salary", "salary_text", "muc_luong"),
+    "experience": ("experience", "years_of_experience", "kinh_nghiem"),
+    "skills": ("skills", "tags", "ky_nang"),
+    "requirements": ("requirements", "job_requirements", "yeu_cau"),
+    "description": ("description", "job_description", "mo_ta"),
+    "url": ("url", "link"),
+}
+
+# Các cách viết khác nhau của cùng một địa điểm (đã bỏ dấu)
+LOCATION_ALIASES = {
+    "hcm": "ho chi minh", "tphcm": "ho chi minh", "tp hcm": "ho chi minh",
+    "sai gon": "ho chi minh", "saigon": "ho chi minh", "hn": "ha noi", "hanoi": "ha noi",
+}
+
+MANIFEST = "manifest.json"
+
+
+def analyze(text: str) -> List[str]:
+    """Tách văn bản thành các từ đơn và cặp từ liền nhau (đã bỏ dấu)"""
+    tokens = tokenize_vi(text)
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+def term_hash(term: str) -> int:
+    """Hash 64 bit ổn định của một từ"""
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def normalize_location(text: str) -> str:
+    """Chuẩn hóa địa điểm để so khớp ("TP.HCM" -> "ho chi minh")"""
+    folded = " ".join(tokenize_vi(text))
+    for alias, canonical in LOCATION_ALIASES.items():
+        folded = re.sub(rf"\b{alias}\b", canonical, folded)
+    return " ".join(re.sub(r"\b(tp|thanh pho)\b", " ", folded).split())
+
+
+def parse_salary(text: Any) -> Tuple[float, float]:
+    """Khoảng lương (triệu VND) từ văn bản tự do, NaN nếu không rõ ("15-25 triệu", "1000$", "Thỏa thuận")"""
+    if text is None or text == "":
+        return math.nan, math.nan
+    if isinstance(text, (int, float)):
+        value = float(text) / 1e6 if text > 10000 else float(text)
+        return value, value
+    folded = fold_accents(str(text))
+    # "." và "," trước đúng ba chữ số là phân cách hàng nghìn ("2,000", "15.000.000"), còn lại là phần thập phân
+    digits = re.sub(r"(?<=\d)[.,](?=\d{3}\b)", "", folded)
+    numbers = [float(n.replace(",", ".")) for n in re.findall(r"\d+(?:[.,]\d+)?", digits)]
+    if not numbers:
+        return math.nan, math.nan
+    if "usd" in folded or "$" in folded:
+        numbers = [n * 0.025 for n in numbers]
+    else:
+        numbers = [n / 1e6 if n > 10000 else n for n in numbers]
+    low, high = min(numbers[:2]), max(numbers[:2])
+    if re.search(r"\b(tren|tu|from)\b|>", folded) and len(numbers) == 1:
+        high = math.inf
+    elif re.search(r"\b(duoi|toi da|toi|len den|up to)\b|<", folded) and len(numbers) == 1:
+        low = 0.0
+    return low, high
+
+
+def parse_experience(text: Any) -> float:
+    """Số năm kinh nghiệm tối thiểu, NaN nếu không rõ"""
+    if text is None or text == "":
+        return math.nan
+    if isinstance(text, (int, float)):
+        return float(text)
+    folded = fold_accents(str(text))
+    if re.search(r"khong yeu cau|chua co|fresher|intern|thuc tap", folded):
+        return 0.0
+    match = re.search(r"\d+(?:[.,]\d+)?", folded)
+    return float(match.group().replace(",", ".")) if match else math.nan
+
+
+def _field(record: Dict[str, Any], name: str) -> Any:
+    """Giá trị của trường chuẩn `name` theo các tên cột thường gặp"""
+    for alias in FIELD_ALIASES.get(name, (name,)):
+        value = record.get(alias)
+        if value not in (None, ""):
+            return value
+    return ""
+
+
+def normalize_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Đưa một dòng export về các trường chuẩn"""
+    posting = {name: _field(record, name) for name in FIELD_ALIASES}
+    if isinstance(posting["skills"], list):
+        posting["skills"] = ", ".join(map(str, posting["skills"]))
+    if not posting["id"]:
+        key = "|".join(str(posting[name]) for name in ("title", "company", "location", "description"))
+        posting["id"] = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    posting["id"] = str(posting["id"])
+
+    salary_min, salary_max = parse_salary(posting["salary"])
+    if record.get("salary_min") not in (None, ""):
+        salary_min = parse_salary(record["salary_min"])[0]
+    if record.get("salary_max") not in (None, ""):
+        salary_max = parse_salary(record["salary_max"])[1]
+    posting["salary_min"], posting["salary_max"] = salary_min, salary_max
+    posting["experience_min"] = parse_experience(posting["experience"])
+    return posting
+
+
+def read_postings(path: str) -> Iterator[Dict[str, Any]]:
+    """Đọc tin tuyển dụng từ file JSONL hoặc CSV"""
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith(".csv"):
+            for row in csv.DictReader(f):
+                yield normalize_record(row)
+        else:
+            for line in f:
+                if line.strip():
+                    yield normalize_record(json.loads(line))
+
+
+def _dumps(posting: Dict[str, Any]) -> str:
+    """JSON của tin, NaN/inf được ghi thành null"""
+    clean = {
+        key: (None if isinstance(value, float) and not math.isfinite(value) else value)
+        for key, value in posting.items()
+    }
+    return json.dumps(clean, ensure_ascii=False)
+
+
+class Segment:
+    """Một segment bất biến của chỉ mục (trừ cờ `deleted`), mở bằng memory-map"""
+
+    ARRAYS = (
+        "term_hash", "term_offsets", "post_docs", "post_impact", "doc_len",
+        "salary_min", "salary_max", "experience", "location",
+    )
+
+    def __init__(self, path: str):
+        self.path = path
+        for name in self.ARRAYS:
+            # np.asarray bỏ lớp np.memmap (vẫn dùng chung bộ nhớ map) để tránh chi phí của memmap.__getitem__
+            setattr(self, name, np.asarray(np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")))
+        self.deleted = np.load(os.path.join(path, "deleted.npy"), mmap_mode="r")
+        self.doc_offsets = np.load(os.path.join(path, "doc_offsets.npy"), mmap_mode="r")
+        with open(os.path.join(path, "locations.json"), encoding="utf-8") as f:
+            self.locations: List[str] = json.load(f)
+        self._docs = None
+
+    def __len__(self) -> int:
+        return len(self.doc_len)
+
+    def postings(self, hashed: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Danh sách (doc, impact) của một từ, sắp xếp theo doc; rỗng nếu segment không có từ đó"""
+        i = int(np.searchsorted(self.term_hash, np.uint64(hashed)))
+        if i >= len(self.term_hash) or int(self.term_hash[i]) != hashed:
+            return self.post_docs[:0], self.post_impact[:0]
+        start, end = int(self.term_offsets[i]), int(self.term_offsets[i + 1])
+        return self.post_docs[start:end], self.post_impact[start:end]
+
+    def document(self, doc: int) -> Dict[str, Any]:
+        """Nội dung gốc của tin thứ `doc`"""
+        if self._docs is None:
+            self._docs = open(os.path.join(self.path, "docs.jsonl"), "rb")
+        self._docs.seek(int(self.doc_offsets[doc]))
+        return json.loads(self._docs.readline())
+
+    def ids(self) -> Iterator[Tuple[int, str]]:
+        """Các cặp (doc, id) của segment"""
+        with open(os.path.join(self.path, "docs.jsonl"), encoding="utf-8") as f:
+            for doc, line in enumerate(f):
+                yield doc, json.loads(line)["id"]
+
+
+def write_segment(path: str, postings: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Ghi một danh sách tin thành segment mới, trả về thống kê của segment"""
+    os.makedirs(path, exist_ok=True)
+    # Posting được gom vào mảng kiểu C rồi sắp xếp một lần theo (hash, doc)
+    hashes, docs, tfs = array("Q"), array("i"), array("f")
+    hash_cache: Dict[str, int] = {}
+    doc_len = np.zeros(len(postings), dtype=np.int32)
+    doc_offsets = np.zeros(len(postings), dtype=np.int64)
+    location = np.zeros(len(postings), dtype=np.int32)
+    location_ids: Dict[str, int] = {}
+
+    with open(os.path.join(path, "docs.jsonl"), "wb") as f:
+        for doc, posting in enumerate(postings):
+            doc_offsets[doc] = f.tell()
+            f.write(_dumps(posting).encode("utf-8") + b"\n")
+
+            counts: Counter = Counter()
+            for name, weight in FIELD_WEIGHTS.items():
+                for term in analyze(str(posting.get(name, ""))):
+                    counts[term] += weight
+            doc_len[doc] = sum(counts.values())
+            for term, tf in counts.items():
+                hashed = hash_cache.get(term)
+                if hashed is None:
+                    hashed = hash_cache[term] = term_hash(term)
+                hashes.append(hashed)
+                docs.append(doc)
+                tfs.append(tf)
+            location[doc] = location_ids.setdefault(normalize_location(str(posting.get("location", ""))), len(location_ids))
+
+    hashes_np = np.frombuffer(hashes, dtype=np.uint64)
+    docs_np = np.frombuffer(docs, dtype=np.int32)
+    order = np.lexsort((docs_np, hashes_np))
+    sorted_hashes = hashes_np[order]
+    unique_hashes, starts = np.unique(sorted_hashes, return_index=True)
+    offsets = np.append(starts, len(sorted_hashes)).astype(np.int64)
+
+    # Phần tf của BM25 theo độ dài trung bình của segment
+    post_docs = docs_np[order]
+    tf = np.frombuffer(tfs, dtype=np.float32)[order]
+    avg_len = max(float(doc_len.mean()), 1.0) if len(postings) else 1.0
+    norm = K1 * (1 - B + B * doc_len[post_docs] / avg_len)
+    post_impact = (tf * (K1 + 1) / (tf + norm)).astype(np.float32)
+
+    arrays = {
+        "term_hash": unique_hashes,
+        "term_offsets": offsets,
+        "post_docs": post_docs,
+        "post_impact": post_impact,
+        "doc_len": doc_len,
+        "salary_min": np.array([p["salary_min"] for p in postings], dtype=np.float32),
+        "salary_max": np.array([p["salary_max"] for p in postings], dtype=np.float32),
+        "experience": np.array([p["experience_min"] for p in postings], dtype=np.float32),
+        "location": location,
+        "deleted": np.zeros(len(postings), dtype=np.uint8),
+        "doc_offsets": doc_offsets,
+    }
+    for name, values in arrays.items():
+        np.save(os.path.join(path, f"{name}.npy"), values)
+    with open(os.path.join(path, "locations.json"), "w", encoding="utf-8") as f:
+        json.dump(sorted(location_ids, key=location_ids.get), f, ensure_ascii=False)
+
+    return {"name": os.path.basename(path), "docs": len(postings), "total_len": int(doc_len.sum())}
+
+
+class JobIndex:
+    """Chỉ mục BM25 gồm nhiều segment, tự mở lại khi manifest thay đổi"""
+
+    def __init__(self, path: str = INDEX_DIR):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self.segments: List[Segment] = []
+        self.manifest: Dict[str, Any] = {"segments": [], "next_segment": 0}
+        self._reload()
+
+    @property
+    def _manifest_path(self) -> str:
+        return os.path.join(self.path, MANIFEST)
+
+    def exists(self) -> bool:
+        return os.path.exists(self._manifest_path)
+
+    def _reload(self) -> None:
+        """Mở lại các segment nếu manifest đã được cập nhật"""
+        try:
+            mtime = os.stat(self._manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            with open(self._manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            self.segments = [Segment(os.path.join(self.path, s["name"])) for s in manifest["segments"]]
+            self.manifest = manifest
+            self._mtime = mtime
+
+    def __len__(self) -> int:
+        return sum(len(segment) - int(np.count_nonzero(segment.deleted)) for segment in self.segments)
+
+    def search(
+        self,
+        query: str,
+        top_k: int = TOP_K,
+        salary: str = "",
+        location: str = "",
+        experience: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """Tìm các tin phù hợp nhất theo BM25, lọc theo lương, địa điểm và kinh nghiệm
+
+        Tin không ghi rõ lương / kinh nghiệm / địa điểm không bị loại bởi bộ lọc tương ứng.
+        """
+        self._reload()
+        segments = self.segments
+        if not segments:
+            return []
+        hashes = [term_hash(term) for term in set(analyze(query))]
+        if not hashes:
+            return []
+
+        total_docs = sum(s["docs"] for s in self.manifest["segments"])
+        per_segment = [[segment.postings(hashed) for hashed in hashes] for segment in segments]
+        df = [sum(len(terms[i][0]) for terms in per_segment) for i in range(len(hashes))]
+        idf = [math.log(1 + (total_docs - n + 0.5) / (n + 0.5)) for n in df]
+        # Nếu mọi từ đều phổ biến, các từ hiếm nhất của truy vấn được dùng để chọn ứng viên
+        common = [n > total_docs * COMMON_RATIO for n in df]
+        if not any(n and not is_common for n, is_common in zip(df, common)):
+            rarest = min((n for n in df if n), default=0)
+            common = [n > 2 * rarest for n in df]
+
+        salary_min = parse_salary(salary)[0] if salary else math.nan
+        location_key = normalize_location(location) if location else ""
+
+        results: List[Tuple[float, int, int]] = []
+        for seg_no, (segment, terms) in enumerate(zip(segments, per_segment)):
+            scores = np.zeros(len(segment), dtype=np.float32)
+            generators = [docs for (docs, _), is_common in zip(terms, common) if len(docs) and not is_common]
+            for (docs, impact), weight, is_common in zip(terms, idf, common):
+                if len(docs) and not is_common:
+                    scores[docs] += weight * impact
+
+            # Ít posting thì gộp trực tiếp, nhiều thì quét mảng điểm
+            if sum(map(len, generators)) < len(segment) // 8:
+                candidates = np.unique(np.concatenate(generators)) if generators else generators
+            else:
+                candidates = np.flatnonzero(scores)
+            for (docs, impact), weight, is_common in zip(terms, idf, common):
+                if len(docs) and is_common and len(candidates):
+                    pos = np.minimum(np.searchsorted(docs, candidates), len(docs) - 1)
+                    found = docs[pos] == candidates
+                    scores[candidates[found]] += weight * impact[pos[found]]
+            if segment.deleted.any():
+                candidates = candidates[segment.deleted[candidates] == 0]
+            if not math.isnan(salary_min):
+                upper = segment.salary_max[candidates]
+                candidates = candidates[np.isnan(upper) | (upper >= salary_min)]
+            if experience:
+                required = segment.experience[candidates]
+                candidates = candidates[np.isnan(required) | (required <= experience)]
+            if location_key:
+                allowed = np.array(
+                    [not name or location_key in name or name in location_key for name in segment.locations],
+                    dtype=bool
+                )
+                candidates = candidates[allowed[segment.location[candidates]]]
+            if len(candidates) == 0:
+                continue
+
+            k = min(top_k, len(candidates))
+            best = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            results.extend((float(scores[doc]), seg_no, int(doc)) for doc in best)
+
+        results.sort(key=lambda item: item[0], reverse=True)
+        postings = []
+        for score, seg_no, doc in results[:top_k]:
+            posting = segments[seg_no].document(doc)
+            posting["score"] = round(score, 4)
+            postings.append(posting)
+        return postings
+
+    def _write_manifest(self) -> None:
+        """Ghi manifest mới một cách nguyên tử để reader không đọc file dở dang"""
+        tmp = self._manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self._manifest_path)
+
+    def _new_segment_path(self) -> str:
+        name = f"seg_{self.manifest['next_segment']:05d}"
+        self.manifest["next_segment"] += 1
+        return os.path.join(self.path, name)
+
+    def add(self, postings: Iterable[Dict[str, Any]], segment_size: int = SEGMENT_SIZE) -> int:
+        """Thêm tin vào chỉ mục (segment mới); tin trùng id ở segment cũ bị đánh dấu xóa"""
+        os.makedirs(self.path, exist_ok=True)
+        self._reload()
+        existing: Dict[str, Tuple[int, int]] = {}
+        for seg_no, segment in enumerate(self.segments):
+            for doc, posting_id in segment.ids():
+                if not segment.deleted[doc]:
+                    existing[posting_id] = (seg_no, doc)
+
+        added = 0
+        batch: Dict[str, Dict[str, Any]] = {}
+        for posting in postings:
+            batch[posting["id"]] = posting
+            if len(batch) >= segment_size:
+                added += self._flush(list(batch.values()), existing)
+                batch = {}
+        if batch:
+            added += self._flush(list(batch.values()), existing)
+        return added
+
+    def _flush(self, postings: List[Dict[str, Any]], existing: Dict[str, Tuple[int, int]]) -> int:
+        """Ghi một segment, đánh dấu bản cũ của các tin bị thay thế rồi cập nhật manifest"""
+        stats = write_segment(self._new_segment_path(), postings)
+        replaced = defaultdict(list)
+        for posting in postings:
+            if posting["id"] in existing:
+                seg_no, doc = existing[posting["id"]]
+                replaced[seg_no].append(doc)
+        for seg_no, docs in replaced.items():
+            deleted = np.load(os.path.join(self.segments[seg_no].path, "deleted.npy"), mmap_mode="r+")
+            deleted[docs] = 1
+            deleted.flush()
+
+        self.manifest["segments"].append(stats)
+        self._write_manifest()
+        self._reload()
+        seg_no = len(self.segments) - 1
+        for doc, posting in enumerate(postings):
+            existing[posting["id"]] = (seg_no, doc)
+        return len(postings)
+
+    def compact(self) -> int:
+        """Gộp mọi tin còn hiệu lực về một segment"""
+        self._reload()
+        old = list(self.manifest["segments"])
+        postings = []
+        for segment in self.segments:
+            for doc in np.flatnonzero(segment.deleted == 0).tolist():
+                postings.append(normalize_record(segment.document(doc)))
+        self.manifest["segments"] = [write_segment(self._new_segment_path(), postings)] if postings else []
+        self._write_manifest()
+        self._reload()
+        for stats in old:
+            shutil.rmtree(os.path.join(self.path, stats["name"]), ignore_errors=True)
+        return len(postings)
+
+
+_index: Optional[JobIndex] = None
+_lock = threading.Lock()
+
+
+def get_job_index() -> Optional[JobIndex]:
+    """Chỉ mục dùng chung của process, None nếu chưa nạp dữ liệu vào JOB_INDEX_DIR"""
+    global _index
+    if _index is None:
+        with _lock:
+            if _index is None:
+                _index = JobIndex(INDEX_DIR)
+    return _index if _index.exists() else None
+
+
+def _reset() -> None:
+    """Tiến trình con phải mở lại các file của chỉ mục"""
+    global _index, _lock
+    _index = None
+    _lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m agent.job_index", description="Chỉ mục tin tuyển dụng (BM25)")
+    parser.add_argument("--dir", default=INDEX_DIR, help="Thư mục chỉ mục (mặc định JOB_INDEX_DIR)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = commands.add_parser("ingest", help="Nạp tin tuyển dụng từ file JSONL/CSV")
+    ingest.add_argument("files", nargs="+")
+    ingest.add_argument("--segment-size", type=int, default=SEGMENT_SIZE)
+
+    search = commands.add_parser("search", help="Tìm kiếm thử")
+    search.add_argument("query")
+    search.add_argument("--salary", default="")
+    search.add_argument("--location", default="")
+    search.add_argument("--experience", type=float, default=None)
+    search.add_argument("--top-k", type=int, default=10)
+
+    commands.add_parser("compact", help="Gộp các segment")
+    commands.add_parser("stats", help="Thống kê chỉ mục")
+
+    args = parser.parse_args(argv)
+    index = JobIndex(args.dir)
+
+    if args.command == "ingest":
+        start = time.perf_counter()
+        added = 0
+        for path in args.files:
+            added += index.add(read_postings(path), args.segment_size)
+        print(f"Đã nạp {added} tin trong {time.perf_counter() - start:.1f}s, chỉ mục có {len(index)} tin")
+    elif args.command == "search":
+        start = time.perf_counter()
+        postings = index.search(args.query, args.top_k, args.salary, args.location, args.experience)
+        elapsed = (time.perf_counter() - start) * 1000
+        for posting in postings:
+            print(f"{posting['score']:8.3f}  {posting['title']} - {posting['company']} ({posting['location']}, {posting['salary']})")
+        print(f"{len(postings)} kết quả trong {elapsed:.1f} ms")
+    elif args.command == "compact":
+        print(f"Đã gộp {index.compact()} tin vào một segment")
+    elif args.command == "stats":
+        print(f"Số tin:     {len(index)}")
+        print(f"Segment:    {len(index.segments)}")
+        for stats in index.manifest["segments"]:
+            print(f"  {stats['name']}: {stats['docs']} tin")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,290 @@
+"""Hàng đợi tác vụ chạy nền cho các lời gọi module mất nhiều thời gian.
+
+`POST /api/jobs` chỉ ghi tác vụ vào SQLite rồi trả về id ngay; các worker (thread
+trong process web và/hoặc process riêng `python -m agent.job_queue worker`) lấy
+tác vụ ra chạy, lưu kết quả cùng trạng thái, thời gian và hạn lưu trữ. Client
+hỏi lại bằng `GET /api/jobs/<id>` nên không chiếm worker HTTP trong lúc chờ.
+
+Tác vụ được nhận theo hợp đồng thuê (lease) được gia hạn liên tục trong lúc
+chạy: nếu worker chết giữa chừng, tác vụ được chạy lại khi lease hết hạn (tối đa
+`JOB_MAX_ATTEMPTS` lần), nên kết quả không mất khi khởi động lại.
+"""
+import inspect
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+from agent.job_agent import CVModule, CompanyModule, EmailModule, JobAssistantAgent, JobModule
+from agent.llm_cache import CACHE_DIR
+from agent.llm_client import get_module
+from agent.rate_limiter import BATCH, LLMOverloaded, priority
+
+WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+LEASE = float(os.getenv("JOB_LEASE", "600"))
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "86400"))
+POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+
+# Tên tác vụ -> (class module, tên phương thức)
+TASKS: Dict[str, tuple] = {
+    "find_jobs": (JobModule, "find_jobs"),
+    "write_application_email": (EmailModule, "write_application_email"),
+    "evaluate_cv": (CVModule, "evaluate_cv"),
+    "create_cv": (CVModule, "create_cv"),
+    "find_top_companies": (CompanyModule, "find_top_companies"),
+    "process": (JobAssistantAgent, "process"),
+}
+
+
+def resolve_task(task: str) -> Callable[..., Any]:
+    """Phương thức thực hiện tác vụ `task`"""
+    if task not in TASKS:
+        raise ValueError(f"Tác vụ không hợp lệ: {task}")
+    cls, method = TASKS[task]
+    return getattr(get_module(cls), method)
+
+
+def validate_params(task: str, params: Dict[str, Any]) -> None:
+    """Kiểm tra tham số khớp với chữ ký của phương thức, lỗi ValueError nếu không khớp"""
+    if task not in TASKS:
+        raise ValueError(f"Tác vụ không hợp lệ: {task}")
+    cls, method = TASKS[task]
+    try:
+        inspect.signature(getattr(cls, method)).bind(None, **params)
+    except TypeError as e:
+        raise ValueError(f"Tham số không hợp lệ cho {task}: {e}")
+
+
+class JobQueue:
+    """Hàng đợi bền vững trên SQLite, dùng chung giữa các process"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads: list = []
+        self._running: set = set()
+        self._last_cleanup = 0.0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    task TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created REAL NOT NULL,
+                    started REAL,
+                    finished REAL,
+                    lease_until REAL,
+                    expires REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created)")
+
+    def _conn(self) -> sqlite3.Connection:
+        """Mỗi thread dùng một kết nối SQLite riêng"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def submit(self, task: str, params: Dict[str, Any]) -> str:
+        """Thêm tác vụ vào hàng đợi, trả về id"""
+        validate_params(task, params)
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO jobs (id, task, params, status, created, expires) VALUES (?, ?, ?, 'queued', ?, ?)",
+            (job_id, task, json.dumps(params, ensure_ascii=False), now, now + RESULT_TTL)
+        )
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Trạng thái và kết quả của tác vụ, None nếu không có hoặc đã hết hạn"""
+        row = self._conn().execute(
+            "SELECT * FROM jobs WHERE id = ? AND expires > ?", (job_id, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        job = {
+            "job_id": row["id"],
+            "task": row["task"],
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "created": row["created"],
+            "expires": row["expires"],
+            "timings": {
+                "queued_s": round((row["started"] or now) - row["created"], 3),
+                "run_s": round((row["finished"] or now) - row["started"], 3) if row["started"] else None,
+            },
+        }
+        if row["status"] == "done":
+            job["result"] = json.loads(row["result"])
+        elif row["status"] == "error":
+            job["error"] = row["error"]
+        return job
+
+    def claim(self) -> Optional[sqlite3.Row]:
+        """Nhận một tác vụ đang chờ (hoặc có lease đã hết hạn) để chạy"""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                "ORDER BY created LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, started = ?, lease_until = ? WHERE id = ?",
+                    (now, now + LEASE, row["id"])
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return row
+
+    def _finish(self, job_id: str, status: str, result: Optional[str] = None, error: Optional[str] = None) -> None:
+        now = time.time()
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished = ?, lease_until = NULL, expires = ? WHERE id = ?",
+            (status, result, error, now, now + RESULT_TTL, job_id)
+        )
+
+    def _requeue(self, job_id: str) -> None:
+        """Trả tác vụ về hàng đợi, không tính là một lần thử"""
+        self._conn().execute(
+            "UPDATE jobs SET status = 'queued', attempts = attempts - 1, started = NULL, lease_until = NULL WHERE id = ?",
+            (job_id,)
+        )
+
+    def run_one(self) -> bool:
+        """Chạy một tác vụ nếu có, trả về False khi hàng đợi trống"""
+        row = self.claim()
+        if row is None:
+            return False
+        # Tác vụ đã làm worker chết quá nhiều lần thì không thử lại nữa
+        if row["attempts"] + 1 > MAX_ATTEMPTS:
+            self._finish(row["id"], "error", error="Vượt quá số lần thử lại")
+            return True
+        self._running.add(row["id"])
+        try:
+            with priority(BATCH):
+                result = resolve_task(row["task"])(**json.loads(row["params"]))
+            self._finish(row["id"], "done", result=json.dumps(result, ensure_ascii=False))
+        except LLMOverloaded as e:
+            # Hết hạn mức gọi LLM: chạy lại sau, trong lúc đó worker nghỉ
+            self._requeue(row["id"])
+            self._stop.wait(e.retry_after)
+        except Exception as e:
+            print(f"Error in job {row['id']} ({row['task']}): {str(e)}")
+            self._finish(row["id"], "error", error="Có lỗi xảy ra khi xử lý yêu cầu")
+        finally:
+            self._running.discard(row["id"])
+        return True
+
+    def _heartbeat(self) -> None:
+        """Gia hạn lease cho các tác vụ đang chạy trong process để không bị worker khác nhận lại"""
+        while not self._stop.wait(LEASE / 3):
+            for job_id in list(self._running):
+                try:
+                    self._conn().execute(
+                        "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = 'running'",
+                        (time.time() + LEASE, job_id)
+                    )
+                except Exception as e:
+                    print(f"Error in job heartbeat: {str(e)}")
+
+    def cleanup(self) -> int:
+        """Xóa các tác vụ đã hết hạn lưu trữ"""
+        return self._conn().execute(
+            "DELETE FROM jobs WHERE expires <= ? AND status IN ('done', 'error')", (time.time(),)
+        ).rowcount
+
+    def _worker(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if time.time() - self._last_cleanup > 60:
+                    self._last_cleanup = time.time()
+                    self.cleanup()
+                if self.run_one():
+                    continue
+            except Exception as e:
+                print(f"Error in job worker: {str(e)}")
+            # Chờ tác vụ mới trong process này, hoặc hỏi lại SQLite sau POLL_INTERVAL (tác vụ từ process khác)
+            self._wakeup.wait(POLL_INTERVAL)
+            self._wakeup.clear()
+
+    def start(self, workers: int = WORKERS) -> None:
+        """Khởi động các thread worker (chỉ một lần mỗi process)"""
+        if self._threads or workers <= 0:
+            return
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+
+
+_queue: Optional[JobQueue] = None
+_lock = threading.Lock()
+
+
+def get_job_queue(start_workers: bool = True) -> JobQueue:
+    """Hàng đợi dùng chung của process; worker chạy trong process trừ khi JOB_WORKERS=0"""
+    global _queue
+    if _queue is None:
+        with _lock:
+            if _queue is None:
+                _queue = JobQueue(os.getenv("JOB_QUEUE_PATH", os.path.join(CACHE_DIR, "jobs.sqlite3")))
+    if start_workers:
+        _queue.start()
+    return _queue
+
+
+def _reset() -> None:
+    """Thread worker và kết nối SQLite không còn hợp lệ trong tiến trình con"""
+    global _queue, _lock
+    _queue = None
+    _lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset)
+
+
+if __name__ == "__main__":
+    # Worker riêng: python -m agent.job_queue worker [số_thread]
+    if len(sys.argv) < 2 or sys.argv[1] != "worker":
+        print("Cách dùng: python -m agent.job_queue worker [số_thread]")
+        sys.exit(1)
+    queue = get_job_queue(start_workers=False)
+    queue.start(int(sys.argv[2]) if len(sys.argv) > 2 else max(WORKERS, 1))
+    print(f"Job worker đang chạy ({len(queue._threads)} thread), hàng đợi: {queue.path}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        queue.stop()
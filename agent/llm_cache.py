@@ -0,0 +1,155 @@
+"""Cache kết quả LLM lưu trên SQLite, dùng chung giữa các worker gunicorn.
+
+Khóa cache là hash của (module, prompt đã chuẩn hóa, model, temperature). Prompt
+được sinh hoàn toàn từ các tham số của module nên chuẩn hóa prompt (bỏ khoảng
+trắng thừa, Unicode NFC) cũng chính là chuẩn hóa các tham số; khi template thay
+đổi thì khóa cũng đổi theo nên không trả về kết quả cũ. Chữ hoa/thường được giữ
+nguyên vì nội dung người dùng (tên riêng, viết tắt, mã code trong CV) có thể làm
+câu trả lời khác đi.
+
+Mỗi module có TTL riêng (`LLM_CACHE_TTL_<MODULE>`), tổng số mục bị giới hạn bởi
+`LLM_CACHE_MAX_ENTRIES` và các mục ít được dùng nhất bị xóa trước (LRU).
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from typing import Dict, Optional
+
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+DEFAULT_TTL = int(os.getenv("LLM_CACHE_TTL", "86400"))
+MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000"))
+ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+
+# Tăng khi đổi cách tạo khóa để bỏ qua toàn bộ dữ liệu cũ
+CACHE_VERSION = 2
+
+
+def normalize_text(text: str) -> str:
+    """Chuẩn hóa khoảng trắng và Unicode để các yêu cầu chỉ khác cách gõ dùng chung một khóa"""
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def make_key(namespace: str, prompt: str, model: str, temperature: float) -> str:
+    """Tạo khóa cache từ module, prompt đã chuẩn hóa, model và temperature"""
+    payload = json.dumps(
+        [CACHE_VERSION, namespace, normalize_text(prompt), model, float(temperature)],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def ttl_for(namespace: str) -> int:
+    """TTL (giây) của một module, vd. LLM_CACHE_TTL_FIND_JOBS=3600; 0 để tắt cache cho module đó"""
+    return int(os.getenv(f"LLM_CACHE_TTL_{namespace.upper()}", DEFAULT_TTL))
+
+
+class LLMCache:
+    """Cache key-value trên SQLite với TTL, giới hạn số mục (LRU) và bộ đếm hit/miss"""
+
+    def __init__(self, path: str, max_entries: int = MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits: Dict[str, int] = defaultdict(int)
+        self.misses: Dict[str, int] = defaultdict(int)
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    namespace TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    expires REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache(last_access)")
+
+    def _conn(self) -> sqlite3.Connection:
+        """Mỗi thread dùng một kết nối SQLite riêng"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        """Lấy giá trị còn hạn, đồng thời cập nhật thời điểm truy cập cho LRU"""
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value FROM llm_cache WHERE key = ? AND expires > ?", (key, now)
+        ).fetchone()
+        if row is None:
+            self.misses[namespace] += 1
+            return None
+        conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+        self.hits[namespace] += 1
+        return row[0]
+
+    def set(self, namespace: str, key: str, value: str, ttl: int) -> None:
+        """Lưu giá trị và xóa bớt các mục cũ nếu vượt giới hạn"""
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, namespace, value, created, expires, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, namespace, value, now, now + ttl, now)
+        )
+        self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        """Xóa mục hết hạn, sau đó xóa các mục ít được dùng nhất cho đến khi về dưới giới hạn"""
+        conn.execute("DELETE FROM llm_cache WHERE expires <= ?", (now,))
+        (count,) = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        if count > self.max_entries:
+            # Xóa thêm 10% để không phải dọn dẹp ở mỗi lần ghi
+            excess = count - int(self.max_entries * 0.9)
+            conn.execute(
+                "DELETE FROM llm_cache WHERE key IN "
+                "(SELECT key FROM llm_cache ORDER BY last_access LIMIT ?)",
+                (excess,)
+            )
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Số lần hit/miss theo module trong process hiện tại"""
+        namespaces = set(self.hits) | set(self.misses)
+        return {ns: {"hits": self.hits[ns], "misses": self.misses[ns]} for ns in sorted(namespaces)}
+
+
+_cache: Optional[LLMCache] = None
+_lock = threading.Lock()
+
+
+def get_cache() -> Optional[LLMCache]:
+    """Cache dùng chung của process, None nếu bị tắt bằng LLM_CACHE=0"""
+    global _cache
+    if not ENABLED:
+        return None
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                path = os.getenv("LLM_CACHE_PATH", os.path.join(CACHE_DIR, "llm_cache.sqlite3"))
+                _cache = LLMCache(path)
+    return _cache
+
+
+def _reset() -> None:
+    """Tiến trình con phải mở kết nối SQLite mới"""
+    global _cache, _lock
+    _cache = None
+    _lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset)
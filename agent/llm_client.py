@@ -0,0 +1,456 @@
+"""Registry dùng chung cho client LLM và các module chức năng trong một process.
+
+Mỗi worker chỉ tạo một `ChatOpenAI` cho mỗi bộ tham số (model, temperature, ...) và một
+HTTP client keep-alive dùng chung, nên các request không phải bắt tay TLS lại
+và không mở thêm socket mới cho mỗi lần gọi. Các lời gọi bất đồng bộ đi qua
+một semaphore để giới hạn số request LLM đồng thời, và mọi lời gọi chat đều phải
+chờ đến lượt theo giới hạn RPM/TPM của `agent.rate_limiter`. Các lời gọi giống
+hệt nhau đang chạy cùng lúc được gộp thành một request (`agent.singleflight`).
+Mỗi lời gọi dừng khi hết thời hạn của request và có thể được hedge (`agent.hedging`);
+timeout của từng HTTP request được rút ngắn theo thời gian còn lại của thời hạn.
+
+`langchain_openai` chỉ được import khi tạo client đầu tiên để worker khởi động nhanh.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Iterator, Optional, Tuple, Type, TypeVar
+
+import httpx
+
+from agent import hedging
+from agent.deadline import DeadlineExceeded, deadline, remaining
+from agent.llm_cache import get_cache, make_key, ttl_for
+from agent.metrics import CACHE_LOOKUPS, current_stage, track_llm
+from agent.model_config import settings_for
+from agent.rate_limiter import ascheduled, current_priority, estimate_tokens, scheduled
+from agent.singleflight import WORKER_LOCK, acoalesce, aworker_lock, coalesce, worker_lock
+from agent.utils import get_openai_api_key
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+DEFAULT_MODEL = "gpt-4.1"
+
+T = TypeVar("T")
+
+_lock = threading.RLock()
+_llms: Dict[Tuple[str, float, Optional[int], Optional[float]], ChatOpenAI] = {}
+_embeddings: Dict[str, OpenAIEmbeddings] = {}
+_modules: Dict[type, Any] = {}
+_structured_runnables: Dict[Tuple[int, type], Any] = {}
+_http_client: Optional[httpx.Client] = None
+_http_async_client: Optional[httpx.AsyncClient] = None
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def _pool_limits() -> httpx.Limits:
+    """Giới hạn connection pool, cấu hình qua biến môi trường"""
+    return httpx.Limits(
+        max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20")),
+        keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30")),
+    )
+
+
+def _cap_timeout(request: httpx.Request) -> None:
+    """Rút timeout của HTTP request về thời gian còn lại của thời hạn; hết hạn thì không gửi
+
+    `APITimeoutError` là lỗi của openai nên SDK ném ra ngay, không thử lại.
+    """
+    left = remaining()
+    if left is None:
+        return
+    if left <= 0:
+        from openai import APITimeoutError
+        raise APITimeoutError(request=request)
+    timeout = request.extensions.get("timeout") or {}
+    request.extensions["timeout"] = {
+        name: left if timeout.get(name) is None else min(timeout[name], left)
+        for name in ("connect", "read", "write", "pool")
+    }
+
+
+async def _acap_timeout(request: httpx.Request) -> None:
+    _cap_timeout(request)
+
+
+def get_http_client() -> httpx.Client:
+    """HTTP client keep-alive dùng chung cho mọi lời gọi LLM đồng bộ"""
+    global _http_client
+    if _http_client is None:
+        with _lock:
+            if _http_client is None:
+                _http_client = httpx.Client(limits=_pool_limits(), timeout=None, event_hooks={"request": [_cap_timeout]})
+    return _http_client
+
+
+def get_http_async_client() -> httpx.AsyncClient:
+    """HTTP client keep-alive dùng chung cho mọi lời gọi LLM bất đồng bộ"""
+    global _http_async_client
+    if _http_async_client is None:
+        with _lock:
+            if _http_async_client is None:
+                _http_async_client = httpx.AsyncClient(
+                    limits=_pool_limits(), timeout=None, event_hooks={"request": [_acap_timeout]}
+                )
+    return _http_async_client
+
+
+def _llm_semaphore() -> asyncio.Semaphore:
+    """Semaphore giới hạn số lời gọi LLM đồng thời trong event loop hiện tại"""
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(int(os.getenv("LLM_MAX_CONCURRENCY", "64")))
+        _semaphores[loop] = semaphore
+    return semaphore
+
+
+def get_llm(
+    model: str = DEFAULT_MODEL,
+    temperature: float = 0.7,
+    max_tokens: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> ChatOpenAI:
+    """Lấy ChatOpenAI dùng chung theo (model, temperature, max_tokens, timeout)"""
+    key = (model, float(temperature), max_tokens, timeout)
+    llm = _llms.get(key)
+    if llm is None:
+        with _lock:
+            llm = _llms.get(key)
+            if llm is None:
+                from langchain_openai import ChatOpenAI
+                llm = ChatOpenAI(
+                    api_key=get_openai_api_key(),
+                    model=model,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    timeout=timeout,
+                    # Nhận số token ở đoạn cuối khi stream
+                    stream_usage=True,
+                    http_client=get_http_client(),
+                    http_async_client=get_http_async_client(),
+                )
+                _llms[key] = llm
+    return llm
+
+
+def llm_for(name: str) -> ChatOpenAI:
+    """ChatOpenAI theo cấu hình của lời gọi `name` (xem `agent.model_config`)"""
+    return get_llm(**settings_for(name))
+
+
+def get_embeddings(model: str = "text-embedding-3-small") -> OpenAIEmbeddings:
+    """Lấy OpenAIEmbeddings dùng chung theo model"""
+    embeddings = _embeddings.get(model)
+    if embeddings is None:
+        with _lock:
+            embeddings = _embeddings.get(model)
+            if embeddings is None:
+                from langchain_openai import OpenAIEmbeddings
+                embeddings = OpenAIEmbeddings(
+                    api_key=get_openai_api_key(),
+                    model=model,
+                    http_client=get_http_client(),
+                    http_async_client=get_http_async_client(),
+                    # Câu hỏi ngắn, không cần tiktoken để cắt theo context length
+                    check_embedding_ctx_length=False,
+                )
+                _embeddings[model] = embeddings
+    return embeddings
+
+
+def get_module(cls: Type[T]) -> T:
+    """Lấy instance dùng chung của một module chức năng (JobModule, CVModule, ...)"""
+    module = _modules.get(cls)
+    if module is None:
+        with _lock:
+            module = _modules.get(cls)
+            if module is None:
+                module = cls()
+                _modules[cls] = module
+    return module
+
+
+def _cache_lookup(llm: ChatOpenAI, prompt: str, namespace: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Trả về (khóa cache, giá trị đã cache) cho lời gọi của một module; (None, None) nếu không dùng cache"""
+    cache = get_cache()
+    if cache is None or namespace is None or ttl_for(namespace) <= 0:
+        return None, None
+    key = make_key(namespace, prompt, llm.model_name, llm.temperature)
+    value = cache.get(namespace, key)
+    CACHE_LOOKUPS.inc(namespace, "miss" if value is None else "hit")
+    return key, value
+
+
+def _cache_store(namespace: Optional[str], key: Optional[str], value: str) -> None:
+    """Lưu kết quả vào cache nếu lời gọi có dùng cache"""
+    if key is not None and value:
+        get_cache().set(namespace, key, value, ttl_for(namespace))
+
+
+def _flight_key(llm: ChatOpenAI, prompt: str, kind: str = "text") -> str:
+    """Khóa gộp lời gọi đang chạy: cùng prompt đã chuẩn hóa, model, temperature và độ ưu tiên
+
+    Request từ giao diện không đi theo lời gọi chạy nền đang xếp hàng sau mọi request khác.
+    """
+    return f"{make_key(kind, prompt, llm.model_name, llm.temperature)}:{current_priority()}"
+
+
+def _recheck_cache(namespace: Optional[str], key: Optional[str]) -> Optional[str]:
+    """Đọc lại cache sau khi chờ khóa giữa các worker (worker giữ khóa trước có thể đã lưu kết quả)"""
+    if key is None or not WORKER_LOCK:
+        return None
+    return get_cache().get(namespace, key)
+
+
+def _call_name(cache_namespace: Optional[str]) -> str:
+    """Tên lời gọi dùng để tính ngưỡng hedge (tên module hoặc node đang chạy)"""
+    return cache_namespace or current_stage()
+
+
+def _call_budget(llm: ChatOpenAI) -> Optional[float]:
+    """Thời gian tối đa của một lời gọi không stream (timeout trong cấu hình model)"""
+    timeout = llm.request_timeout
+    return float(timeout) if isinstance(timeout, (int, float)) else None
+
+
+@contextmanager
+def _call_deadline(llm: ChatOpenAI) -> Iterator[None]:
+    """Giới hạn lời gọi API theo `_call_budget`, tính từ lúc đã đến lượt (không gồm thời gian chờ rate limiter)"""
+    budget = _call_budget(llm)
+    with deadline(budget):
+        try:
+            yield
+        except Exception:
+            left = remaining()
+            if left is not None and left <= 0:
+                raise DeadlineExceeded(budget) from None
+            raise
+
+
+def invoke_llm(llm: ChatOpenAI, prompt: str, cache_namespace: Optional[str] = None) -> str:
+    """Gọi LLM và trả về toàn bộ nội dung văn bản
+
+    Khi có `cache_namespace` (tên module), kết quả được đọc/ghi qua cache SQLite dùng chung.
+    Các lời gọi giống hệt nhau đang chạy cùng lúc chỉ gửi một request lên API.
+    """
+    key, cached = _cache_lookup(llm, prompt, cache_namespace)
+    if cached is not None:
+        return cached
+
+    def attempt() -> Any:
+        with scheduled(llm.model_name, prompt, llm.max_tokens) as ticket, _call_deadline(llm), track_llm(llm.model_name, cache_namespace, prompt) as call:
+            response = llm.invoke(prompt)
+            ticket.used = call.usage(response)
+        return response
+
+    def produce() -> Iterator[str]:
+        with worker_lock(key):
+            cached = _recheck_cache(cache_namespace, key)
+            if cached is not None:
+                yield cached
+                return
+            response = hedging.run(llm.model_name, _call_name(cache_namespace), attempt)
+            _cache_store(cache_namespace, key, response.content)
+        yield response.content
+
+    return "".join(coalesce(_flight_key(llm, prompt), produce))
+
+
+def stream_llm(llm: ChatOpenAI, prompt: str, cache_namespace: Optional[str] = None) -> Iterator[str]:
+    """Gọi LLM ở chế độ stream, trả về từng đoạn văn bản ngay khi model sinh ra
+
+    Lời gọi giống hệt một lời gọi đang chạy sẽ nhận cùng dòng văn bản thay vì gọi API lần nữa.
+    Stream chỉ bị giới hạn bởi thời hạn của request, timeout của model áp dụng cho từng lần đọc.
+    """
+    key, cached = _cache_lookup(llm, prompt, cache_namespace)
+    if cached is not None:
+        yield cached
+        return
+
+    def attempt() -> Iterator[str]:
+        parts = []
+        with scheduled(llm.model_name, prompt, llm.max_tokens) as ticket, track_llm(llm.model_name, cache_namespace, prompt) as call:
+            for chunk in llm.stream(prompt):
+                call.chunk(chunk)
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield chunk.content
+            # API không trả về usage: ước lượng lại theo nội dung đã nhận
+            ticket.used = call.total_tokens or estimate_tokens(prompt, len("".join(parts)) // 3 + 1)
+
+    def produce() -> Iterator[str]:
+        with worker_lock(key):
+            cached = _recheck_cache(cache_namespace, key)
+            if cached is not None:
+                yield cached
+                return
+            parts = []
+            for part in hedging.stream(llm.model_name, _call_name(cache_namespace), attempt):
+                parts.append(part)
+                yield part
+            _cache_store(cache_namespace, key, "".join(parts))
+
+    yield from coalesce(_flight_key(llm, prompt), produce)
+
+
+async def ainvoke_llm(llm: ChatOpenAI, prompt: str, cache_namespace: Optional[str] = None) -> str:
+    """Gọi LLM bất đồng bộ, chờ nếu đã đạt giới hạn lời gọi đồng thời"""
+    key, cached = _cache_lookup(llm, prompt, cache_namespace)
+    if cached is not None:
+        return cached
+
+    async def attempt() -> Any:
+        async with ascheduled(llm.model_name, prompt, llm.max_tokens) as ticket, _llm_semaphore():
+            with _call_deadline(llm), track_llm(llm.model_name, cache_namespace, prompt) as call:
+                response = await llm.ainvoke(prompt)
+                ticket.used = call.usage(response)
+        return response
+
+    async def produce() -> AsyncIterator[str]:
+        async with aworker_lock(key):
+            cached = _recheck_cache(cache_namespace, key)
+            if cached is not None:
+                yield cached
+                return
+            response = await hedging.arun(llm.model_name, _call_name(cache_namespace), attempt)
+            _cache_store(cache_namespace, key, response.content)
+        yield response.content
+
+    return "".join([part async for part in acoalesce(_flight_key(llm, prompt), produce)])
+
+
+async def astream_llm(llm: ChatOpenAI, prompt: str, cache_namespace: Optional[str] = None) -> AsyncIterator[str]:
+    """Gọi LLM bất đồng bộ ở chế độ stream, giữ một suất đồng thời đến khi stream kết thúc"""
+    key, cached = _cache_lookup(llm, prompt, cache_namespace)
+    if cached is not None:
+        yield cached
+        return
+
+    async def attempt() -> AsyncIterator[str]:
+        parts = []
+        async with ascheduled(llm.model_name, prompt, llm.max_tokens) as ticket, _llm_semaphore():
+            with track_llm(llm.model_name, cache_namespace, prompt) as call:
+                async for chunk in llm.astream(prompt):
+                    call.chunk(chunk)
+                    if chunk.content:
+                        parts.append(chunk.content)
+                        yield chunk.content
+                ticket.used = call.total_tokens or estimate_tokens(prompt, len("".join(parts)) // 3 + 1)
+
+    async def produce() -> AsyncIterator[str]:
+        async with aworker_lock(key):
+            cached = _recheck_cache(cache_namespace, key)
+            if cached is not None:
+                yield cached
+                return
+            parts = []
+            async for part in hedging.astream(llm.model_name, _call_name(cache_namespace), attempt):
+                parts.append(part)
+                yield part
+            _cache_store(cache_namespace, key, "".join(parts))
+
+    async for part in acoalesce(_flight_key(llm, prompt), produce):
+        yield part
+
+
+def _structured(llm: ChatOpenAI, schema: Type[T]):
+    """Runnable trả về đối tượng `schema` đã được validate (tạo một lần cho mỗi cặp llm/schema)"""
+    key = (id(llm), schema)
+    runnable = _structured_runnables.get(key)
+    if runnable is None:
+        # include_raw để lấy được số token của message gốc
+        runnable = llm.with_structured_output(schema, method="function_calling", include_raw=True)
+        _structured_runnables[key] = runnable
+    return runnable
+
+
+def _parsed(output: Dict[str, Any], schema: Type[T]) -> T:
+    """Đối tượng đã validate từ kết quả include_raw, lỗi nếu model không trả về đúng schema"""
+    if output.get("parsing_error") is not None:
+        raise output["parsing_error"]
+    if output.get("parsed") is None:
+        raise ValueError(f"Model không trả về {schema.__name__}")
+    return output["parsed"]
+
+
+def invoke_structured(llm: ChatOpenAI, prompt: str, schema: Type[T], cache_namespace: Optional[str] = None) -> T:
+    """Gọi LLM với structured output, kết quả được validate theo pydantic `schema`
+
+    Khi có `cache_namespace`, kết quả được cache dưới dạng JSON của `schema`.
+    """
+    key, cached = _cache_lookup(llm, prompt, cache_namespace)
+    if cached is not None:
+        return schema.model_validate_json(cached)
+
+    def attempt() -> Dict[str, Any]:
+        with scheduled(llm.model_name, prompt, llm.max_tokens) as ticket, _call_deadline(llm), track_llm(llm.model_name, cache_namespace, prompt) as call:
+            output = _structured(llm, schema).invoke(prompt)
+            ticket.used = call.usage(output["raw"])
+        return output
+
+    def produce() -> Iterator[T]:
+        with worker_lock(key):
+            cached = _recheck_cache(cache_namespace, key)
+            if cached is not None:
+                yield schema.model_validate_json(cached)
+                return
+            output = hedging.run(llm.model_name, _call_name(cache_namespace), attempt)
+            result = _parsed(output, schema)
+            _cache_store(cache_namespace, key, result.model_dump_json())
+        yield result
+
+    # Đọc hết để leader kết thúc lượt gọi và trả kết quả cho các lời gọi đi theo
+    return list(coalesce(_flight_key(llm, prompt, f"structured:{schema.__name__}"), produce))[0]
+
+
+async def ainvoke_structured(llm: ChatOpenAI, prompt: str, schema: Type[T], cache_namespace: Optional[str] = None) -> T:
+    """Gọi LLM bất đồng bộ với structured output"""
+    key, cached = _cache_lookup(llm, prompt, cache_namespace)
+    if cached is not None:
+        return schema.model_validate_json(cached)
+
+    async def attempt() -> Dict[str, Any]:
+        async with ascheduled(llm.model_name, prompt, llm.max_tokens) as ticket, _llm_semaphore():
+            with _call_deadline(llm), track_llm(llm.model_name, cache_namespace, prompt) as call:
+                output = await _structured(llm, schema).ainvoke(prompt)
+                ticket.used = call.usage(output["raw"])
+        return output
+
+    async def produce() -> AsyncIterator[T]:
+        async with aworker_lock(key):
+            cached = _recheck_cache(cache_namespace, key)
+            if cached is not None:
+                yield schema.model_validate_json(cached)
+                return
+            output = await hedging.arun(llm.model_name, _call_name(cache_namespace), attempt)
+            result = _parsed(output, schema)
+            _cache_store(cache_namespace, key, result.model_dump_json())
+        yield result
+
+    return [result async for result in acoalesce(_flight_key(llm, prompt, f"structured:{schema.__name__}"), produce)][0]
+
+
+def reset() -> None:
+    """Xóa toàn bộ registry (dùng sau khi fork hoặc khi đổi cấu hình)"""
+    global _http_client, _http_async_client, _lock
+    # Sau fork, lock có thể đang bị giữ bởi một thread không còn tồn tại
+    _lock = threading.RLock()
+    _llms.clear()
+    _embeddings.clear()
+    _modules.clear()
+    _structured_runnables.clear()
+    _semaphores.clear()
+    _http_client = None
+    _http_async_client = None
+
+
+# Tiến trình con (vd. worker gunicorn với --preload) không được dùng chung socket với tiến trình cha
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset)
@@ -0,0 +1,173 @@
+"""Viết email ứng tuyển hàng loạt (mail merge) cho nhiều công ty.
+
+Thay vì sinh N email đầy đủ, phần chung của email (tiêu đề, giới thiệu, kỹ năng,
+kết thư) được sinh một lần với chỗ trống `[CÔNG_TY]` và `[ĐOẠN_RIÊNG]`; mỗi lời gọi
+còn lại chỉ viết đoạn riêng 2-3 câu cho một nhóm `MAIL_MERGE_BATCH_SIZE` công ty
+(structured output, mỗi đoạn kèm tên công ty). Các lời gọi chạy đồng thời, email của
+mỗi nhóm được ghép cục bộ và trả về ngay khi nhóm đó xong.
+
+Đoạn riêng được ghép với công ty theo tên đã chuẩn hóa (không dấu, không phân biệt
+hoa/thường và dấu câu), không theo vị trí, nên model bỏ sót hay đảo thứ tự cũng không
+gắn nhầm đoạn của công ty này vào email của công ty khác. Công ty không có đoạn riêng
+vẫn nhận email với một câu chung (`personalized: false`); nhóm bị lỗi trả về
+`status: error` cho từng công ty.
+"""
+import asyncio
+import contextvars
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+
+from agent.job_agent import EmailModule
+from agent.llm_client import get_module
+from agent.utils import tokenize_vi
+
+BATCH_SIZE = int(os.getenv("MAIL_MERGE_BATCH_SIZE", "8"))
+CONCURRENCY = int(os.getenv("MAIL_MERGE_CONCURRENCY", "8"))
+MAX_COMPANIES = int(os.getenv("MAIL_MERGE_MAX_COMPANIES", "100"))
+
+COMPANY_MARK = "[CÔNG_TY]"
+PARAGRAPH_MARK = "[ĐOẠN_RIÊNG]"
+
+
+def company_key(name: str) -> str:
+    """Khóa so khớp tên công ty: bỏ dấu, chữ thường, bỏ dấu câu và ghi chú trong ngoặc ở cuối"""
+    return " ".join(tokenize_vi(re.sub(r"\s*\([^()]*\)\s*$", "", name)))
+
+
+def normalize_companies(items: Sequence[Any]) -> List[Dict[str, str]]:
+    """Đưa đầu vào về dạng [{"company", "note"}]; tên trùng nhau (theo `company_key`) chỉ giữ bản đầu tiên"""
+    companies: Dict[str, Dict[str, str]] = {}
+    for item in items:
+        if isinstance(item, dict):
+            name = str(item.get("company") or item.get("name") or "").strip()
+            note = str(item.get("note") or "").strip()
+        else:
+            name, note = str(item).strip(), ""
+        if name:
+            companies.setdefault(company_key(name) or name.casefold(), {"company": name, "note": note})
+    return list(companies.values())
+
+
+def batches(companies: Sequence[Dict[str, str]], size: int = BATCH_SIZE) -> List[List[Dict[str, str]]]:
+    size = max(1, size)
+    return [list(companies[i:i + size]) for i in range(0, len(companies), size)]
+
+
+def generic_paragraph(company: str, job_title: str) -> str:
+    """Đoạn dùng khi model không trả về đoạn riêng cho công ty"""
+    return f"Tôi rất quan tâm đến {company} và mong muốn được đóng góp ở vị trí {job_title or 'đang tuyển'}."
+
+
+def assemble(body: str, company: str, paragraph: str) -> str:
+    """Ghép email của một công ty từ phần chung và đoạn riêng"""
+    if PARAGRAPH_MARK in body:
+        email = body.replace(PARAGRAPH_MARK, paragraph.strip())
+    else:
+        # Model không giữ chỗ trống: chèn đoạn riêng sau đoạn giới thiệu
+        blocks = body.split("\n\n")
+        blocks.insert(min(2, len(blocks)), paragraph.strip())
+        email = "\n\n".join(blocks)
+    return email.replace(COMPANY_MARK, company)
+
+
+def _records(body: str, batch: List[Dict[str, str]], job_title: str, start: float,
+             paragraphs: Optional[List[Dict[str, str]]] = None, error: Optional[Exception] = None) -> List[Dict[str, Any]]:
+    """Kết quả của một nhóm công ty; đoạn riêng được ghép theo tên công ty"""
+    latency = round(time.perf_counter() - start, 3)
+    by_company: Dict[str, str] = {}
+    for item in paragraphs or []:
+        by_company.setdefault(company_key(item["company"]), item["paragraph"].strip())
+    records = []
+    for company in batch:
+        record: Dict[str, Any] = {"company": company["company"], "latency": latency}
+        if error is not None:
+            record.update(status="error", error=str(error))
+        else:
+            paragraph = by_company.get(company_key(company["company"]), "")
+            record.update(
+                status="ok",
+                email=assemble(body, company["company"], paragraph or generic_paragraph(company["company"], job_title)),
+                personalized=bool(paragraph),
+            )
+        records.append(record)
+    return records
+
+
+def iter_merge(
+    job_title: str,
+    skills: str,
+    companies: Sequence[Dict[str, str]],
+    batch_size: int = BATCH_SIZE,
+    concurrency: int = CONCURRENCY,
+) -> Iterator[Dict[str, Any]]:
+    """Viết email cho từng công ty, trả về kết quả của từng nhóm ngay khi xong"""
+    email_module = get_module(EmailModule)
+    groups = batches(companies, batch_size)
+    start = time.perf_counter()
+
+    # Mỗi lời gọi chạy với bản sao context (thời hạn, trace) của request
+    with ThreadPoolExecutor(max_workers=max(1, min(len(groups), concurrency)) + 1) as pool:
+        body_future = pool.submit(contextvars.copy_context().run, email_module.merge_body, job_title, skills)
+        futures = {
+            pool.submit(contextvars.copy_context().run, email_module.merge_paragraphs, job_title, skills, group): group
+            for group in groups
+        }
+        try:
+            body = body_future.result()
+            for future in as_completed(futures):
+                try:
+                    paragraphs, error = future.result(), None
+                except Exception as e:
+                    paragraphs, error = None, e
+                yield from _records(body, futures[future], job_title, start, paragraphs, error)
+        finally:
+            # Client ngắt kết nối hoặc phần chung bị lỗi: bỏ các nhóm chưa chạy
+            for future in futures:
+                future.cancel()
+
+
+async def aiter_merge(
+    job_title: str,
+    skills: str,
+    companies: Sequence[Dict[str, str]],
+    batch_size: int = BATCH_SIZE,
+    concurrency: int = CONCURRENCY,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Viết email cho từng công ty (bất đồng bộ), trả về kết quả của từng nhóm ngay khi xong"""
+    email_module = get_module(EmailModule)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    start = time.perf_counter()
+
+    async def write(group: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        async with semaphore:
+            try:
+                paragraphs = await email_module.amerge_paragraphs(job_title, skills, group)
+            except Exception as e:
+                return _records("", group, job_title, start, error=e)
+        return _records(await body_task, group, job_title, start, paragraphs)
+
+    body_task = asyncio.ensure_future(email_module.amerge_body(job_title, skills))
+    tasks = [asyncio.ensure_future(write(group)) for group in batches(companies, batch_size)]
+    try:
+        await body_task
+        for future in asyncio.as_completed(tasks):
+            for record in await future:
+                yield record
+    finally:
+        # Client ngắt kết nối hoặc phần chung bị lỗi: dừng các nhóm còn lại
+        for task in [body_task, *tasks]:
+            task.cancel()
+
+
+def summarize(records: Sequence[Dict[str, Any]], elapsed: float, batch_size: int = BATCH_SIZE) -> Dict[str, Any]:
+    """Thống kê một lô: số email, số email có đoạn riêng, lỗi và số lời gọi LLM"""
+    return {
+        "total": len(records),
+        "personalized": sum(bool(r.get("personalized")) for r in records),
+        "failed": sum(r["status"] != "ok" for r in records),
+        "llm_calls": 1 + -(-len(records) // max(1, batch_size)) if records else 0,
+        "elapsed_s": round(elapsed, 2),
+    }
@@ -0,0 +1,206 @@
+"""Xếp hạng hàng loạt CV theo mô tả công việc (JD) bằng embedding.
+
+CV và JD được embed một lần rồi lưu trong `MemmapVectorStore` với khóa là hash
+nội dung, nên cùng một CV/JD gửi lại không phải embed lại. Điểm của mọi cặp
+CV×JD là một phép nhân ma trận duy nhất (cosine trên vector đã chuẩn hóa); chỉ
+các cặp lọt vào top-N của mỗi JD mới được đánh giá chi tiết bằng
+`CVModule.evaluate_cv`.
+"""
+import asyncio
+import contextvars
+import hashlib
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from agent.job_agent import CVModule
+from agent.llm_cache import CACHE_DIR, normalize_text
+from agent.llm_client import get_embeddings, get_module
+from agent.rate_limiter import BATCH, priority
+from agent.vector_store import MemmapVectorStore
+
+EMBEDDING_MODEL = os.getenv("MATCHING_EMBEDDING_MODEL", "text-embedding-3-small")
+# float16 dùng một nửa dung lượng, sai số không đáng kể với cosine
+DTYPE = os.getenv("MATCHING_DTYPE", "float16")
+MAX_DOCUMENTS = int(os.getenv("MATCHING_MAX_DOCUMENTS", "100000"))
+# Văn bản dài hơn bị cắt trước khi embed để không vượt context của model embedding
+MAX_CHARS = int(os.getenv("MATCHING_MAX_CHARS", "12000"))
+TOP_N = int(os.getenv("MATCHING_TOP_N", "5"))
+EVAL_CONCURRENCY = int(os.getenv("MATCHING_EVAL_CONCURRENCY", "8"))
+
+
+def content_key(text: str) -> str:
+    """Khóa của một văn bản theo model embedding và nội dung đã chuẩn hóa"""
+    return hashlib.sha256(f"{EMBEDDING_MODEL}\n{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """Embedding của CV/JD theo hash nội dung, chỉ gọi API cho văn bản chưa có"""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.embeddings = get_embeddings(EMBEDDING_MODEL)
+        self._store: Optional[MemmapVectorStore] = None
+        self._lock = threading.Lock()
+
+    def _get_store(self, dim: int) -> MemmapVectorStore:
+        """Mở kho vector khi đã biết số chiều embedding"""
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    self._store = MemmapVectorStore(self.prefix, dim, MAX_DOCUMENTS, dtype=DTYPE)
+        return self._store
+
+    def _stored_dim(self) -> Optional[int]:
+        """Số chiều của kho đã có trên đĩa (từ các lần chạy trước), None nếu chưa có"""
+        path = self.prefix + ".sqlite3"
+        if not os.path.exists(path):
+            return None
+        with sqlite3.connect(path) as conn:
+            row = conn.execute("SELECT value FROM meta WHERE name = 'layout'").fetchone()
+        return int(row[0].split("x")[0]) if row else None
+
+    def _cached(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Các vector đã có trong kho"""
+        if self._store is None:
+            dim = self._stored_dim()
+            if dim is None:
+                return {}
+            self._get_store(dim)
+        found = {}
+        for key in keys:
+            vector = self._store.get(key)
+            if vector is not None:
+                found[key] = vector
+        return found
+
+    def _save(self, keys: List[str], vectors: List[List[float]]) -> Dict[str, np.ndarray]:
+        """Lưu các vector mới embed"""
+        saved = {}
+        for key, vector in zip(keys, vectors):
+            vector = np.asarray(vector, dtype=np.float32)
+            self._get_store(len(vector)).add(key, vector, "")
+            # Cùng độ chính xác với vector đọc lại từ kho để điểm không đổi giữa các lần gọi
+            saved[key] = vector.astype(DTYPE)
+        return saved
+
+    @staticmethod
+    def _matrix(keys: List[str], vectors: Dict[str, np.ndarray]) -> np.ndarray:
+        """Ma trận các vector đã chuẩn hóa theo thứ tự của `keys`"""
+        return MemmapVectorStore.normalize(np.stack([vectors[key] for key in keys]))
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Ma trận embedding (len(texts) x dim), văn bản trùng nhau chỉ embed một lần"""
+        keys = [content_key(text) for text in texts]
+        vectors = self._cached(keys)
+        missing = {key: text[:MAX_CHARS] for key, text in zip(keys, texts) if key not in vectors}
+        if missing:
+            embedded = self.embeddings.embed_documents(list(missing.values()))
+            vectors.update(self._save(list(missing), embedded))
+        return self._matrix(keys, vectors)
+
+    async def aembed(self, texts: Sequence[str]) -> np.ndarray:
+        """Ma trận embedding (bất đồng bộ)"""
+        keys = [content_key(text) for text in texts]
+        vectors = self._cached(keys)
+        missing = {key: text[:MAX_CHARS] for key, text in zip(keys, texts) if key not in vectors}
+        if missing:
+            embedded = await self.embeddings.aembed_documents(list(missing.values()))
+            vectors.update(self._save(list(missing), embedded))
+        return self._matrix(keys, vectors)
+
+
+def score_matrix(cv_vectors: np.ndarray, jd_vectors: np.ndarray) -> np.ndarray:
+    """Điểm cosine của mọi cặp CV x JD trong một phép nhân ma trận"""
+    return np.asarray(cv_vectors @ jd_vectors.T, dtype=np.float32)
+
+
+def top_matches(scores: np.ndarray, top_n: int) -> List[List[int]]:
+    """Chỉ số các CV có điểm cao nhất cho từng JD (cột của ma trận điểm)"""
+    n = max(0, min(top_n, scores.shape[0]))
+    if n == 0:
+        return [[] for _ in range(scores.shape[1])]
+    top = np.argpartition(-scores, n - 1, axis=0)[:n]
+    ranked = np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, axis=0), axis=0), axis=0)
+    return ranked.T.tolist()
+
+
+def _documents(items: Sequence[Any]) -> List[Dict[str, str]]:
+    """Chuẩn hóa đầu vào: chuỗi hoặc {"id": ..., "text": ...}"""
+    documents = []
+    for i, item in enumerate(items):
+        if isinstance(item, dict):
+            documents.append({"id": str(item.get("id", i)), "text": str(item.get("text", ""))})
+        else:
+            documents.append({"id": str(i), "text": str(item)})
+    return documents
+
+
+class CVMatcher:
+    """Xếp hạng CV theo JD bằng embedding, đánh giá chi tiết bằng LLM cho danh sách rút gọn"""
+
+    def __init__(self):
+        self.store = EmbeddingStore(os.path.join(CACHE_DIR, "matching_embeddings"))
+
+    def _results(self, cvs: List[Dict[str, str]], jds: List[Dict[str, str]], scores: np.ndarray, top_n: int) -> List[Dict[str, Any]]:
+        return [
+            {
+                "jd_id": jd["id"],
+                "matches": [
+                    {"cv_id": cvs[i]["id"], "cv_index": i, "score": round(float(scores[i, j]), 4)}
+                    for i in indices
+                ],
+            }
+            for j, (jd, indices) in enumerate(zip(jds, top_matches(scores, top_n)))
+        ]
+
+    @staticmethod
+    def _evaluate(cv_module: CVModule, cv_text: str, jd_text: str) -> str:
+        """Đánh giá chi tiết một cặp với độ ưu tiên thấp hơn request đơn lẻ từ giao diện"""
+        with priority(BATCH):
+            return cv_module.evaluate_cv(cv_text, jd_text)
+
+    @staticmethod
+    async def _aevaluate(cv_module: CVModule, cv_text: str, jd_text: str) -> str:
+        with priority(BATCH):
+            return await cv_module.aevaluate_cv(cv_text, jd_text)
+
+    def match(self, cvs: Sequence[Any], jds: Sequence[Any], top_n: int = TOP_N, evaluate: bool = False) -> List[Dict[str, Any]]:
+        """Top-N CV cho từng JD; `evaluate=True` để đánh giá chi tiết các cặp trong danh sách rút gọn"""
+        cvs, jds = _documents(cvs), _documents(jds)
+        if not cvs or not jds:
+            return []
+        scores = score_matrix(self.store.embed([cv["text"] for cv in cvs]), self.store.embed([jd["text"] for jd in jds]))
+        results = self._results(cvs, jds, scores, top_n)
+        if evaluate:
+            cv_module = get_module(CVModule)
+            pairs = [(match, cvs[match["cv_index"]]["text"], jd["text"]) for result, jd in zip(results, jds) for match in result["matches"]]
+            with ThreadPoolExecutor(max_workers=EVAL_CONCURRENCY) as pool:
+                # Copy context lúc submit để thread mang theo deadline, trace của request
+                futures = [
+                    pool.submit(contextvars.copy_context().run, self._evaluate, cv_module, cv_text, jd_text)
+                    for _, cv_text, jd_text in pairs
+                ]
+                for (match, _, _), future in zip(pairs, futures):
+                    match["evaluation"] = future.result()
+        return results
+
+    async def amatch(self, cvs: Sequence[Any], jds: Sequence[Any], top_n: int = TOP_N, evaluate: bool = False) -> List[Dict[str, Any]]:
+        """Top-N CV cho từng JD (bất đồng bộ); số lời gọi LLM đồng thời do `LLM_MAX_CONCURRENCY` giới hạn"""
+        cvs, jds = _documents(cvs), _documents(jds)
+        if not cvs or not jds:
+            return []
+        cv_vectors = await self.store.aembed([cv["text"] for cv in cvs])
+        jd_vectors = await self.store.aembed([jd["text"] for jd in jds])
+        results = self._results(cvs, jds, score_matrix(cv_vectors, jd_vectors), top_n)
+        if evaluate:
+            cv_module = get_module(CVModule)
+            pairs = [(match, cvs[match["cv_index"]]["text"], jd["text"]) for result, jd in zip(results, jds) for match in result["matches"]]
+            evaluations = await asyncio.gather(*(self._aevaluate(cv_module, cv_text, jd_text) for _, cv_text, jd_text in pairs))
+            for (match, _, _), evaluation in zip(pairs, evaluations):
+                match["evaluation"] = evaluation
+        return results
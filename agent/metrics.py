@@ -0,0 +1,358 @@
+"""Số liệu đo thời gian, token, chi phí và lỗi theo từng tầng, xuất ở định dạng Prometheus.
+
+Các tầng được đo:
+
+- HTTP: mỗi endpoint (`http_request_duration_seconds`, `http_requests_total`)
+- Node của đồ thị LangGraph (`graph_node_duration_seconds`, `graph_node_errors_total`)
+- Lời gọi LLM: thời gian, time-to-first-token khi stream, thời gian chờ lượt
+  gọi, token prompt/completion/đọc từ cache của provider và chi phí ước tính
+  theo bảng giá; token theo từng prompt của `agent.prompts`
+- Cache, gộp lời gọi (singleflight) và request bị từ chối vì quá tải
+- Lời gọi được hedge (gửi thêm bản sao), bên thắng và lời gọi hết thời hạn
+
+Số liệu tính theo từng process (mỗi worker gunicorn có `/metrics` riêng). Mỗi
+request HTTP còn được gắn header `Server-Timing` với thời gian của các tầng trên.
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from agent.prompts import name_of
+from agent.tracing import prompt_hash, span
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+# Giá USD cho 1 triệu token (prompt/completion), ghi đè bằng LLM_PRICES="gpt-4.1=2/8,..."
+DEFAULT_PRICES = {
+    "gpt-4.1": (2.0, 8.0),
+    "gpt-4.1-mini": (0.4, 1.6),
+    "gpt-4.1-nano": (0.1, 0.4),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+}
+
+
+def _parse_prices(spec: str) -> Dict[str, Tuple[float, float]]:
+    prices = dict(DEFAULT_PRICES)
+    for item in spec.split(","):
+        if "=" in item:
+            model, values = item.split("=", 1)
+            prompt, _, completion = values.partition("/")
+            prices[model.strip()] = (float(prompt), float(completion or prompt))
+    return prices
+
+
+PRICES = _parse_prices(os.getenv("LLM_PRICES", ""))
+# Token prompt đọc từ cache của provider được tính theo tỉ lệ này của giá prompt
+CACHED_PRICE_RATIO = float(os.getenv("LLM_CACHED_PRICE_RATIO", "0.25"))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    """Bộ đếm tăng dần theo nhãn"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, value: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, labels)} {value:g}" for labels, value in items]
+
+
+class Histogram:
+    """Phân bố giá trị theo bucket cố định, đủ để tính p50/p99 bằng histogram_quantile"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # nhãn -> [số đếm theo bucket (không cộng dồn) + bucket +Inf, tổng, số lần]
+        self._values: Dict[Tuple[str, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._values[labels] = entry
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((labels, ([*counts], total, count)) for labels, (counts, total, count) in self._values.items())
+        lines = []
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = 'le="%g"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {total:g}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Any] = []
+
+    def register(self, metric: Any) -> Any:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Nội dung cho endpoint /metrics (text exposition format 0.0.4)"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HTTP_DURATION = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Thời gian xử lý request HTTP (đến khi trả header)", ("endpoint", "method", "status")))
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "http_requests_total", "Số request HTTP", ("endpoint", "method", "status")))
+NODE_DURATION = REGISTRY.register(Histogram(
+    "graph_node_duration_seconds", "Thời gian chạy một node của đồ thị", ("node",)))
+NODE_ERRORS = REGISTRY.register(Counter(
+    "graph_node_errors_total", "Số lần node của đồ thị bị lỗi", ("node",)))
+LLM_DURATION = REGISTRY.register(Histogram(
+    "llm_request_duration_seconds", "Thời gian một lời gọi LLM (không tính thời gian chờ lượt)", ("model", "call")))
+LLM_TTFT = REGISTRY.register(Histogram(
+    "llm_time_to_first_token_seconds", "Thời gian đến đoạn văn bản đầu tiên khi stream", ("model", "call")))
+LLM_QUEUE_WAIT = REGISTRY.register(Histogram(
+    "llm_queue_wait_seconds", "Thời gian chờ lượt gọi theo giới hạn RPM/TPM", ("model",)))
+LLM_REQUESTS = REGISTRY.register(Counter(
+    "llm_requests_total", "Số lời gọi LLM theo kết quả", ("model", "call", "status")))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "llm_tokens_total", "Số token theo loại (prompt/completion/cached)", ("model", "call", "kind")))
+LLM_PROMPT_TOKENS = REGISTRY.register(Counter(
+    "llm_prompt_tokens_total", "Số token prompt và token đọc từ cache theo prompt đã đăng ký", ("prompt", "kind")))
+LLM_COMPLETION_TOKENS = REGISTRY.register(Histogram(
+    "llm_completion_tokens", "Số token completion của mỗi lời gọi", ("model", "call"), buckets=TOKEN_BUCKETS))
+LLM_COST = REGISTRY.register(Counter(
+    "llm_cost_usd_total", "Chi phí ước tính theo bảng giá LLM_PRICES", ("model", "call")))
+LLM_REJECTED = REGISTRY.register(Counter(
+    "llm_rejected_total", "Số lời gọi bị từ chối vì hàng chờ quá tải", ("model",)))
+LLM_COALESCED = REGISTRY.register(Counter(
+    "llm_coalesced_total", "Số lời gọi dùng chung kết quả của một lời gọi giống hệt đang chạy"))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "llm_cache_lookups_total", "Số lần tra cache kết quả LLM", ("namespace", "result")))
+LLM_HEDGES = REGISTRY.register(Counter(
+    "llm_hedged_requests_total", "Số lời gọi LLM được gửi thêm bản sao vì chậm hơn ngưỡng", ("model", "call")))
+LLM_HEDGE_WINS = REGISTRY.register(Counter(
+    "llm_hedge_wins_total", "Lời gọi trả kết quả trước khi có bản sao (primary/hedge)", ("model", "call", "winner")))
+LLM_DEADLINE_EXCEEDED = REGISTRY.register(Counter(
+    "llm_deadline_exceeded_total", "Số lời gọi LLM bị dừng vì hết thời hạn", ("model", "call")))
+
+
+# Thời gian các tầng trong request hiện tại, dùng cho header Server-Timing
+_timings: contextvars.ContextVar[Optional[Dict[str, List[float]]]] = contextvars.ContextVar("server_timings", default=None)
+# Node đồ thị đang chạy, dùng làm nhãn `call` cho lời gọi LLM không thuộc module nào
+_stage: contextvars.ContextVar[str] = contextvars.ContextVar("metrics_stage", default="other")
+
+
+def start_request() -> None:
+    """Bắt đầu ghi thời gian cho request hiện tại"""
+    _timings.set({})
+
+
+def add_timing(name: str, seconds: float) -> None:
+    """Cộng thời gian vào mục `name` của Server-Timing (nếu đang trong request)"""
+    timings = _timings.get()
+    if timings is not None:
+        entry = timings.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+
+def server_timing(total: float) -> str:
+    """Giá trị header Server-Timing, vd. `total;dur=812.4, llm;dur=790.1;desc="2 calls"`"""
+    parts = [f"total;dur={total * 1000:.1f}"]
+    for name, (seconds, count) in (_timings.get() or {}).items():
+        # Header HTTP chỉ chứa được ký tự latin-1
+        desc = f';desc="{count} calls"' if count > 1 else ""
+        parts.append(f"{name};dur={seconds * 1000:.1f}{desc}")
+    return ", ".join(parts)
+
+
+def observe_request(endpoint: str, method: str, status: int, seconds: float) -> None:
+    HTTP_DURATION.observe(seconds, endpoint, method, str(status))
+    HTTP_REQUESTS.inc(endpoint, method, str(status))
+
+
+def current_stage() -> str:
+    return _stage.get()
+
+
+@contextmanager
+def track_node(node: str):
+    """Đo thời gian một node của đồ thị"""
+    token = _stage.set(node)
+    start = time.perf_counter()
+    try:
+        with span(f"node.{node}"):
+            yield
+    except Exception:
+        NODE_ERRORS.inc(node)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        _stage.reset(token)
+        NODE_DURATION.observe(elapsed, node)
+        add_timing(node, elapsed)
+
+
+def instrument_node(node: str, func, afunc):
+    """Bọc hàm đồng bộ và bất đồng bộ của một node để đo thời gian"""
+    @functools.wraps(func)
+    def run(state):
+        with track_node(node):
+            return func(state)
+
+    @functools.wraps(afunc)
+    async def arun(state):
+        with track_node(node):
+            return await afunc(state)
+
+    return run, arun
+
+
+class LLMCall:
+    """Số liệu của một lời gọi LLM: thời gian, TTFT, token và chi phí"""
+
+    def __init__(self, model: str, call: str, trace_span: Any, prompt: Optional[str] = None):
+        self.model = model
+        self.call = call
+        self.prompt = prompt
+        self.span = trace_span
+        self.start = time.perf_counter()
+        self.first_token: Optional[float] = None
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+        self.cached_tokens = 0
+
+    @property
+    def total_tokens(self) -> Optional[int]:
+        if self.prompt_tokens is None:
+            return None
+        return self.prompt_tokens + (self.completion_tokens or 0)
+
+    def usage(self, message: Any) -> Optional[int]:
+        """Ghi nhận token từ `usage_metadata` của message (nếu API trả về), trả về tổng token"""
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            self.prompt_tokens = (self.prompt_tokens or 0) + usage.get("input_tokens", 0)
+            self.completion_tokens = (self.completion_tokens or 0) + usage.get("output_tokens", 0)
+            self.cached_tokens += (usage.get("input_token_details") or {}).get("cache_read") or 0
+        return self.total_tokens
+
+    def chunk(self, chunk: Any) -> None:
+        """Ghi nhận một đoạn khi stream: thời điểm đoạn đầu tiên và usage ở đoạn cuối"""
+        if self.first_token is None and getattr(chunk, "content", None):
+            self.first_token = time.perf_counter() - self.start
+            LLM_TTFT.observe(self.first_token, self.model, self.call)
+            add_timing("llm_ttft", self.first_token)
+        self.usage(chunk)
+
+    def finish(self, status: str) -> None:
+        elapsed = time.perf_counter() - self.start
+        LLM_DURATION.observe(elapsed, self.model, self.call)
+        LLM_REQUESTS.inc(self.model, self.call, status)
+        add_timing("llm", elapsed)
+        self.span.set(status=status)
+        if self.first_token is not None:
+            self.span.set(ttft_ms=round(self.first_token * 1000, 1))
+        if self.prompt_tokens is None:
+            return
+        self.span.set(prompt_tokens=self.prompt_tokens, completion_tokens=self.completion_tokens or 0,
+                      cached_tokens=self.cached_tokens)
+        LLM_TOKENS.inc(self.model, self.call, "prompt", value=self.prompt_tokens)
+        LLM_TOKENS.inc(self.model, self.call, "completion", value=self.completion_tokens or 0)
+        LLM_TOKENS.inc(self.model, self.call, "cached", value=self.cached_tokens)
+        LLM_COMPLETION_TOKENS.observe(self.completion_tokens or 0, self.model, self.call)
+        if self.prompt is not None:
+            LLM_PROMPT_TOKENS.inc(self.prompt, "prompt", value=self.prompt_tokens)
+            LLM_PROMPT_TOKENS.inc(self.prompt, "cached", value=self.cached_tokens)
+        price = PRICES.get(self.model)
+        if price is not None:
+            prompt_cost = (self.prompt_tokens - self.cached_tokens + self.cached_tokens * CACHED_PRICE_RATIO) * price[0]
+            cost = (prompt_cost + (self.completion_tokens or 0) * price[1]) / 1_000_000
+            LLM_COST.inc(self.model, self.call, value=cost)
+
+
+@contextmanager
+def track_llm(model: str, call: Optional[str] = None, prompt: Optional[str] = None):
+    """Đo một lời gọi LLM và ghi span trace; `call` mặc định là node đồ thị đang chạy"""
+    call = call or current_stage()
+    with span(f"llm.{call}", model=model) as trace_span:
+        if trace_span.recording and prompt is not None:
+            trace_span.set(prompt_hash=prompt_hash(prompt), prompt_chars=len(prompt))
+        llm_call = LLMCall(model, call, trace_span, name_of(prompt) if prompt is not None else None)
+        try:
+            yield llm_call
+        except (GeneratorExit, asyncio.CancelledError):
+            # Client ngắt kết nối giữa lúc stream
+            llm_call.finish("cancelled")
+            raise
+        except BaseException:
+            llm_call.finish("error")
+            raise
+        llm_call.finish("ok")
+
+
+def observe_queue_wait(model: str, seconds: float) -> None:
+    LLM_QUEUE_WAIT.observe(seconds, model)
+    add_timing("llm_queue", seconds)
+
+
+def _reset() -> None:
+    """Lock của số liệu có thể đang bị giữ bởi thread của tiến trình cha"""
+    for metric in REGISTRY.metrics:
+        metric._lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset)
@@ -0,0 +1,149 @@
+"""Cấu hình model cho từng node của đồ thị và từng phương thức của module.
+
+Mỗi lời gọi LLM có một tên:
+
+- `node.process_query`: định tuyến (nhóm `route`)
+- `node.find_jobs`, `node.write_email`, `node.evaluate_cv`, `node.find_companies`,
+  `node.create_cv`: trích xuất tham số trong các node thực thi (nhóm `extract`)
+- `find_jobs`, `find_jobs_structured`, `write_application_email`, `evaluate_cv`,
+  `evaluate_cv_section` (nhận xét từng phần của CV dài), `create_cv`,
+  `create_cv_section` (sinh từng mục của CV), `mail_merge_body`, `mail_merge_paragraphs`
+  (email ứng tuyển hàng loạt),
+  `find_top_companies`, `find_top_companies_structured`, `company_stats_narrative`
+  (nhận xét số liệu thống kê công ty): sinh nội dung trong các module (nhóm `generate`)
+
+Cấu hình (model, temperature, max_tokens, timeout) được ghép theo thứ tự, mục sau
+ghi đè mục trước: mặc định của nhóm và của lời gọi -> preset (`LLM_MODEL_PRESET`) -> file JSON
+(`LLM_MODEL_CONFIG`, khóa là tên nhóm hoặc tên lời gọi) -> biến môi trường
+`LLM_<TÊN>_<THAM SỐ>`, vd. `LLM_EXTRACT_MODEL=gpt-4.1-mini`,
+`LLM_NODE_PROCESS_QUERY_TIMEOUT=10`, `LLM_FIND_JOBS_TEMPERATURE=0.5`.
+
+`timeout` (giây) vừa là timeout của HTTP client vừa là thời hạn của mỗi lần gọi API
+(kể cả bản gọi dự phòng), tính từ lúc đã đến lượt theo `agent.rate_limiter` nên không
+gồm thời gian chờ hàng đợi; luôn bị chặn bởi thời hạn còn lại của request (`agent.deadline`).
+
+    python -m agent.model_config   # in cấu hình đang dùng
+"""
+import json
+import os
+from typing import Any, Dict, Optional
+
+PRESET = os.getenv("LLM_MODEL_PRESET", "default")
+CONFIG_PATH = os.getenv("LLM_MODEL_CONFIG", "")
+
+SMALL_MODEL = os.getenv("LLM_SMALL_MODEL", "gpt-4.1-mini")
+
+# Nhóm của từng lời gọi
+CALLS: Dict[str, str] = {
+    "node.process_query": "route",
+    "node.find_jobs": "extract",
+    "node.write_email": "extract",
+    "node.evaluate_cv": "extract",
+    "node.find_companies": "extract",
+    "node.create_cv": "extract",
+    "find_jobs": "generate",
+    "find_jobs_structured": "generate",
+    "write_application_email": "generate",
+    "evaluate_cv": "generate",
+    "evaluate_cv_section": "generate",
+    "create_cv": "generate",
+    "create_cv_section": "generate",
+    "mail_merge_body": "generate",
+    "mail_merge_paragraphs": "generate",
+    "find_top_companies": "generate",
+    "find_top_companies_structured": "generate",
+    "company_stats_narrative": "generate",
+}
+
+DEFAULTS: Dict[str, Dict[str, Any]] = {
+    "route": {"model": "gpt-4.1", "temperature": 0.2, "max_tokens": None, "timeout": 30},
+    "extract": {"model": "gpt-4.1", "temperature": 0.2, "max_tokens": None, "timeout": 30},
+    "generate": {"model": "gpt-4.1", "temperature": 0.7, "max_tokens": None, "timeout": 90},
+}
+
+# Mặc định riêng của một số lời gọi (ghi đè mặc định của nhóm)
+CALL_DEFAULTS: Dict[str, Dict[str, Any]] = {
+    # Nhận xét từng phần của CV dài chỉ cần ngắn, bước tổng hợp chờ phần chậm nhất
+    "evaluate_cv_section": {"max_tokens": 250},
+    "create_cv_section": {"max_tokens": 600},
+    "company_stats_narrative": {"max_tokens": 300},
+}
+
+PRESETS: Dict[str, Dict[str, Dict[str, Any]]] = {
+    "default": {},
+    # Định tuyến và trích xuất JSON chỉ cần model nhỏ; phần sinh nội dung giữ nguyên model lớn.
+    # Không đặt max_tokens vì tham số trích xuất có thể chứa nguyên văn CV.
+    "fast": {
+        "route": {"model": SMALL_MODEL, "temperature": 0.0, "timeout": 20},
+        "extract": {"model": SMALL_MODEL, "temperature": 0.0, "timeout": 20},
+        "evaluate_cv_section": {"model": SMALL_MODEL},
+    },
+}
+
+FIELDS = {"model": str, "temperature": float, "max_tokens": int, "timeout": float}
+
+_resolved: Dict[str, Dict[str, Any]] = {}
+
+
+def _load_file(path: str) -> Dict[str, Dict[str, Any]]:
+    """Đọc file cấu hình JSON: {"extract": {"model": "..."}, "node.process_query": {...}}"""
+    if not path:
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _from_env(name: str) -> Dict[str, Any]:
+    """Các tham số đặt qua biến môi trường LLM_<TÊN>_<THAM SỐ>"""
+    prefix = "LLM_" + name.upper().replace(".", "_") + "_"
+    settings = {}
+    for field, cast in FIELDS.items():
+        value = os.getenv(prefix + field.upper())
+        if value is not None:
+            settings[field] = cast(value) if value != "" else None
+    return settings
+
+
+def _check(name: str, settings: Dict[str, Any]) -> Dict[str, Any]:
+    unknown = set(settings) - set(FIELDS)
+    if unknown:
+        raise ValueError(f"Tham số không hợp lệ cho {name}: {', '.join(sorted(unknown))}")
+    return settings
+
+
+def settings_for(name: str) -> Dict[str, Any]:
+    """Tham số tạo ChatOpenAI cho lời gọi `name` (model, temperature, max_tokens, timeout)"""
+    settings = _resolved.get(name)
+    if settings is None:
+        if name not in CALLS:
+            raise ValueError(f"Lời gọi LLM không xác định: {name}")
+        if PRESET not in PRESETS:
+            raise ValueError(f"Preset không hợp lệ: {PRESET} (có: {', '.join(PRESETS)})")
+        group = CALLS[name]
+        preset = PRESETS[PRESET]
+        config = _load_file(CONFIG_PATH)
+        settings = dict(DEFAULTS[group], **CALL_DEFAULTS.get(name, {}))
+        for layer in (preset.get(group), preset.get(name), config.get(group), config.get(name), _from_env(group), _from_env(name)):
+            if layer:
+                settings.update(_check(name, layer))
+        _resolved[name] = settings
+    return settings
+
+
+def reset() -> None:
+    """Đọc lại cấu hình ở lần gọi tiếp theo"""
+    _resolved.clear()
+
+
+def describe() -> Dict[str, Dict[str, Any]]:
+    """Cấu hình đang dùng của mọi lời gọi"""
+    return {name: settings_for(name) for name in CALLS}
+
+
+if __name__ == "__main__":
+    print(f"Preset: {PRESET}" + (f", file: {CONFIG_PATH}" if CONFIG_PATH else ""))
+    for name, settings in describe().items():
+        print(
+            f"{name:32} {CALLS[name]:9} {settings['model']:16} "
+            f"temperature={settings['temperature']} max_tokens={settings['max_tokens']} timeout={settings['timeout']}"
+        )
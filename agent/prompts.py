@@ -0,0 +1,391 @@
+"""Registry các mẫu prompt của agent, biên dịch một lần khi import.
+
+Mỗi prompt gồm phần hướng dẫn cố định đứng trước (giống hệt nhau ở mọi request) và
+phần dữ liệu của người dùng ở cuối, xếp từ ít thay đổi đến hay thay đổi nhất (vd.
+mô tả công việc trước nội dung từng phần CV). Nhờ vậy provider có thể dùng lại
+prefix đã cache (OpenAI cache tự động khi phần đầu giống nhau dài từ 1024 token),
+phần đó được tính tiền và xử lý ở tốc độ cache. Mẫu được tách thành các đoạn
+văn bản và tên biến ngay khi import, mỗi request chỉ còn ghép chuỗi.
+
+Số token prompt và token đọc từ cache của từng prompt được ghi vào
+`llm_prompt_tokens_total{prompt, kind}` (xem `agent.metrics`).
+
+    python -m agent.prompts   # liệt kê các prompt và độ dài phần cố định
+"""
+import sys
+import textwrap
+from string import Formatter
+from typing import Dict, List, Optional, Tuple
+
+# Độ dài prefix tối thiểu để provider cache (token)
+CACHE_MIN_TOKENS = 1024
+
+
+def count_tokens(text: str) -> int:
+    """Ước lượng số token (~3 ký tự/token với tiếng Việt)"""
+    return len(text) // 3 + 1
+
+
+class Prompt:
+    """Mẫu prompt đã biên dịch: `prefix` cố định, sau đó là phần dữ liệu có biến `{tên}`"""
+
+    __slots__ = ("name", "prefix", "fields", "_pieces")
+
+    def __init__(self, name: str, instructions: str, data: str):
+        self.name = name
+        self.prefix = textwrap.dedent(instructions).strip() + "\n\n"
+        self._pieces: List[Tuple[str, Optional[str]]] = []
+        for literal, field, spec, conversion in Formatter().parse(textwrap.dedent(data).strip()):
+            if spec or conversion:
+                raise ValueError(f"Prompt {name}: không hỗ trợ định dạng {{{field}!{conversion}:{spec}}}")
+            self._pieces.append((literal, field))
+        self.fields = tuple(dict.fromkeys(field for _, field in self._pieces if field is not None))
+
+    @property
+    def prefix_tokens(self) -> int:
+        return count_tokens(self.prefix)
+
+    def format(self, **values: object) -> str:
+        """Ghép prompt; thiếu biến sẽ ném KeyError như `str.format`"""
+        parts = [self.prefix]
+        for literal, field in self._pieces:
+            parts.append(literal)
+            if field is not None:
+                parts.append(str(values[field]))
+        return "".join(parts)
+
+
+PROMPTS: Dict[str, Prompt] = {}
+
+
+def register(name: str, instructions: str, data: str) -> Prompt:
+    """Biên dịch và đăng ký một prompt"""
+    if name in PROMPTS:
+        raise ValueError(f"Prompt {name} đã được đăng ký")
+    prompt = PROMPTS[name] = Prompt(name, instructions, data)
+    return prompt
+
+
+def get(name: str) -> Prompt:
+    return PROMPTS[name]
+
+
+def name_of(text: str) -> Optional[str]:
+    """Tên prompt đã đăng ký sinh ra `text` (theo phần cố định), None nếu không có"""
+    for prompt in PROMPTS.values():
+        if text.startswith(prompt.prefix):
+            return prompt.name
+    return None
+
+
+_HTML_RULES = """
+    Yêu cầu: trả về kết quả dưới dạng HTML (không được hiển thị các text kiểu thẻ trong html, nội dung phải chính xác chỉn chu từng câu chữ do kết quả trả về sẽ được tôi dùng để hiển thị trực tiếp lên cho người dùng đọc)
+    , gạch thành các ý, format giao diện dễ đọc, có kết luận cuối cùng, hightline vào các ý chính, màu sắc của tiêu đề và nội dung bên trong không được trùng nhau
+
+    Luôn trả về dạng HTML"""
+
+_CV_CRITERIA = """
+    1. Định dạng và trì bày
+    2. Nội dung và cách diễn đạt
+    3. Kỹ năng và kinh nghiệm nổi bật
+    4. Điểm cần cải thiện
+    5. Gợi ý cụ thể để nâng cao chất lượng CV"""
+
+_FUNCTIONS = """
+    - find_jobs: Tìm kiếm việc làm
+    - write_email: Viết email ứng tuyển
+    - evaluate_cv: Đánh giá CV
+    - find_companies: Tìm công ty phù hợp
+    - create_cv: Tạo CV mới"""
+
+# Module chức năng
+register("find_jobs", """
+    Bạn là một trợ lý tìm việc chuyên nghiệp. Hãy giúp tôi tìm kiếm công việc phù hợp dựa trên thông tin ở cuối.
+
+    Hãy liệt kê 5 công việc phù hợp nhất, bao gồm:
+    1. Tên vị trí
+    2. Công ty
+    3. Mức lương ước tính
+    4. Yêu cầu chính
+    5. Lý do phù hợp
+
+    Trả lời bằng tiếng Việt và định dạng rõ ràng.""" + _HTML_RULES, """
+    Mô tả công việc: {job_description}
+    Mức lương mong muốn: {salary}
+    Địa điểm: {location}
+    Kinh nghiệm: {experience} năm
+    {postings}""")
+
+register("find_jobs_structured", """
+    Bạn là một trợ lý tìm việc chuyên nghiệp. Hãy tìm 5 công việc phù hợp nhất với thông tin ở cuối.
+
+    Chỉ điền dữ liệu vào các trường, mỗi trường ngắn gọn, không dùng HTML hay markdown. Trả lời bằng tiếng Việt.""", """
+    Mô tả công việc: {job_description}
+    Mức lương mong muốn: {salary}
+    Địa điểm: {location}
+    Kinh nghiệm: {experience} năm
+    {postings}""")
+
+register("write_application_email", """
+    Bạn là một chuyên gia viết email ứng tuyển. Hãy viết một email ứng tuyển chuyên nghiệp dựa trên thông tin ở cuối.
+
+    Email cần có:
+    1. Lời chào và giới thiệu bản thân
+    2. Lý do quan tâm đến công ty và vị trí
+    3. Tóm tắt kỹ năng và kinh nghiệm phù hợp
+    4. Kết thúc lịch sự và mong muốn phỏng vấn
+
+    Trả lời bằng tiếng Việt và định dạng rõ ràng.""", """
+    Vị trí ứng tuyển: {job_title}
+    Công ty: {company}
+    Kỹ năng và kinh nghiệm của ứng viên: {skills}""")
+
+# Email ứng tuyển hàng loạt (agent.mail_merge): phần chung sinh một lần, đoạn riêng theo nhóm công ty
+register("mail_merge_body", """
+    Bạn là một chuyên gia viết email ứng tuyển. Hãy viết một email ứng tuyển chuyên nghiệp dùng chung
+    để gửi cho nhiều công ty, dựa trên thông tin ở cuối.
+
+    Email cần có:
+    1. Dòng đầu tiên là tiêu đề email, dạng "Tiêu đề: ..."
+    2. Lời chào và giới thiệu bản thân
+    3. Một dòng chỉ gồm [ĐOẠN_RIÊNG] (chỗ chèn đoạn văn riêng cho từng công ty, không tự viết đoạn này)
+    4. Tóm tắt kỹ năng và kinh nghiệm phù hợp
+    5. Kết thúc lịch sự và mong muốn phỏng vấn
+
+    Ở mọi chỗ cần tên công ty, viết đúng [CÔNG_TY]; không nhắc đến công ty cụ thể nào.
+    Trả lời bằng tiếng Việt.""", """
+    Vị trí ứng tuyển: {job_title}
+    Kỹ năng và kinh nghiệm của ứng viên: {skills}""")
+
+register("mail_merge_paragraphs", """
+    Bạn là một chuyên gia viết email ứng tuyển. Ứng viên ở cuối gửi cùng một email cho nhiều công ty.
+    Với mỗi công ty trong danh sách, hãy viết một đoạn 2-3 câu nêu lý do ứng viên quan tâm đến
+    chính công ty đó (lĩnh vực, sản phẩm, văn hóa) và vì sao kỹ năng của ứng viên phù hợp.
+
+    Mỗi đoạn chỉ nói về một công ty, không có lời chào hay ký tên. Trả về mỗi công ty một phần tử
+    gồm tên công ty (giữ nguyên như trong danh sách, không kèm ghi chú) và đoạn văn. Trả lời bằng tiếng Việt.""", """
+    Vị trí ứng tuyển: {job_title}
+    Kỹ năng và kinh nghiệm của ứng viên: {skills}
+
+    Số công ty: {count}
+    {companies}""")
+
+register("evaluate_cv", """
+    Bạn là một chuyên gia tuyển dụng và đánh giá CV. Hãy đánh giá CV ở cuối và đưa ra gợi ý cải thiện.
+
+    Hãy đánh giá các khía cạnh sau:""" + _CV_CRITERIA + """
+
+    Trả lời bằng tiếng Việt và định dạng rõ ràng.""", """
+    {job_context}
+
+    CV: {cv_text}""")
+
+register("evaluate_cv_section", """
+    Bạn là một chuyên gia tuyển dụng. Ở cuối là một phần của một CV dài.
+
+    Hãy ghi chú thật ngắn gọn (tối đa 100 từ, gạch đầu dòng) về phần này:
+    - Điểm mạnh, kỹ năng và kinh nghiệm nổi bật
+    - Điểm yếu, nội dung thiếu hoặc diễn đạt chưa tốt
+    - Gợi ý cải thiện cụ thể
+
+    Trả lời bằng tiếng Việt.""", """
+    {job_context}
+
+    Các mục: {title}
+
+    {text}""")
+
+register("evaluate_cv_summary", """
+    Bạn là một chuyên gia tuyển dụng và đánh giá CV. Một CV dài đã được nhận xét theo từng phần (ở cuối).
+
+    Dựa trên các nhận xét, hãy đánh giá toàn bộ CV theo các khía cạnh sau:""" + _CV_CRITERIA + """
+
+    Trả lời bằng tiếng Việt và định dạng rõ ràng.""", """
+    {job_context}
+
+    Cấu trúc CV:
+    {structure}
+
+    Nhận xét từng phần:
+    {notes}""")
+
+register("create_cv", """
+    Bạn là một chuyên gia tạo CV. Hãy tạo một CV chuyên nghiệp dựa trên thông tin ở cuối.
+
+    Hãy tạo một CV với định dạng rõ ràng, chuyên nghiệp, bao gồm:
+    1. Thông tin cá nhân
+    2. Mục tiêu nghề nghiệp
+    3. Học vấn
+    4. Kinh nghiệm làm việc
+    5. Kỹ năng
+    6. Thành tích (nếu có thể suy luận từ thông tin cung cấp)
+
+    Trả lời bằng tiếng Việt và định dạng rõ ràng.""", """
+    Họ và tên: {name}
+    Email: {email}
+    Số điện thoại: {phone}
+    Học vấn: {education}
+    Kinh nghiệm làm việc: {experience}
+    Kỹ năng: {skills}""")
+
+# Từng mục của CV (agent.cv_builder), mỗi prompt chỉ chứa các trường mà mục phụ thuộc
+_CV_SECTION_RULES = """
+
+    Chỉ trả về nội dung của mục này dưới dạng văn bản thuần (không tiêu đề, lời mở đầu hay giải thích),
+    không thêm thông tin không có trong dữ liệu. Trả lời bằng tiếng Việt."""
+
+register("create_cv.objective", """
+    Bạn là một chuyên gia tạo CV. Hãy viết mục Mục tiêu nghề nghiệp (2-3 câu, ngắn gọn, chuyên nghiệp)
+    cho CV dựa trên kinh nghiệm và kỹ năng ở cuối.""" + _CV_SECTION_RULES, """
+    Kinh nghiệm làm việc: {experience}
+    Kỹ năng: {skills}""")
+
+register("create_cv.education", """
+    Bạn là một chuyên gia tạo CV. Hãy trình bày mục Học vấn của CV từ thông tin ở cuối:
+    mỗi mục một dòng gồm trường, bằng cấp/chuyên ngành, thời gian và điểm nổi bật (nếu có).""" + _CV_SECTION_RULES, """
+    Học vấn: {education}""")
+
+register("create_cv.experience", """
+    Bạn là một chuyên gia tạo CV. Hãy trình bày mục Kinh nghiệm làm việc của CV từ thông tin ở cuối:
+    mỗi vị trí gồm công ty, chức danh, thời gian và 2-4 gạch đầu dòng về trách nhiệm và kết quả,
+    bắt đầu bằng động từ mạnh.""" + _CV_SECTION_RULES, """
+    Kinh nghiệm làm việc: {experience}""")
+
+register("create_cv.skills", """
+    Bạn là một chuyên gia tạo CV. Hãy trình bày mục Kỹ năng của CV từ thông tin ở cuối,
+    nhóm theo chuyên môn, công cụ và kỹ năng mềm, mỗi nhóm một gạch đầu dòng.""" + _CV_SECTION_RULES, """
+    Kỹ năng: {skills}""")
+
+register("create_cv.achievements", """
+    Bạn là một chuyên gia tạo CV. Hãy liệt kê 2-4 thành tích (gạch đầu dòng) có thể suy luận
+    từ học vấn và kinh nghiệm ở cuối.""" + _CV_SECTION_RULES, """
+    Học vấn: {education}
+    Kinh nghiệm làm việc: {experience}""")
+
+register("find_top_companies", """
+    Bạn là một chuyên gia phân tích thị trường việc làm. Hãy liệt kê và phân tích các công ty hàng đầu phù hợp với thông tin ở cuối.
+
+    Hãy liệt kê 10 công ty phù hợp nhất, bao gồm:
+    1. Tên công ty
+    2. Lĩnh vực hoạt động chính
+    3. Quy mô công ty
+    4. Lý do phù hợp với kỹ năng của ứng viên
+    5. Cơ hội phát triển
+
+    Trả lời bằng tiếng Việt và định dạng rõ ràng.""", """
+    Kỹ năng và kinh nghiệm: {skills}
+    Ngành nghề: {industry}
+    Địa điểm: {location}""")
+
+register("find_top_companies_structured", """
+    Bạn là một chuyên gia phân tích thị trường việc làm. Hãy liệt kê 10 công ty hàng đầu phù hợp với thông tin ở cuối.
+
+    Chỉ điền dữ liệu vào các trường, mỗi trường ngắn gọn, không dùng HTML hay markdown. Trả lời bằng tiếng Việt.""", """
+    Kỹ năng và kinh nghiệm: {skills}
+    Ngành nghề: {industry}
+    Địa điểm: {location}""")
+
+register("company_stats_narrative", """
+    Bạn là một chuyên gia phân tích thị trường việc làm. Dựa trên số liệu thống kê công ty ở cuối
+    (đã tính từ dữ liệu thật), hãy viết một đoạn nhận xét ngắn 3-4 câu cho ứng viên: ngành, địa điểm
+    và quy mô công ty nổi bật, kỹ năng được nhiều công ty dùng và nên ưu tiên ứng tuyển ở đâu.
+
+    Chỉ dùng các con số và tên công ty có trong số liệu, không bịa thêm. Trả lời bằng tiếng Việt,
+    văn bản thuần, không dùng HTML hay markdown.""", """
+    Kỹ năng và kinh nghiệm: {skills}
+    Ngành nghề: {industry}
+    Địa điểm: {location}
+
+    Số liệu:
+    {stats}""")
+
+# Định tuyến
+register("route", """
+    Dựa vào yêu cầu của người dùng (ở cuối), hãy xác định chức năng cần thực hiện.
+
+    Trả về một trong các giá trị sau:""" + _FUNCTIONS, """
+    Yêu cầu: {query}""")
+
+register("route_fused", """
+    Dựa vào yêu cầu của người dùng (ở cuối), hãy xác định chức năng cần thực hiện và trích xuất luôn các thông tin cần thiết cho chức năng đó.
+
+    Các chức năng:""" + _FUNCTIONS + """
+
+    Chỉ điền tham số cho đúng chức năng đã chọn, để trống các chức năng còn lại.""", """
+    Yêu cầu: {query}""")
+
+register("extract_args", """
+    Chức năng cần thực hiện đã được xác định. Từ yêu cầu của người dùng (ở cuối), hãy trích xuất các thông tin cần thiết cho chức năng đó.
+
+    Chỉ điền dữ liệu vào các trường, để trống các thông tin không có trong yêu cầu.""", """
+    Yêu cầu: {query}""")
+
+# Trích xuất tham số trong các node (mẫu JSON nằm ở phần cố định nên không cần escape dấu ngoặc)
+register("extract.find_jobs", """
+    Từ yêu cầu của người dùng (ở cuối), hãy trích xuất các thông tin sau về công việc cần tìm.
+
+    Trả về kết quả theo định dạng JSON:
+    {
+        "job_description": "Mô tả công việc",
+        "salary": "Mức lương mong muốn (nếu có)",
+        "location": "Địa điểm làm việc (nếu có)",
+        "experience": "Số năm kinh nghiệm (nếu có, chỉ số)"
+    }""", """
+    Yêu cầu: {query}""")
+
+register("extract.write_email", """
+    Từ yêu cầu của người dùng (ở cuối), hãy trích xuất các thông tin sau về email ứng tuyển.
+
+    Trả về kết quả theo định dạng JSON:
+    {
+        "job_title": "Vị trí công việc",
+        "company": "Tên công ty",
+        "skills": "Kỹ năng và kinh nghiệm của ứng viên"
+    }""", """
+    Yêu cầu: {query}""")
+
+register("extract.evaluate_cv", """
+    Từ yêu cầu của người dùng (ở cuối), hãy trích xuất các thông tin sau về CV cần đánh giá.
+
+    Trả về kết quả theo định dạng JSON:
+    {
+        "cv_text": "Nội dung CV (nếu có)",
+        "job_description": "Mô tả công việc ứng tuyển (nếu có)"
+    }""", """
+    Yêu cầu: {query}""")
+
+register("extract.find_companies", """
+    Từ yêu cầu của người dùng (ở cuối), hãy trích xuất các thông tin sau về công ty cần tìm.
+
+    Trả về kết quả theo định dạng JSON:
+    {
+        "skills": "Kỹ năng và kinh nghiệm của ứng viên",
+        "industry": "Ngành nghề quan tâm",
+        "location": "Địa điểm làm việc (nếu có)"
+    }""", """
+    Yêu cầu: {query}""")
+
+register("extract.create_cv", """
+    Từ yêu cầu của người dùng (ở cuối), hãy trích xuất các thông tin sau để tạo CV.
+
+    Trả về kết quả theo định dạng JSON:
+    {
+        "name": "Họ và tên",
+        "email": "Email",
+        "phone": "Số điện thoại (nếu có)",
+        "education": "Học vấn (nếu có)",
+        "experience": "Kinh nghiệm làm việc",
+        "skills": "Kỹ năng"
+    }""", """
+    Yêu cầu: {query}""")
+
+
+def main() -> int:
+    print(f"{'prompt':32} {'prefix':>7}  biến")
+    for prompt in PROMPTS.values():
+        print(f"{prompt.name:32} {prompt.prefix_tokens:7d}  {', '.join(prompt.fields)}")
+    print(f"(prefix: số token ước lượng của phần cố định; provider chỉ cache prefix từ {CACHE_MIN_TOKENS} token)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,388 @@
+"""Điều phối các lời gọi LLM theo giới hạn RPM/TPM của nhà cung cấp.
+
+Mỗi model có hai token bucket: số request và số token mỗi phút. Trước khi gọi,
+số token của request được ước lượng từ độ dài prompt và `max_tokens`; request
+phải chờ đến lượt (theo độ ưu tiên, cùng độ ưu tiên thì theo thứ tự đến) cho
+tới khi cả hai bucket đủ chỗ. Sau khi có kết quả, phần chênh lệch giữa ước
+lượng và số token thực tế được trả lại bucket.
+
+Request từ giao diện (mặc định) được ưu tiên hơn việc chạy nền (`priority(BATCH)`:
+đánh giá hàng loạt, hàng đợi tác vụ). Khi hàng chờ đầy hoặc thời gian chờ ước
+lượng vượt giới hạn, request bị từ chối ngay bằng `LLMOverloaded` (API trả về
+503 kèm Retry-After) thay vì treo đến khi hết thời gian.
+
+Bucket nằm trong bộ nhớ của từng process nên hạn mức của tài khoản được chia
+đều cho số worker (`LLM_RATE_LIMIT_WORKERS`, mặc định lấy `WEB_CONCURRENCY`).
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from agent.deadline import DeadlineExceeded, remaining
+from agent.metrics import LLM_REJECTED, observe_queue_wait
+from agent.tracing import span
+
+ENABLED = os.getenv("LLM_RATE_LIMIT", "1") != "0"
+DEFAULT_RPM = float(os.getenv("LLM_RPM", "500"))
+DEFAULT_TPM = float(os.getenv("LLM_TPM", "200000"))
+# Giới hạn riêng theo model: "gpt-4.1=500/30000,gpt-4.1-mini=500/200000"
+MODEL_LIMITS = os.getenv("LLM_RATE_LIMITS", "")
+# Số process cùng dùng hạn mức trên (gunicorn/uvicorn đọc WEB_CONCURRENCY cho số worker)
+WORKERS = max(1, int(os.getenv("LLM_RATE_LIMIT_WORKERS") or os.getenv("WEB_CONCURRENCY") or "1"))
+# Số token trả lời ước lượng khi model không đặt max_tokens
+COMPLETION_TOKENS = int(os.getenv("LLM_ESTIMATED_COMPLETION_TOKENS", "800"))
+
+INTERACTIVE = 0
+BATCH = 1
+
+QUEUE_MAX = {
+    INTERACTIVE: int(os.getenv("LLM_QUEUE_MAX", "200")),
+    BATCH: int(os.getenv("LLM_BATCH_QUEUE_MAX", "10000")),
+}
+QUEUE_TIMEOUT = {
+    INTERACTIVE: float(os.getenv("LLM_QUEUE_TIMEOUT", "20")),
+    BATCH: float(os.getenv("LLM_BATCH_QUEUE_TIMEOUT", "600")),
+}
+# Khoảng hỏi lại của lời gọi bất đồng bộ khi chưa tới lượt
+ASYNC_POLL_INTERVAL = 0.02
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+
+class LLMOverloaded(Exception):
+    """Hàng chờ gọi LLM đã đầy, client nên thử lại sau `retry_after` giây"""
+
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"Hàng chờ gọi LLM cho {model} đã đầy, thử lại sau {retry_after:.0f}s")
+        self.model = model
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+@contextmanager
+def priority(level: int):
+    """Đặt độ ưu tiên cho các lời gọi LLM trong khối lệnh (INTERACTIVE hoặc BATCH)"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+def estimate_tokens(prompt: str, max_tokens: Optional[int] = None) -> int:
+    """Ước lượng số token của một request: prompt (~3 ký tự/token với tiếng Việt) + phần trả lời"""
+    return len(prompt) // 3 + 1 + (max_tokens or COMPLETION_TOKENS)
+
+
+def _parse_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """Đọc LLM_RATE_LIMITS thành {model: (rpm, tpm)}"""
+    limits = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        model, values = item.split("=", 1)
+        rpm, _, tpm = values.partition("/")
+        limits[model.strip()] = (float(rpm or DEFAULT_RPM), float(tpm or DEFAULT_TPM))
+    return limits
+
+
+class TokenBucket:
+    """Bucket nạp lại đều theo thời gian, dung lượng bằng hạn mức một phút"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def clamp(self, amount: float) -> float:
+        """Lượng một request chiếm trong bucket: request lớn hơn hạn mức một phút chỉ cần bucket đầy"""
+        return min(amount, self.capacity)
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Số giây cần chờ để có đủ `amount` (có thể lớn hơn dung lượng khi tính cho cả hàng chờ)"""
+        self._refill(now)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def take(self, amount: float) -> None:
+        self.tokens -= self.clamp(amount)
+
+    def give_back(self, amount: float) -> None:
+        """Hoàn lại (hoặc trừ thêm nếu âm) phần chênh lệch so với ước lượng"""
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class Ticket:
+    """Một request đang chờ hoặc đã được cấp quyền gọi"""
+
+    __slots__ = ("model", "tokens", "priority", "deadline", "request_deadline", "cancelled", "used")
+
+    def __init__(self, model: str, tokens: int, priority: int, deadline: float, request_deadline: bool = False):
+        self.model = model
+        self.tokens = tokens
+        self.priority = priority
+        self.deadline = deadline
+        # Hạn chờ là thời hạn còn lại của request (ngắn hơn LLM_QUEUE_TIMEOUT)
+        self.request_deadline = request_deadline
+        self.cancelled = False
+        # Số token thực tế, do nơi gọi ghi lại nếu biết
+        self.used: Optional[int] = None
+
+
+class ModelLimiter:
+    """Hàng chờ có ưu tiên và hai token bucket (request, token) cho một model"""
+
+    def __init__(self, model: str, rpm: float, tpm: float):
+        self.model = model
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.paused_until = 0.0
+        self.rejected = 0
+        self._cond = threading.Condition(threading.Lock())
+        self._waiters: List[Tuple[int, int, Ticket]] = []
+        self._seq = itertools.count()
+
+    def _wait_time(self, requests: float, tokens: float, now: float) -> float:
+        return max(
+            self.paused_until - now,
+            self.requests.wait_time(requests, now),
+            self.tokens.wait_time(tokens, now),
+        )
+
+    def _enqueue(self, tokens: int, level: int, timeout: Optional[float] = None) -> Ticket:
+        """Xếp request vào hàng chờ hoặc từ chối ngay nếu chắc chắn không kịp lượt
+
+        `timeout` là thời hạn còn lại của request, nếu có.
+        """
+        now = time.monotonic()
+        request_deadline = timeout is not None and timeout < QUEUE_TIMEOUT[level]
+        limit = timeout if request_deadline else QUEUE_TIMEOUT[level]
+        with self._cond:
+            ahead = [t for _, _, t in self._waiters if not t.cancelled and t.priority <= level]
+            same_level = sum(t.priority == level for t in ahead)
+            # Thời gian chờ ước lượng: phải đợi bucket đủ cho mọi request đứng trước và request này
+            queued = sum(self.tokens.clamp(t.tokens) for t in ahead) + self.tokens.clamp(tokens)
+            wait = self._wait_time(len(ahead) + 1, queued, now)
+            if same_level < QUEUE_MAX[level] and request_deadline and limit < wait <= QUEUE_TIMEOUT[level]:
+                raise DeadlineExceeded()
+            if same_level >= QUEUE_MAX[level] or wait > limit:
+                self.rejected += 1
+                LLM_REJECTED.inc(self.model)
+                raise LLMOverloaded(self.model, wait or 1)
+            ticket = Ticket(self.model, tokens, level, now + limit, request_deadline)
+            heapq.heappush(self._waiters, (level, next(self._seq), ticket))
+            return ticket
+
+    def _poll(self, ticket: Ticket) -> float:
+        """Cấp quyền nếu `ticket` đứng đầu hàng và bucket đủ chỗ (trả về 0), ngược lại số giây nên chờ
+
+        Gọi khi đang giữ `_cond`.
+        """
+        while self._waiters and self._waiters[0][2].cancelled:
+            heapq.heappop(self._waiters)
+        now = time.monotonic()
+        if self._waiters[0][2] is not ticket:
+            return ASYNC_POLL_INTERVAL
+        wait = self._wait_time(1, self.tokens.clamp(ticket.tokens), now)
+        if wait > 0:
+            return wait
+        heapq.heappop(self._waiters)
+        self.requests.take(1)
+        self.tokens.take(ticket.tokens)
+        # Request tiếp theo trong hàng có thể đã đủ điều kiện
+        self._cond.notify_all()
+        return 0.0
+
+    def _cancel(self, ticket: Ticket) -> None:
+        with self._cond:
+            ticket.cancelled = True
+            self._cond.notify_all()
+
+    def _timeout(self, ticket: Ticket) -> Exception:
+        self._cancel(ticket)
+        if ticket.request_deadline:
+            return DeadlineExceeded()
+        self.rejected += 1
+        LLM_REJECTED.inc(self.model)
+        return LLMOverloaded(self.model, QUEUE_TIMEOUT[ticket.priority] / 2)
+
+    def acquire(self, tokens: int, level: int, timeout: Optional[float] = None) -> Ticket:
+        """Chờ đến lượt gọi (đồng bộ), tối đa `timeout` giây nếu request có thời hạn"""
+        ticket = self._enqueue(tokens, level, timeout)
+        try:
+            with self._cond:
+                while True:
+                    wait = self._poll(ticket)
+                    if wait <= 0:
+                        return ticket
+                    remaining = ticket.deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(min(wait, remaining))
+        except BaseException:
+            self._cancel(ticket)
+            raise
+        raise self._timeout(ticket)
+
+    async def aacquire(self, tokens: int, level: int, timeout: Optional[float] = None) -> Ticket:
+        """Chờ đến lượt gọi (bất đồng bộ, không chặn event loop)"""
+        ticket = self._enqueue(tokens, level, timeout)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._poll(ticket)
+                if wait <= 0:
+                    return ticket
+                remaining = ticket.deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                await asyncio.sleep(min(wait, remaining, ASYNC_POLL_INTERVAL * 5))
+        except BaseException:
+            self._cancel(ticket)
+            raise
+        raise self._timeout(ticket)
+
+    def settle(self, ticket: Ticket) -> None:
+        """Trả lại bucket phần token ước lượng dư (hoặc trừ thêm phần thiếu)"""
+        if ticket.used is None:
+            return
+        with self._cond:
+            self.tokens.give_back(ticket.tokens - ticket.used)
+            self._cond.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        """Tạm dừng cấp quyền sau khi nhà cung cấp trả về 429, tránh dồn request thử lại"""
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            waiting = [t for _, _, t in self._waiters if not t.cancelled]
+            return {
+                "waiting_interactive": sum(t.priority == INTERACTIVE for t in waiting),
+                "waiting_batch": sum(t.priority == BATCH for t in waiting),
+                "rejected": self.rejected,
+            }
+
+
+class RateLimiter:
+    """Tập các ModelLimiter theo tên model"""
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[float, float]]] = None):
+        self.limits = limits if limits is not None else _parse_limits(MODEL_LIMITS)
+        self._models: Dict[str, ModelLimiter] = {}
+        self._lock = threading.Lock()
+
+    def for_model(self, model: str) -> ModelLimiter:
+        limiter = self._models.get(model)
+        if limiter is None:
+            with self._lock:
+                limiter = self._models.get(model)
+                if limiter is None:
+                    rpm, tpm = self.limits.get(model, (DEFAULT_RPM, DEFAULT_TPM))
+                    limiter = ModelLimiter(model, rpm / WORKERS, tpm / WORKERS)
+                    self._models[model] = limiter
+        return limiter
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {model: limiter.stats() for model, limiter in list(self._models.items())}
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """Số giây nên tạm dừng nếu lỗi là 429 từ nhà cung cấp, None nếu không phải"""
+    if getattr(error, "status_code", None) != 429:
+        return None
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after", 1))
+    except (AttributeError, TypeError, ValueError):
+        return 1.0
+
+
+@contextmanager
+def scheduled(model: str, prompt: str, max_tokens: Optional[int] = None):
+    """Chờ đến lượt gọi `model` trong khối lệnh; ghi `ticket.used` để hoàn lại token ước lượng dư"""
+    limiter = get_rate_limiter()
+    ticket = Ticket(model, estimate_tokens(prompt, max_tokens), current_priority(), 0.0)
+    if limiter is None:
+        yield ticket
+        return
+    model_limiter = limiter.for_model(model)
+    start = time.perf_counter()
+    with span("llm.queue", model=model, priority=ticket.priority, estimated_tokens=ticket.tokens):
+        ticket = model_limiter.acquire(ticket.tokens, ticket.priority, remaining())
+    observe_queue_wait(model, time.perf_counter() - start)
+    try:
+        yield ticket
+    except Exception as e:
+        pause = _retry_after(e)
+        if pause is not None:
+            model_limiter.pause(pause)
+        raise
+    finally:
+        model_limiter.settle(ticket)
+
+
+@asynccontextmanager
+async def ascheduled(model: str, prompt: str, max_tokens: Optional[int] = None):
+    """Chờ đến lượt gọi `model` (bất đồng bộ)"""
+    limiter = get_rate_limiter()
+    ticket = Ticket(model, estimate_tokens(prompt, max_tokens), current_priority(), 0.0)
+    if limiter is None:
+        yield ticket
+        return
+    model_limiter = limiter.for_model(model)
+    start = time.perf_counter()
+    with span("llm.queue", model=model, priority=ticket.priority, estimated_tokens=ticket.tokens):
+        ticket = await model_limiter.aacquire(ticket.tokens, ticket.priority, remaining())
+    observe_queue_wait(model, time.perf_counter() - start)
+    try:
+        yield ticket
+    except Exception as e:
+        pause = _retry_after(e)
+        if pause is not None:
+            model_limiter.pause(pause)
+        raise
+    finally:
+        model_limiter.settle(ticket)
+
+
+_limiter: Optional[RateLimiter] = None
+_lock = threading.Lock()
+
+
+def get_rate_limiter() -> Optional[RateLimiter]:
+    """Bộ điều phối dùng chung của process, None nếu bị tắt bằng LLM_RATE_LIMIT=0"""
+    global _limiter
+    if not ENABLED:
+        return None
+    if _limiter is None:
+        with _lock:
+            if _limiter is None:
+                _limiter = RateLimiter()
+    return _limiter
+
+
+def _reset() -> None:
+    """Lock và hàng chờ của tiến trình cha không còn hợp lệ trong tiến trình con"""
+    global _limiter, _lock
+    _limiter = None
+    _lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset)
@@ -0,0 +1,131 @@
+"""Cache ngữ nghĩa cho các câu hỏi tự do gửi tới JobAssistantAgent.
+
+Câu hỏi được embed rồi so khớp cosine với các câu hỏi đã trả lời trước đó
+(NumPy trên `MemmapVectorStore`), nên các cách diễn đạt khác nhau của cùng một
+yêu cầu ("tìm việc python Hà Nội 20 triệu" / "việc làm lập trình python ở Hà
+Nội lương 20tr") dùng lại được câu trả lời đã lưu.
+
+Tắt mặc định: mỗi câu hỏi tốn thêm một lời gọi embedding, và hai câu hỏi chỉ khác
+mức lương, thành phố hay số năm kinh nghiệm vẫn có cosine rất cao. Vì vậy ngoài
+ngưỡng cosine, câu trả lời chỉ được dùng lại khi các con số (lương, số năm) và
+thành phố trong hai câu hỏi trùng nhau (`query_slots`).
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+
+from agent.llm_cache import CACHE_DIR, normalize_text
+from agent.job_index import normalize_location
+from agent.llm_client import get_embeddings
+from agent.vector_store import MemmapVectorStore
+
+ENABLED = os.getenv("SEMANTIC_CACHE", "0") == "1"
+# Cosine 0.95 vẫn gộp "việc python Hà Nội 20 triệu" với "... Đà Nẵng 30 triệu";
+# các câu hỏi như vậy được `query_slots` tách ra, hạ ngưỡng sẽ tăng rủi ro trả lời nhầm
+THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "20000"))
+MAX_MB = float(os.getenv("SEMANTIC_CACHE_MAX_MB", "128"))
+TTL = int(os.getenv("SEMANTIC_CACHE_TTL", "86400"))
+EMBEDDING_MODEL = os.getenv("SEMANTIC_CACHE_EMBEDDING_MODEL", "text-embedding-3-small")
+
+# Tỉnh/thành hay gặp trong câu hỏi (đã chuẩn hóa bằng `normalize_location`)
+CITIES = (
+    "ha noi", "ho chi minh", "da nang", "hai phong", "can tho", "binh duong", "dong nai",
+    "bac ninh", "khanh hoa", "nha trang", "hue", "vung tau", "quang ninh", "remote",
+)
+
+
+def query_slots(query: str) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """(các con số, các thành phố) của câu hỏi: hai câu hỏi chỉ dùng chung câu trả lời khi trùng cả hai"""
+    folded = normalize_location(query)
+    numbers = tuple(sorted(re.findall(r"\d+", folded)))
+    cities = tuple(city for city in CITIES if re.search(rf"\b{city}\b", folded))
+    return numbers, cities
+
+
+class SemanticCache:
+    """Tra cứu câu trả lời theo độ tương đồng ngữ nghĩa của câu hỏi"""
+
+    def __init__(self, prefix: str, threshold: float = THRESHOLD):
+        self.prefix = prefix
+        self.threshold = threshold
+        self.embeddings = get_embeddings(EMBEDDING_MODEL)
+        self.hits = 0
+        self.misses = 0
+        self._store: Optional[MemmapVectorStore] = None
+        self._lock = threading.Lock()
+
+    def _get_store(self, dim: int) -> MemmapVectorStore:
+        """Mở kho vector khi đã biết số chiều embedding; dung lượng bị giới hạn bởi số mục và bộ nhớ"""
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    capacity = min(MAX_ENTRIES, int(MAX_MB * 1024 * 1024 // (dim * 4)))
+                    self._store = MemmapVectorStore(self.prefix, dim, max(capacity, 1))
+        return self._store
+
+    def embed(self, query: str) -> np.ndarray:
+        """Embed câu hỏi đã chuẩn hóa"""
+        return np.asarray(self.embeddings.embed_query(normalize_text(query)), dtype=np.float32)
+
+    async def aembed(self, query: str) -> np.ndarray:
+        """Embed câu hỏi đã chuẩn hóa (bất đồng bộ)"""
+        return np.asarray(await self.embeddings.aembed_query(normalize_text(query)), dtype=np.float32)
+
+    def lookup(self, query: str, vector: np.ndarray) -> Optional[str]:
+        """Câu trả lời đã lưu của câu hỏi đủ giống, cùng lương/thành phố/số năm và còn hạn, nếu có"""
+        store = self._get_store(len(vector))
+        slots = query_slots(query)
+        for _, payload, similarity in store.search(vector, top_k=3):
+            if similarity < self.threshold:
+                break
+            entry = json.loads(payload)
+            if entry["expires"] > time.time() and query_slots(entry["query"]) == slots:
+                self.hits += 1
+                return entry["response"]
+        self.misses += 1
+        return None
+
+    def store(self, query: str, vector: np.ndarray, response: str) -> None:
+        """Lưu câu trả lời cho câu hỏi"""
+        if not response:
+            return
+        key = hashlib.sha256(normalize_text(query).encode("utf-8")).hexdigest()
+        payload = json.dumps(
+            {"query": query, "response": response, "expires": time.time() + TTL},
+            ensure_ascii=False
+        )
+        self._get_store(len(vector)).add(key, vector, payload)
+
+
+_cache: Optional[SemanticCache] = None
+_lock = threading.Lock()
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """Cache ngữ nghĩa dùng chung của process, None nếu chưa bật bằng SEMANTIC_CACHE=1"""
+    global _cache
+    if not ENABLED:
+        return None
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = SemanticCache(os.path.join(CACHE_DIR, "semantic_cache"))
+    return _cache
+
+
+def _reset() -> None:
+    """Tiến trình con phải mở lại file và kết nối SQLite"""
+    global _cache, _lock
+    _cache = None
+    _lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset)
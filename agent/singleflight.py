@@ -0,0 +1,377 @@
+"""Gộp các lời gọi LLM giống hệt nhau đang chạy cùng lúc (singleflight).
+
+Khi nhiều người dùng gửi cùng một yêu cầu trong vài giây (vd. một tìm kiếm được
+chia sẻ), chỉ lời gọi đầu tiên (leader) gửi request lên API; các lời gọi đến sau
+với cùng khóa (prompt đã chuẩn hóa, model, temperature) chờ và nhận cùng kết
+quả. Ở chế độ stream, các lời gọi sau nhận lại những đoạn đã sinh rồi tiếp tục
+nhận từng đoạn mới cùng lúc với leader.
+
+Giữa các worker, có thể bật thêm khóa trên file (`LLM_SINGLEFLIGHT_LOCK=1`):
+worker giữ khóa gọi API và ghi kết quả vào cache SQLite, các worker khác chờ khóa
+rồi đọc kết quả từ cache (chỉ áp dụng cho lời gọi có dùng cache).
+
+Leader hết thời hạn của request của nó (`DeadlineExceeded`) hoặc bị từ chối vì hàng
+đợi đầy (`LLMOverloaded`) là chuyện riêng của request đó: các lời gọi đi theo chưa
+nhận đoạn nào sẽ gia nhập lại, một trong số chúng làm leader mới với thời hạn và
+lượt chờ của chính nó. Ngược lại, lời gọi đi theo chỉ chờ trong thời hạn của
+request của nó.
+"""
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: không có khóa giữa các worker
+    fcntl = None
+
+from agent.deadline import DeadlineExceeded, check, remaining
+from agent.llm_cache import CACHE_DIR
+from agent.metrics import LLM_COALESCED
+from agent.rate_limiter import LLMOverloaded
+
+ENABLED = os.getenv("LLM_SINGLEFLIGHT", "1") != "0"
+WORKER_LOCK = os.getenv("LLM_SINGLEFLIGHT_LOCK", "0") == "1" and fcntl is not None
+# Thời gian tối đa chờ worker khác; quá thời gian này thì tự gọi API
+WORKER_LOCK_WAIT = float(os.getenv("LLM_SINGLEFLIGHT_WAIT", "120"))
+LOCK_PATH = os.path.join(CACHE_DIR, "singleflight.lock")
+# Số vùng khóa trong file; hai khóa trùng vùng chỉ làm một bên chờ lâu hơn
+LOCK_SLOTS = 1 << 20
+LOCK_POLL_INTERVAL = 0.05
+
+
+class FlightAbandoned(Exception):
+    """Leader dừng giữa chừng khi chưa có kết quả, lời gọi đi theo phải tự gọi API"""
+
+
+# Lỗi chỉ thuộc về request của leader: lời gọi đi theo gia nhập lại thay vì nhận lỗi
+RETRYABLE = (FlightAbandoned, DeadlineExceeded, LLMOverloaded)
+
+
+class Flight:
+    """Kết quả (từng đoạn) của một lời gọi đang chạy, chia sẻ giữa các thread và event loop"""
+
+    def __init__(self):
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+        self._cond = threading.Condition()
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    def _notify(self) -> None:
+        """Đánh thức mọi lời gọi đang chờ (gọi khi đang giữ `_cond`)"""
+        self._cond.notify_all()
+        for loop, event in self._async_waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def publish(self, chunk: Any) -> None:
+        with self._cond:
+            self.chunks.append(chunk)
+            self._notify()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._notify()
+
+    def _next(self, index: int) -> Tuple[List[Any], bool]:
+        """Các đoạn mới từ vị trí `index` và trạng thái đã xong (gọi khi đang giữ `_cond`)"""
+        return self.chunks[index:], self.done
+
+    def follow(self) -> Iterator[Any]:
+        """Nhận lại các đoạn đã có và các đoạn mới cho tới khi leader xong hoặc hết thời hạn"""
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self.chunks) and not self.done:
+                    left = remaining()
+                    if left is not None and left <= 0:
+                        raise DeadlineExceeded()
+                    self._cond.wait(left)
+                new, done = self._next(index)
+            index += len(new)
+            yield from new
+            if done and index >= len(self.chunks):
+                break
+        if self.error is not None:
+            raise self.error
+
+    async def afollow(self) -> AsyncIterator[Any]:
+        """Như `follow` nhưng chờ trên event loop hiện tại"""
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self._cond:
+            self._async_waiters.append(waiter)
+        try:
+            index = 0
+            while True:
+                # Xóa cờ trước khi đọc trạng thái để không bỏ lỡ lần đánh thức
+                event.clear()
+                with self._cond:
+                    new, done = self._next(index)
+                index += len(new)
+                for chunk in new:
+                    yield chunk
+                if done and index >= len(self.chunks):
+                    break
+                if not new:
+                    try:
+                        await asyncio.wait_for(event.wait(), remaining())
+                    except asyncio.TimeoutError:
+                        raise DeadlineExceeded() from None
+        finally:
+            with self._cond:
+                self._async_waiters.remove(waiter)
+        if self.error is not None:
+            raise self.error
+
+
+class SingleFlight:
+    """Các lời gọi đang chạy theo khóa trong một process"""
+
+    def __init__(self):
+        self._flights: Dict[str, Flight] = {}
+        self._lock = threading.Lock()
+        self._tasks: Set[asyncio.Task] = set()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def join(self, key: str) -> Tuple[Flight, bool]:
+        """Lấy lời gọi đang chạy với khóa `key`; True nếu lời gọi này là leader"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.followers += 1
+                self.coalesced += 1
+                LLM_COALESCED.inc()
+                return flight, False
+            flight = Flight()
+            self._flights[key] = flight
+            self.leaders += 1
+            return flight, True
+
+    def leave(self, key: str, flight: Flight) -> None:
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def _drain(self, key: str, flight: Flight, upstream: Iterator[Any]) -> None:
+        """Đọc tiếp phần còn lại cho các lời gọi đi theo sau khi leader dừng sớm"""
+        try:
+            for chunk in upstream:
+                flight.publish(chunk)
+            flight.finish()
+        except BaseException as e:
+            flight.finish(error=e)
+        finally:
+            self.leave(key, flight)
+
+    async def _adrain(self, key: str, flight: Flight, upstream: AsyncIterator[Any]) -> None:
+        try:
+            async for chunk in upstream:
+                flight.publish(chunk)
+            flight.finish()
+        except BaseException as e:
+            flight.finish(error=e)
+        finally:
+            self.leave(key, flight)
+
+    def run(self, key: str, produce: Callable[[], Iterator[Any]]) -> Iterator[Any]:
+        """Chạy `produce` một lần cho mọi lời gọi cùng khóa, trả về từng đoạn"""
+        flight, leader = self.join(key)
+        if not leader:
+            yielded = 0
+            try:
+                for chunk in flight.follow():
+                    yielded += 1
+                    yield chunk
+                return
+            except RETRYABLE:
+                if yielded:
+                    raise
+                # Hết thời hạn của chính lời gọi này: không gia nhập lại
+                check()
+            yield from self.run(key, produce)
+            return
+
+        upstream = produce()
+        handed_off = False
+        try:
+            for chunk in upstream:
+                flight.publish(chunk)
+                yield chunk
+            flight.finish()
+        except GeneratorExit:
+            # Client của leader ngắt kết nối: đọc nốt cho các lời gọi đi theo nếu có
+            if flight.followers:
+                handed_off = True
+                threading.Thread(target=self._drain, args=(key, flight, upstream), daemon=True).start()
+            else:
+                flight.finish(error=FlightAbandoned())
+            raise
+        except BaseException as e:
+            flight.finish(error=e)
+            raise
+        finally:
+            if not handed_off:
+                self.leave(key, flight)
+
+    async def arun(self, key: str, produce: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """Như `run` cho lời gọi bất đồng bộ"""
+        flight, leader = self.join(key)
+        if not leader:
+            yielded = 0
+            try:
+                async for chunk in flight.afollow():
+                    yielded += 1
+                    yield chunk
+                return
+            except RETRYABLE:
+                if yielded:
+                    raise
+                # Hết thời hạn của chính lời gọi này: không gia nhập lại
+                check()
+            async for chunk in self.arun(key, produce):
+                yield chunk
+            return
+
+        upstream = produce()
+        handed_off = False
+        try:
+            async for chunk in upstream:
+                flight.publish(chunk)
+                yield chunk
+            flight.finish()
+        except GeneratorExit:
+            if flight.followers:
+                handed_off = True
+                task = asyncio.get_running_loop().create_task(self._adrain(key, flight, upstream))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            else:
+                flight.finish(error=FlightAbandoned())
+            raise
+        except asyncio.CancelledError:
+            # Request bị hủy giữa lúc chờ API: lời gọi đi theo tự gọi lại
+            flight.finish(error=FlightAbandoned())
+            raise
+        except BaseException as e:
+            flight.finish(error=e)
+            raise
+        finally:
+            if not handed_off:
+                self.leave(key, flight)
+
+
+def coalesce(key: str, produce: Callable[[], Iterator[Any]]) -> Iterator[Any]:
+    """Gộp các lời gọi cùng khóa đang chạy trong process (hoặc gọi thẳng nếu bị tắt)"""
+    group = get_singleflight()
+    if group is None:
+        return produce()
+    return group.run(key, produce)
+
+
+def acoalesce(key: str, produce: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+    """Như `coalesce` cho lời gọi bất đồng bộ"""
+    group = get_singleflight()
+    if group is None:
+        return produce()
+    return group.arun(key, produce)
+
+
+_lock_fd: Optional[int] = None
+
+
+def _lock_file() -> int:
+    """File khóa dùng chung của process
+
+    Khóa bản ghi POSIX bị nhả khi process đóng bất kỳ fd nào tới file, nên chỉ mở
+    một lần và giữ suốt vòng đời process.
+    """
+    global _lock_fd
+    if _lock_fd is None:
+        os.makedirs(os.path.dirname(LOCK_PATH) or ".", exist_ok=True)
+        _lock_fd = os.open(LOCK_PATH, os.O_RDWR | os.O_CREAT, 0o644)
+    return _lock_fd
+
+
+def _try_lock(key: str) -> Optional[int]:
+    """Vùng khóa của `key` nếu lấy được ngay, None nếu worker khác đang giữ"""
+    offset = int(key[:8], 16) % LOCK_SLOTS
+    try:
+        fcntl.lockf(_lock_file(), fcntl.LOCK_EX | fcntl.LOCK_NB, 1, offset)
+    except OSError:
+        return None
+    return offset
+
+
+def _unlock(offset: Optional[int]) -> None:
+    if offset is not None:
+        fcntl.lockf(_lock_file(), fcntl.LOCK_UN, 1, offset)
+
+
+@contextmanager
+def worker_lock(key: Optional[str]):
+    """Giữ khóa của `key` (khóa cache) giữa các worker; khối lệnh nên đọc lại cache trước khi gọi API"""
+    if not WORKER_LOCK or key is None:
+        yield
+        return
+    deadline = time.monotonic() + WORKER_LOCK_WAIT
+    offset = _try_lock(key)
+    while offset is None and time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        offset = _try_lock(key)
+    try:
+        yield
+    finally:
+        _unlock(offset)
+
+
+@asynccontextmanager
+async def aworker_lock(key: Optional[str]):
+    """Như `worker_lock` nhưng không chặn event loop trong lúc chờ"""
+    if not WORKER_LOCK or key is None:
+        yield
+        return
+    deadline = time.monotonic() + WORKER_LOCK_WAIT
+    offset = _try_lock(key)
+    while offset is None and time.monotonic() < deadline:
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+        offset = _try_lock(key)
+    try:
+        yield
+    finally:
+        _unlock(offset)
+
+
+_group: Optional[SingleFlight] = None
+_group_lock = threading.Lock()
+
+
+def get_singleflight() -> Optional[SingleFlight]:
+    """Bộ gộp lời gọi dùng chung của process, None nếu bị tắt bằng LLM_SINGLEFLIGHT=0"""
+    global _group
+    if not ENABLED:
+        return None
+    if _group is None:
+        with _group_lock:
+            if _group is None:
+                _group = SingleFlight()
+    return _group
+
+
+def _reset() -> None:
+    """Tiến trình con không chờ các lời gọi của tiến trình cha và phải mở lại file khóa"""
+    global _group, _group_lock, _lock_fd
+    _group = None
+    _group_lock = threading.Lock()
+    _lock_fd = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset)
@@ -0,0 +1,520 @@
+"""Trace theo request: cây span từ HTTP handler -> đồ thị -> node -> lời gọi LLM.
+
+Mỗi request HTTP được gán một trace id (nhận từ header `traceparent` nếu có,
+trả về trong header `traceparent` của response). Các span lồng nhau được ghi
+qua contextvar nên không cần truyền tham số qua các hàm; span có thuộc tính như
+model, số token, hash của prompt.
+
+Chỉ một phần request được lấy mẫu (`TRACE_SAMPLE_RATE`) để chi phí nhỏ; request
+có `traceparent` với cờ sampled luôn được ghi. Với `TRACE_SLOW_MS`, mọi request
+đều được ghi span trong bộ nhớ nhưng chỉ xuất các trace chậm hơn ngưỡng (hoặc đã
+được lấy mẫu). Trace hoàn chỉnh được ghi ở thread nền vào file JSONL xoay vòng
+(`TRACE_EXPORT=jsonl`) hoặc gửi tới collector OTLP/HTTP JSON (`TRACE_EXPORT=otlp`).
+
+    python -m agent.tracing list                 # các trace gần nhất
+    python -m agent.tracing show <trace_id>      # cây span
+    python -m agent.tracing folded > out.folded  # flamegraph.pl / speedscope
+    python -m agent.tracing svg <trace_id> > trace.svg
+"""
+import argparse
+import contextvars
+import functools
+import glob
+import hashlib
+import html
+import json
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from agent.llm_cache import CACHE_DIR
+
+SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "0"))
+EXPORT = os.getenv("TRACE_EXPORT", "jsonl")
+TRACE_DIR = os.getenv("TRACE_DIR", os.path.join(CACHE_DIR, "traces"))
+MAX_MB = float(os.getenv("TRACE_MAX_MB", "50"))
+BACKUPS = int(os.getenv("TRACE_BACKUPS", "3"))
+OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://127.0.0.1:4318/v1/traces")
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "job-agent")
+
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+class Trace:
+    """Các span của một request, được xuất khi span cuối cùng kết thúc"""
+
+    __slots__ = ("trace_id", "sampled", "spans", "open", "_lock")
+
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans: List["Span"] = []
+        self.open = 0
+        self._lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start", "end", "attributes", "status")
+    recording = True
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.attributes = attributes
+        self.status = "ok"
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.time()) - self.start) * 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Span của request không được lấy mẫu: mọi thao tác đều bỏ qua"""
+
+    __slots__ = ()
+    recording = False
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("trace_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def _begin(trace: Trace, name: str, parent_id: Optional[str], attributes: Dict[str, Any]) -> Span:
+    span = Span(trace, name, parent_id, attributes)
+    with trace._lock:
+        trace.spans.append(span)
+        trace.open += 1
+    return span
+
+
+def _end(span: Span) -> None:
+    span.end = time.time()
+    trace = span.trace
+    with trace._lock:
+        trace.open -= 1
+        finished = trace.open == 0
+    if finished:
+        _export(trace)
+
+
+def start_trace(name: str, traceparent: Optional[str] = None, **attributes: Any) -> Any:
+    """Mở span gốc cho request; trả về NOOP_SPAN nếu request không được ghi
+
+    Không tự đóng khi ra khỏi hàm: gọi `end_trace` khi request kết thúc. Span gốc
+    vẫn là span hiện tại sau đó để các span của response stream gắn vào cùng trace.
+    """
+    parent_id = None
+    forced = False
+    match = TRACEPARENT.match((traceparent or "").strip().lower())
+    if match:
+        trace_id, parent_id, flags = match.groups()
+        forced = int(flags, 16) & 1 == 1
+    else:
+        trace_id = os.urandom(16).hex()
+    sampled = forced or random.random() < SAMPLE_RATE
+    if not sampled and SLOW_MS <= 0:
+        _current.set(None)
+        return NOOP_SPAN
+    span = _begin(Trace(trace_id, sampled), name, parent_id, attributes)
+    _current.set(span)
+    return span
+
+
+def end_trace(span: Any, **attributes: Any) -> None:
+    if span is NOOP_SPAN or span.end is not None:
+        return
+    span.set(**attributes)
+    _end(span)
+
+
+def wrap_stream(body: Iterable[Any], root: Any) -> Iterator[Any]:
+    """Giữ span gốc mở đến khi response stream được gửi xong"""
+    try:
+        yield from body
+    finally:
+        end_trace(root)
+
+
+async def awrap_stream(body: AsyncIterator[Any], root: Any) -> AsyncIterator[Any]:
+    """Như `wrap_stream` cho response bất đồng bộ"""
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        end_trace(root)
+
+
+def traceparent(span: Any) -> Optional[str]:
+    """Giá trị header traceparent (W3C) để client tra cứu trace"""
+    if span is NOOP_SPAN:
+        return None
+    return f"00-{span.trace.trace_id}-{span.span_id}-{'01' if span.trace.sampled else '00'}"
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Any]:
+    """Span con của span hiện tại; không làm gì nếu request không được ghi"""
+    parent = _current.get()
+    if parent is None:
+        yield NOOP_SPAN
+        return
+    child = _begin(parent.trace, name, parent.span_id, attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.status = "error"
+        child.attributes["error"] = type(e).__name__
+        raise
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            # Generator stream được đóng trong context khác với lúc mở span
+            _current.set(parent)
+        _end(child)
+
+
+def traced(name: str):
+    """Decorator ghi span cho một hàm đồng bộ"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+# Xuất trace
+
+def _export(trace: Trace) -> None:
+    spans = sorted(trace.spans, key=lambda s: s.start)
+    root = spans[0]
+    duration_ms = (max(s.end for s in spans) - root.start) * 1000
+    if not trace.sampled and duration_ms < SLOW_MS:
+        return
+    _exporter().put({
+        "trace_id": trace.trace_id,
+        "name": root.name,
+        "start": root.start,
+        "duration_ms": round(duration_ms, 3),
+        "sampled": trace.sampled,
+        "spans": [s.to_dict() for s in spans],
+    })
+
+
+class JsonlExporter:
+    """Ghi mỗi trace một dòng vào file JSONL, xoay vòng khi vượt TRACE_MAX_MB"""
+
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, "traces.jsonl")
+        os.makedirs(directory, exist_ok=True)
+
+    def _rotate(self) -> None:
+        for i in range(BACKUPS - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if BACKUPS > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        if os.path.exists(self.path) and os.path.getsize(self.path) > MAX_MB * 1024 * 1024:
+            self._rotate()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Chuyển trace sang OTLP/HTTP JSON (ExportTraceServiceRequest)"""
+    spans = []
+    for record in records:
+        for s in record["spans"]:
+            start_ns = int(s["start"] * 1e9)
+            spans.append({
+                "traceId": record["trace_id"],
+                "spanId": s["span_id"],
+                **({"parentSpanId": s["parent_id"]} if s["parent_id"] else {}),
+                "name": s["name"],
+                "kind": 2 if s["parent_id"] is None else 1,
+                "startTimeUnixNano": str(start_ns),
+                "endTimeUnixNano": str(start_ns + int(s["duration_ms"] * 1e6)),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s["attributes"].items()],
+                "status": {"code": 2 if s["status"] == "error" else 1},
+            })
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": "agent.tracing"}, "spans": spans}],
+    }]}
+
+
+class OtlpExporter:
+    """Gửi trace tới collector OTLP/HTTP (JSON)"""
+
+    def __init__(self, endpoint: str):
+        import httpx
+        self.endpoint = endpoint
+        self.client = httpx.Client(timeout=5)
+
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        self.client.post(self.endpoint, json=to_otlp(records)).raise_for_status()
+
+
+class _BackgroundExporter:
+    """Hàng đợi và thread nền để việc ghi trace không nằm trên đường xử lý request"""
+
+    def __init__(self, backend: Any):
+        self.backend = backend
+        self.queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=10000)
+        self.dropped = 0
+        threading.Thread(target=self._run, name="trace-exporter", daemon=True).start()
+
+    def put(self, record: Dict[str, Any]) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            records = [self.queue.get()]
+            while len(records) < 100:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.backend.write(records)
+            except Exception as e:
+                print(f"Lỗi khi xuất trace: {e}")
+
+    def flush(self, timeout: float = 5.0) -> None:
+        deadline = time.time() + timeout
+        while not self.queue.empty() and time.time() < deadline:
+            time.sleep(0.01)
+
+
+_exporter_instance: Optional[_BackgroundExporter] = None
+_lock = threading.Lock()
+
+
+def _exporter() -> _BackgroundExporter:
+    global _exporter_instance
+    if _exporter_instance is None:
+        with _lock:
+            if _exporter_instance is None:
+                backend = OtlpExporter(OTLP_ENDPOINT) if EXPORT == "otlp" else JsonlExporter(TRACE_DIR)
+                _exporter_instance = _BackgroundExporter(backend)
+    return _exporter_instance
+
+
+def _reset() -> None:
+    """Thread xuất trace không tồn tại trong tiến trình con"""
+    global _exporter_instance, _lock
+    _exporter_instance = None
+    _lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset)
+
+
+# Xem trace
+
+def load_traces(directory: str = TRACE_DIR) -> List[Dict[str, Any]]:
+    """Đọc mọi trace đã ghi (kể cả file đã xoay vòng), cũ trước mới sau
+
+    Span kết thúc sau khi trace đã được xuất (vd. thread đọc nốt stream) làm trace
+    được ghi lại lần nữa; chỉ giữ bản có nhiều span nhất.
+    """
+    traces: Dict[str, Dict[str, Any]] = {}
+    for path in glob.glob(os.path.join(directory, "traces.jsonl*")):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                seen = traces.get(record["trace_id"])
+                if seen is None or len(record["spans"]) >= len(seen["spans"]):
+                    traces[record["trace_id"]] = record
+    return sorted(traces.values(), key=lambda t: t["start"])
+
+
+def _children(record: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Dict[Optional[str], List[Dict[str, Any]]]]:
+    ids = {s["span_id"] for s in record["spans"]}
+    children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    roots = []
+    for s in record["spans"]:
+        if s["parent_id"] in ids:
+            children.setdefault(s["parent_id"], []).append(s)
+        else:
+            roots.append(s)
+    return roots, children
+
+
+def format_tree(record: Dict[str, Any]) -> str:
+    """Cây span dạng văn bản với thời gian bắt đầu tương đối và thời lượng"""
+    roots, children = _children(record)
+    lines = [f"trace {record['trace_id']}  {record['name']}  {record['duration_ms']:.1f} ms"]
+
+    def walk(s: Dict[str, Any], depth: int) -> None:
+        offset = (s["start"] - record["start"]) * 1000
+        attrs = " ".join(f"{k}={v}" for k, v in s["attributes"].items())
+        flag = " [lỗi]" if s["status"] == "error" else ""
+        lines.append(f"{'  ' * depth}{s['name']}  +{offset:.1f} ms  {s['duration_ms']:.1f} ms{flag}  {attrs}".rstrip())
+        for child in children.get(s["span_id"], []):
+            walk(child, depth + 1)
+
+    for root in roots:
+        walk(root, 1)
+    return "\n".join(lines)
+
+
+def folded_stacks(records: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Stack dạng folded (`a;b;c <micro giây>`) theo thời gian riêng của từng span, cộng dồn qua các trace"""
+    stacks: Dict[str, int] = {}
+    for record in records:
+        roots, children = _children(record)
+
+        def walk(s: Dict[str, Any], prefix: str) -> None:
+            path = f"{prefix};{s['name']}" if prefix else s["name"]
+            kids = children.get(s["span_id"], [])
+            self_ms = max(0.0, s["duration_ms"] - sum(k["duration_ms"] for k in kids))
+            stacks[path] = stacks.get(path, 0) + int(self_ms * 1000)
+            for kid in kids:
+                walk(kid, path)
+
+        for root in roots:
+            walk(root, "")
+    return stacks
+
+
+def render_svg(record: Dict[str, Any], width: int = 1200, row: int = 18) -> str:
+    """Flame chart SVG của một trace: trục ngang là thời gian, mỗi tầng span là một hàng"""
+    roots, children = _children(record)
+    total = max(record["duration_ms"], 1e-6)
+    scale = width / total
+    boxes = []
+
+    def walk(s: Dict[str, Any], depth: int) -> None:
+        x = (s["start"] - record["start"]) * 1000 * scale
+        w = max(s["duration_ms"] * scale, 0.5)
+        label = f"{s['name']} ({s['duration_ms']:.1f} ms)"
+        title = html.escape(label + "".join(f"\n{k}={v}" for k, v in s["attributes"].items()))
+        hue = 0 if s["status"] == "error" else 20 + zlib.crc32(s["name"].encode()) % 40
+        text = html.escape(label) if w > 60 else ""
+        boxes.append(
+            f'<g><title>{title}</title><rect x="{x:.1f}" y="{depth * row}" width="{w:.1f}" height="{row - 2}" '
+            f'fill="hsl({hue},80%,60%)" rx="2"/><text x="{x + 3:.1f}" y="{depth * row + row - 6}" '
+            f'font-size="11" font-family="monospace">{text}</text></g>'
+        )
+        for kid in children.get(s["span_id"], []):
+            walk(kid, depth + 1)
+
+    for root in roots:
+        walk(root, 0)
+    height = row * _depth(roots, children)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}">'
+        + "".join(boxes) + "</svg>\n"
+    )
+
+
+def _depth(roots: List[Dict[str, Any]], children: Dict[Optional[str], List[Dict[str, Any]]]) -> int:
+    def depth(s: Dict[str, Any]) -> int:
+        return 1 + max((depth(k) for k in children.get(s["span_id"], [])), default=0)
+    return max((depth(r) for r in roots), default=0)
+
+
+def _find(traces: List[Dict[str, Any]], trace_id: str) -> Dict[str, Any]:
+    for record in reversed(traces):
+        if record["trace_id"].startswith(trace_id):
+            return record
+    raise SystemExit(f"Không tìm thấy trace {trace_id}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m agent.tracing", description="Xem trace đã ghi")
+    parser.add_argument("--dir", default=TRACE_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    list_cmd = sub.add_parser("list", help="Các trace gần nhất")
+    list_cmd.add_argument("-n", type=int, default=20)
+    list_cmd.add_argument("--slowest", action="store_true", help="Sắp xếp theo thời gian giảm dần")
+    show_cmd = sub.add_parser("show", help="Cây span của một trace")
+    show_cmd.add_argument("trace_id")
+    folded_cmd = sub.add_parser("folded", help="Stack folded cho flamegraph.pl / speedscope")
+    folded_cmd.add_argument("trace_id", nargs="?", help="Mặc định: cộng dồn mọi trace")
+    svg_cmd = sub.add_parser("svg", help="Flame chart SVG của một trace")
+    svg_cmd.add_argument("trace_id")
+    args = parser.parse_args(argv)
+
+    traces = load_traces(args.dir)
+    if args.command == "list":
+        selected = sorted(traces, key=lambda t: -t["duration_ms"]) if args.slowest else traces[::-1]
+        for record in selected[:args.n]:
+            started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record["start"]))
+            print(f"{record['trace_id']}  {started}  {record['duration_ms']:9.1f} ms  {len(record['spans']):3} span  {record['name']}")
+    elif args.command == "show":
+        print(format_tree(_find(traces, args.trace_id)))
+    elif args.command == "folded":
+        records = [_find(traces, args.trace_id)] if args.trace_id else traces
+        for path, value in sorted(folded_stacks(records).items()):
+            if value > 0:
+                print(f"{path} {value}")
+    elif args.command == "svg":
+        sys.stdout.write(render_svg(_find(traces, args.trace_id)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
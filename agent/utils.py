@@ -1,5 +1,7 @@
 import os
-from typing import Dict, Any
+import re
+import unicodedata
+from typing import Dict, Any, List
 import json
 from dotenv import load_dotenv
 
@@ -13,6 +15,16 @@ def get_openai_api_key() -> str:
         raise ValueError("OPENAI_API_KEY không được cấu hình trong file .env")
     return api_key
 
+def fold_accents(text: str) -> str:
+    """Bỏ dấu tiếng Việt và chuyển về chữ thường ("Hà Nội" -> "ha noi")"""
+    text = unicodedata.normalize("NFD", text.lower())
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    return text.replace("đ", "d")
+
+def tokenize_vi(text: str) -> List[str]:
+    """Tách văn bản tiếng Việt (đã bỏ dấu) thành các từ đơn"""
+    return re.findall(r"[a-z0-9]+", fold_accents(text))
+
 def extract_json_from_text(text: str) -> Dict[str, Any]:
     """Trích xuất JSON từ văn bản"""
     try:
@@ -29,6 +41,12 @@ def extract_json_from_text(text: str) -> Dict[str, Any]:
         print(f"Lỗi khi trích xuất JSON: {e}")
         return {}
 
+def format_sse(data: Dict[str, Any], event: str = "") -> str:
+    """Định dạng một sự kiện Server-Sent Events"""
+    message = f"event: {event}\n" if event else ""
+    message += f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return message
+
 def format_job_results(jobs_data: Dict[str, Any]) -> str:
     """Định dạng kết quả tìm kiếm công việc"""
     if not jobs_data or not isinstance(jobs_data, dict):
@@ -43,6 +61,9 @@ def format_job_results(jobs_data: Dict[str, Any]) -> str:
         result += f"**Yêu cầu chính:** {job.get('requirements', 'Không có thông tin')}\n"
         result += f"**Lý do phù hợp:** {job.get('reason', 'Không có thông tin')}\n\n"
     
+    if jobs_data.get("conclusion"):
+        result += f"**Kết luận:** {jobs_data['conclusion']}\n"
+    
     return result
 
 def format_company_results(companies_data: Dict[str, Any]) -> str:
@@ -59,4 +80,7 @@ def format_company_results(companies_data: Dict[str, Any]) -> str:
         result += f"**Lý do phù hợp:** {company.get('reason', 'Không có thông tin')}\n"
         result += f"**Cơ hội phát triển:** {company.get('opportunities', 'Không có thông tin')}\n\n"
     
+    if companies_data.get("summary"):
+        result += f"**Nhận xét chung:** {companies_data['summary']}\n"
+    
     return result
\ No newline at end of file
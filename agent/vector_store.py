@@ -0,0 +1,178 @@
+"""Kho vector lưu trên file memory-mapped (NumPy), dùng chung giữa các worker.
+
+Vector nằm trong một mảng `capacity x dim` được map từ file, metadata (khóa,
+payload, thời điểm truy cập) nằm trong SQLite cạnh đó. Nhờ vậy nhiều process
+cùng đọc một bản vector mà không phải nạp lại, và khởi động lại gần như tức thì.
+Khi đầy, slot ít được truy cập nhất bị ghi đè (LRU).
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+class MemmapVectorStore:
+    """Kho vector cố định dung lượng với tìm kiếm cosine vector hóa"""
+
+    def __init__(self, prefix: str, dim: int, capacity: int, dtype: str = "float32"):
+        self.prefix = prefix
+        self.dim = dim
+        self.capacity = capacity
+        self.dtype = np.dtype(dtype)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        os.makedirs(os.path.dirname(prefix) or ".", exist_ok=True)
+
+        with self._conn() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS vectors (
+                    slot INTEGER PRIMARY KEY,
+                    key TEXT UNIQUE NOT NULL,
+                    payload TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_vectors_access ON vectors(last_access)")
+            self._check_layout(conn)
+
+        self.vectors = self._open_memmap()
+
+    def _conn(self) -> sqlite3.Connection:
+        """Mỗi thread dùng một kết nối SQLite riêng"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.prefix + ".sqlite3", timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _check_layout(self, conn: sqlite3.Connection) -> None:
+        """Xóa dữ liệu cũ nếu kích thước vector, dung lượng hoặc kiểu dữ liệu đã thay đổi"""
+        layout = f"{self.dim}x{self.capacity}:{self.dtype.str}"
+        row = conn.execute("SELECT value FROM meta WHERE name = 'layout'").fetchone()
+        if row is not None and row[0] == layout:
+            return
+        conn.execute("DELETE FROM vectors")
+        if os.path.exists(self._data_path):
+            os.remove(self._data_path)
+        conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('layout', ?)", (layout,))
+
+    @property
+    def _data_path(self) -> str:
+        return f"{self.prefix}.{self.dtype.name}"
+
+    def _open_memmap(self) -> np.memmap:
+        """Map file vector vào bộ nhớ, tạo mới nếu chưa có"""
+        mode = "r+" if os.path.exists(self._data_path) else "w+"
+        return np.memmap(self._data_path, dtype=self.dtype, mode=mode, shape=(self.capacity, self.dim))
+
+    def _high_water(self, conn: sqlite3.Connection) -> int:
+        """Số slot đầu tiên cần quét (slot được cấp phát tuần tự từ 0)"""
+        (max_slot,) = conn.execute("SELECT MAX(slot) FROM vectors").fetchone()
+        return 0 if max_slot is None else max_slot + 1
+
+    @staticmethod
+    def normalize(vectors: np.ndarray) -> np.ndarray:
+        """Chuẩn hóa L2 để tích vô hướng chính là độ tương đồng cosine"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def search(self, vector: np.ndarray, top_k: int = 1) -> List[Tuple[str, str, float]]:
+        """Tìm các vector gần nhất, trả về danh sách (key, payload, similarity)"""
+        conn = self._conn()
+        size = self._high_water(conn)
+        if size == 0:
+            return []
+        query = self.normalize(vector).astype(self.dtype)
+        scores = np.asarray(self.vectors[:size] @ query, dtype=np.float32)
+        k = min(top_k, size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        now = time.time()
+        for slot in top.tolist():
+            row = conn.execute("SELECT key, payload FROM vectors WHERE slot = ?", (slot,)).fetchone()
+            # Slot đang được ghi dở bởi worker khác: coi như không có
+            if row is None:
+                continue
+            conn.execute("UPDATE vectors SET last_access = ? WHERE slot = ?", (now, slot))
+            results.append((row[0], row[1], float(scores[slot])))
+        return results
+
+    def add(self, key: str, vector: np.ndarray, payload: str) -> int:
+        """Thêm hoặc cập nhật một vector, trả về slot đã dùng"""
+        conn = self._conn()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                slot = self._allocate_slot(conn, key)
+                # Xóa metadata trước khi ghi vector để worker khác không đọc nhầm payload cũ
+                conn.execute("DELETE FROM vectors WHERE slot = ?", (slot,))
+                self.vectors[slot] = self.normalize(vector).astype(self.dtype)
+                self.vectors.flush()
+                now = time.time()
+                conn.execute(
+                    "INSERT INTO vectors (slot, key, payload, created, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (slot, key, payload, now, now)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return slot
+
+    def _allocate_slot(self, conn: sqlite3.Connection, key: str) -> int:
+        """Slot cho khóa: slot cũ của khóa, slot trống tiếp theo, hoặc slot ít được dùng nhất"""
+        row = conn.execute("SELECT slot FROM vectors WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            return row[0]
+        size = self._high_water(conn)
+        if size < self.capacity:
+            return size
+        # Dùng lại slot trống (do bị xóa) trước khi ghi đè slot ít được dùng nhất
+        if conn.execute("SELECT 1 FROM vectors WHERE slot = 0").fetchone() is None:
+            return 0
+        row = conn.execute(
+            "SELECT v.slot + 1 FROM vectors v LEFT JOIN vectors n ON n.slot = v.slot + 1 "
+            "WHERE n.slot IS NULL AND v.slot + 1 < ? ORDER BY v.slot LIMIT 1",
+            (self.capacity,)
+        ).fetchone()
+        if row is not None:
+            return row[0]
+        (slot,) = conn.execute("SELECT slot FROM vectors ORDER BY last_access LIMIT 1").fetchone()
+        return slot
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Lấy vector theo khóa"""
+        row = self._conn().execute("SELECT slot FROM vectors WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return np.asarray(self.vectors[row[0]])
+
+    def delete_older_than(self, timestamp: float) -> int:
+        """Xóa các vector được tạo trước `timestamp`, trả về số vector đã xóa"""
+        conn = self._conn()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                slots = [row[0] for row in conn.execute("SELECT slot FROM vectors WHERE created < ?", (timestamp,))]
+                conn.execute("DELETE FROM vectors WHERE created < ?", (timestamp,))
+                if slots:
+                    self.vectors[slots] = 0
+                    self.vectors.flush()
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return len(slots)
+
+    def __len__(self) -> int:
+        (count,) = self._conn().execute("SELECT COUNT(*) FROM vectors").fetchone()
+        return count
@@ -0,0 +1,141 @@
+"""Khởi động nhanh cho worker: import nặng và dựng đồ thị sau khi worker đã sẵn sàng.
+
+`app.py`/`asgi.py` chỉ import các phần nhẹ (Flask/Quart, cấu hình, số liệu);
+langchain, langgraph, OpenAI client và `JobAssistantAgent` (4 module và đồ thị
+LangGraph đã biên dịch) được tạo khi dùng lần đầu. `WARMUP` chọn thời điểm:
+
+- `background` (mặc định): làm nóng trong một thread nền ngay sau khi import app,
+  worker nhận request được ngay; request đến sớm chỉ chờ phần đang import.
+- `lazy`: chỉ tạo khi có request đầu tiên cần đến.
+- `eager`: làm nóng đồng bộ khi import app (như trước đây), hợp với `--preload`.
+
+Khi process fork (gunicorn `--preload`), thread nền được chờ xong trước để tiến
+trình con không kế thừa khóa import đang giữ dở, và nhận bản đã làm nóng.
+
+Kiểm tra thời gian import (dùng trong CI):
+
+    python -m agent.warmup check               # import app, tối đa 1.5 giây
+    python -m agent.warmup check --module asgi --budget 1 --top 30
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from typing import List, Optional, Tuple
+
+MODE = os.getenv("WARMUP", "background")
+
+# Module không được import khi khởi động worker
+HEAVY_MODULES = ["langchain", "langchain_core", "langchain_openai", "langgraph", "openai", "ddgs"]
+
+_thread: Optional[threading.Thread] = None
+_lock = threading.Lock()
+
+
+def warm_up() -> float:
+    """Import các thư viện nặng, tạo agent dùng chung và nạp dữ liệu công ty, trả về số giây đã dùng"""
+    start = time.perf_counter()
+    from agent.job_agent import JobAssistantAgent
+    from agent.llm_client import get_module
+    get_module(JobAssistantAgent)
+    # Dữ liệu công ty cho trang thống kê (nếu có), để request đầu tiên không phải đọc file
+    from agent.company_data import get_company_data
+    get_company_data()
+    return time.perf_counter() - start
+
+
+def _run() -> None:
+    try:
+        warm_up()
+    except Exception as e:
+        print(f"Lỗi khi làm nóng worker: {e}")
+
+
+def start(mode: Optional[str] = None) -> None:
+    """Làm nóng theo `WARMUP` (gọi một lần khi import app)"""
+    global _thread
+    mode = mode or MODE
+    if mode == "eager":
+        _run()
+    elif mode == "background":
+        with _lock:
+            if _thread is None:
+                _thread = threading.Thread(target=_run, name="warmup", daemon=True)
+                _thread.start()
+
+
+def wait(timeout: Optional[float] = None) -> bool:
+    """Chờ thread làm nóng xong, True nếu đã xong (hoặc không có thread)"""
+    thread = _thread
+    if thread is not None and thread is not threading.current_thread():
+        thread.join(timeout)
+        return not thread.is_alive()
+    return True
+
+
+def _reset() -> None:
+    global _thread
+    _thread = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(before=wait, after_in_child=_reset)
+
+
+def import_profile(module: str) -> Tuple[float, List[Tuple[str, int, int]]]:
+    """Import `module` trong process mới với -X importtime, trả về (giây, [(module, tự thân µs, tích lũy µs)])"""
+    env = dict(os.environ, WARMUP="lazy", JOB_WORKERS="0")
+    env.setdefault("OPENAI_API_KEY", "sk-check")
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, env=env,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"Không import được {module}")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \| *(\S+)", line)
+        if match:
+            rows.append((match.group(3), int(match.group(1)), int(match.group(2))))
+    return float(result.stdout.strip().splitlines()[-1]), rows
+
+
+def check(module: str, budget: float, top: int) -> int:
+    """In các module import chậm nhất; 1 nếu vượt ngân sách hoặc có module nặng bị import"""
+    seconds, rows = import_profile(module)
+    print(f"import {module}: {seconds:.3f}s (ngân sách {budget:.3f}s)")
+    for name, self_us, total_us in sorted(rows, key=lambda row: row[2], reverse=True)[:top]:
+        print(f"  {total_us / 1000:9.1f} ms  {self_us / 1000:8.1f} ms  {name}")
+    loaded = sorted({name.split(".")[0] for name, _, _ in rows} & set(HEAVY_MODULES))
+    failed = False
+    if loaded:
+        print(f"Module nặng bị import khi khởi động: {', '.join(loaded)}")
+        failed = True
+    if seconds > budget:
+        print(f"Import chậm hơn ngân sách {seconds - budget:.3f}s")
+        failed = True
+    return 1 if failed else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m agent.warmup", description="Thời gian khởi động worker")
+    sub = parser.add_subparsers(dest="command", required=True)
+    check_cmd = sub.add_parser("check", help="Đo thời gian import app (-X importtime)")
+    check_cmd.add_argument("--module", default="app")
+    check_cmd.add_argument("--budget", type=float, default=1.5, help="Thời gian import tối đa (giây)")
+    check_cmd.add_argument("--top", type=int, default=20, help="Số module chậm nhất cần in")
+    sub.add_parser("run", help="Làm nóng trong process hiện tại và in thời gian")
+    args = parser.parse_args(argv)
+
+    if args.command == "check":
+        return check(args.module, args.budget, args.top)
+    print(f"Làm nóng xong sau {warm_up():.3f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,21 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, g, render_template, request, jsonify, stream_with_context
 from flask_cors import CORS
 import os
+import time
 from dotenv import load_dotenv
-from agent.job_agent import JobAssistantAgent, JobModule, EmailModule, CVModule, CompanyModule
-from agent.utils import get_openai_api_key
+from agent.job_agent import JobAssistantAgent, JobModule, EmailModule, CVModule, CompanyModule, STRUCTURED_OUTPUT
+from agent.llm_client import get_module
+from agent.matching import TOP_N, CVMatcher
+from agent.job_queue import get_job_queue
+from agent.rate_limiter import LLMOverloaded
+from agent.deadline import DeadlineExceeded, request_budget, start_deadline
+from agent.metrics import CONTENT_TYPE, REGISTRY, observe_request, server_timing, start_request
+from agent.tracing import end_trace, start_trace, traceparent, wrap_stream
+from agent.company_data import get_company_data
+from agent.batch_eval import BATCH_DIR, CONCURRENCY as BATCH_CONCURRENCY, Checkpoint, batch_id, normalize_cvs, iter_evaluate, summarize
+from agent.mail_merge import BATCH_SIZE as MAIL_MERGE_BATCH_SIZE, MAX_COMPANIES as MAIL_MERGE_MAX_COMPANIES, normalize_companies, iter_merge, summarize as summarize_merge
+from agent.utils import get_openai_api_key, format_sse
+from agent import warmup
 
 # Load environment variables
 load_dotenv()
@@ -27,8 +39,47 @@ except ValueError as e:
     print(f"Error: {str(e)}")
     api_key = None
 
-# Initialize agent
-agent = JobAssistantAgent()
+# Agent (4 module và đồ thị LangGraph) được tạo khi dùng lần đầu hoặc làm nóng ở nền
+def __getattr__(name):
+    if name == 'agent':
+        return get_module(JobAssistantAgent)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+warmup.start()
+
+# Endpoint không áp thời hạn cho cả request
+_NO_DEADLINE = {'api_danh_gia_cv_batch', 'api_submit_job', 'api_get_job'}
+
+@app.before_request
+def _start_timing():
+    g.request_start = time.perf_counter()
+    start_request()
+    g.trace = start_trace(f"{request.method} {request.path}", request.headers.get('traceparent'), method=request.method, path=request.path)
+    # Lô đánh giá CV chạy lâu theo thiết kế, chỉ giới hạn từng lời gọi LLM
+    budget = None if request.endpoint in _NO_DEADLINE else request_budget(_wants_stream(), request.headers.get('X-Request-Timeout'))
+    start_deadline(budget)
+
+@app.after_request
+def _record_timing(response):
+    """Ghi số liệu của request và gắn header Server-Timing (stream chỉ tính đến khi trả header)"""
+    elapsed = time.perf_counter() - g.request_start
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    observe_request(endpoint, request.method, response.status_code, elapsed)
+    response.headers['Server-Timing'] = server_timing(elapsed)
+    # Trace của response stream kết thúc khi gửi xong phần thân
+    g.trace.set(endpoint=endpoint, status_code=response.status_code)
+    header = traceparent(g.trace)
+    if header:
+        response.headers['traceparent'] = header
+    if response.is_streamed:
+        response.response = wrap_stream(response.response, g.trace)
+    else:
+        end_trace(g.trace)
+    return response
+
+@app.route('/metrics')
+def metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
 
 @app.route('/')
 def index():
@@ -54,6 +105,62 @@ def thong_ke_cong_ty():
 def tao_cv():
     return render_template('tao_cv.html')
 
+def _wants_stream() -> bool:
+    """Client yêu cầu chế độ stream qua ?stream=1"""
+    return request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+def _wants_structured() -> bool:
+    """Trả về dữ liệu có cấu trúc (?format=structured hoặc STRUCTURED_OUTPUT=1 khi không stream)"""
+    output_format = request.args.get('format', '').lower()
+    if output_format:
+        return output_format == 'structured'
+    return STRUCTURED_OUTPUT and not _wants_stream()
+
+def _wants_narrative() -> bool:
+    """Kèm nhận xét của LLM cho số liệu thống kê (?narrative=1; chế độ stream luôn kèm)"""
+    return request.args.get('narrative', '').lower() in ('1', 'true', 'yes')
+
+def _int_param(data, name: str, default: int, low: int, high: int) -> int:
+    """Tham số nguyên `name` của body JSON, giới hạn trong [low, high]; ValueError nếu không phải số nguyên"""
+    value = data.get(name, default)
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(name)
+    return max(low, min(int(value), high))
+
+def _overloaded_response(e: LLMOverloaded):
+    """503 kèm Retry-After khi hàng chờ gọi LLM đã đầy"""
+    return jsonify({
+        "error": "Hệ thống đang quá tải, vui lòng thử lại sau",
+        "retry_after": e.retry_after
+    }), 503, {"Retry-After": str(e.retry_after)}
+
+def _timeout_response():
+    """504 khi request vượt quá thời hạn cho phép"""
+    return jsonify({"error": "Hết thời gian xử lý yêu cầu, vui lòng thử lại"}), 504
+
+def _sse_response(chunks, endpoint: str, events=()) -> Response:
+    """Trả về các đoạn văn bản từ model dưới dạng Server-Sent Events, sau các sự kiện `events` (tên, dữ liệu) nếu có"""
+    def generate():
+        try:
+            for event, data in events:
+                yield format_sse(data, event=event)
+            for chunk in chunks:
+                yield format_sse({"text": chunk})
+            yield format_sse({}, event="done")
+        except LLMOverloaded as e:
+            yield format_sse({"error": "Hệ thống đang quá tải, vui lòng thử lại sau", "retry_after": e.retry_after}, event="error")
+        except DeadlineExceeded:
+            yield format_sse({"error": "Hết thời gian xử lý yêu cầu, vui lòng thử lại"}, event="error")
+        except Exception as e:
+            print(f"Error in {endpoint} (stream): {str(e)}")
+            yield format_sse({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}, event="error")
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 # API endpoints
 @app.route('/api/tim-viec', methods=['POST'])
 def api_tim_viec():
@@ -62,16 +169,28 @@ def api_tim_viec():
         if not data:
             return jsonify({"error": "Không có dữ liệu được gửi lên"}), 400
             
-        job_module = JobModule()
+        job_module = get_module(JobModule)
         
-        result = job_module.find_jobs(
+        params = dict(
             job_description=data.get('jobDescription', ''),
             salary=data.get('salary', ''),
             location=data.get('location', ''),
             experience=data.get('experience', 0)
         )
+        if _wants_structured():
+            jobs_data = job_module.find_jobs_structured(**params)
+            html = render_template('partials/job_results.html', **jobs_data)
+            return jsonify({"result": html, "data": jobs_data})
+        if _wants_stream():
+            return _sse_response(job_module.stream_find_jobs(**params), '/api/tim-viec')
+        
+        result = job_module.find_jobs(**params)
         
         return jsonify({"result": result})
+    except LLMOverloaded as e:
+        return _overloaded_response(e)
+    except DeadlineExceeded:
+        return _timeout_response()
     except Exception as e:
         print(f"Error in /api/tim-viec: {str(e)}")
         return jsonify({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}), 500
@@ -83,19 +202,86 @@ def api_viet_email():
         if not data:
             return jsonify({"error": "Không có dữ liệu được gửi lên"}), 400
             
-        email_module = EmailModule()
+        email_module = get_module(EmailModule)
         
-        result = email_module.write_application_email(
+        params = dict(
             job_title=data.get('job_title', ''),
             company=data.get('company', ''),
             skills=data.get('skills', '')
         )
+        if _wants_stream():
+            return _sse_response(email_module.stream_application_email(**params), '/api/viet-email')
+        
+        result = email_module.write_application_email(**params)
         
         return jsonify({"email": result})
+    except LLMOverloaded as e:
+        return _overloaded_response(e)
+    except DeadlineExceeded:
+        return _timeout_response()
     except Exception as e:
         print(f"Error in /api/viet-email: {str(e)}")
         return jsonify({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}), 500
 
+@app.route('/api/viet-email/batch', methods=['POST'])
+def api_viet_email_batch():
+    try:
+        data = request.json
+        if not data:
+            return jsonify({"error": "Không có dữ liệu được gửi lên"}), 400
+        
+        companies = normalize_companies(data.get('companies', []))
+        if not companies:
+            return jsonify({"error": "Cần ít nhất một công ty"}), 400
+        if len(companies) > MAIL_MERGE_MAX_COMPANIES:
+            return jsonify({"error": f"Tối đa {MAIL_MERGE_MAX_COMPANIES} công ty mỗi lần"}), 400
+        
+        job_title = data.get('job_title', '')
+        skills = data.get('skills', '')
+        try:
+            batch_size = _int_param(data, 'batch_size', MAIL_MERGE_BATCH_SIZE, 1, MAIL_MERGE_BATCH_SIZE)
+        except ValueError:
+            return jsonify({"error": "batch_size phải là số nguyên"}), 400
+        records = iter_merge(job_title, skills, companies, batch_size)
+        
+        if _wants_stream():
+            def generate():
+                results = []
+                start = time.perf_counter()
+                try:
+                    for record in records:
+                        results.append(record)
+                        yield format_sse({"result": record})
+                    yield format_sse({"stats": summarize_merge(results, time.perf_counter() - start, batch_size)}, event="done")
+                except LLMOverloaded as e:
+                    yield format_sse({"error": "Hệ thống đang quá tải, vui lòng thử lại sau", "retry_after": e.retry_after}, event="error")
+                except DeadlineExceeded:
+                    yield format_sse({"error": "Hết thời gian xử lý yêu cầu, vui lòng thử lại"}, event="error")
+                except Exception as e:
+                    print(f"Error in /api/viet-email/batch (stream): {str(e)}")
+                    yield format_sse({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}, event="error")
+            
+            return Response(
+                stream_with_context(generate()),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+        
+        start = time.perf_counter()
+        results = list(records)
+        
+        return jsonify({
+            "emails": results,
+            "stats": summarize_merge(results, time.perf_counter() - start, batch_size)
+        })
+    except LLMOverloaded as e:
+        return _overloaded_response(e)
+    except DeadlineExceeded:
+        return _timeout_response()
+    except Exception as e:
+        print(f"Error in /api/viet-email/batch: {str(e)}")
+        return jsonify({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}), 500
+
 @app.route('/api/danh-gia-cv', methods=['POST'])
 def api_danh_gia_cv():
     try:
@@ -103,18 +289,82 @@ def api_danh_gia_cv():
         if not data:
             return jsonify({"error": "Không có dữ liệu được gửi lên"}), 400
             
-        cv_module = CVModule()
+        cv_module = get_module(CVModule)
         
-        result = cv_module.evaluate_cv(
+        params = dict(
             cv_text=data.get('cv_text', ''),
             job_description=data.get('job_description', '')
         )
+        if _wants_stream():
+            return _sse_response(cv_module.stream_evaluate_cv(**params), '/api/danh-gia-cv')
+        
+        result = cv_module.evaluate_cv(**params)
         
         return jsonify({"evaluation": result})
+    except LLMOverloaded as e:
+        return _overloaded_response(e)
+    except DeadlineExceeded:
+        return _timeout_response()
     except Exception as e:
         print(f"Error in /api/danh-gia-cv: {str(e)}")
         return jsonify({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}), 500
 
+@app.route('/api/danh-gia-cv/batch', methods=['POST'])
+def api_danh_gia_cv_batch():
+    try:
+        data = request.json
+        if not data:
+            return jsonify({"error": "Không có dữ liệu được gửi lên"}), 400
+        
+        cvs = normalize_cvs(data.get('cvs', []))
+        if not cvs:
+            return jsonify({"error": "Cần ít nhất một CV"}), 400
+        
+        job_description = data.get('job_description', '')
+        try:
+            concurrency = _int_param(data, 'concurrency', BATCH_CONCURRENCY, 1, BATCH_CONCURRENCY)
+        except ValueError:
+            return jsonify({"error": "concurrency phải là số nguyên"}), 400
+        # Gửi lại cùng một lô sẽ tiếp tục từ các kết quả đã có
+        current_batch = batch_id(cvs, job_description)
+        checkpoint = Checkpoint(os.path.join(BATCH_DIR, f"{current_batch}.jsonl"))
+        records = iter_evaluate(cvs, job_description, checkpoint, concurrency)
+        
+        if _wants_stream():
+            def generate():
+                results = []
+                start = time.perf_counter()
+                try:
+                    for record in records:
+                        results.append(record)
+                        yield format_sse({"result": record})
+                    yield format_sse({"batch_id": current_batch, "stats": summarize(results, time.perf_counter() - start)}, event="done")
+                except Exception as e:
+                    print(f"Error in /api/danh-gia-cv/batch (stream): {str(e)}")
+                    yield format_sse({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}, event="error")
+            
+            return Response(
+                stream_with_context(generate()),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+        
+        start = time.perf_counter()
+        results = list(records)
+        
+        return jsonify({
+            "batch_id": current_batch,
+            "results": results,
+            "stats": summarize(results, time.perf_counter() - start)
+        })
+    except LLMOverloaded as e:
+        return _overloaded_response(e)
+    except DeadlineExceeded:
+        return _timeout_response()
+    except Exception as e:
+        print(f"Error in /api/danh-gia-cv/batch: {str(e)}")
+        return jsonify({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}), 500
+
 @app.route('/api/thong-ke-cong-ty', methods=['POST'])
 def api_thong_ke_cong_ty():
     try:
@@ -122,19 +372,65 @@ def api_thong_ke_cong_ty():
         if not data:
             return jsonify({"error": "Không có dữ liệu được gửi lên"}), 400
             
-        company_module = CompanyModule()
+        company_module = get_module(CompanyModule)
         
-        result = company_module.find_top_companies(
+        params = dict(
             skills=data.get('skills', ''),
             industry=data.get('industry', ''),
             location=data.get('location', '')
         )
+        if _wants_structured():
+            companies_data = company_module.find_top_companies_structured(**params)
+            html = render_template('partials/company_results.html', **companies_data)
+            return jsonify({"companies": html, "data": companies_data})
+        if _wants_stream():
+            return _sse_response(company_module.stream_top_companies(**params), '/api/thong-ke-cong-ty')
+        
+        result = company_module.find_top_companies(**params)
         
         return jsonify({"companies": result})
+    except LLMOverloaded as e:
+        return _overloaded_response(e)
+    except DeadlineExceeded:
+        return _timeout_response()
     except Exception as e:
         print(f"Error in /api/thong-ke-cong-ty: {str(e)}")
         return jsonify({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}), 500
 
+@app.route('/api/thong-ke-cong-ty/stats', methods=['POST'])
+def api_thong_ke_cong_ty_stats():
+    try:
+        # {} là hợp lệ: không lọc, trả về thống kê toàn bộ dữ liệu
+        data = request.get_json(silent=True)
+        if data is None:
+            return jsonify({"error": "Không có dữ liệu được gửi lên"}), 400
+        
+        company_data = get_company_data()
+        if company_data is None:
+            return jsonify({"error": "Chưa có dữ liệu công ty (COMPANY_DATA)"}), 404
+        
+        params = dict(
+            skills=data.get('skills', ''),
+            industry=data.get('industry', ''),
+            location=data.get('location', '')
+        )
+        stats = company_data.stats(params['industry'], params['location'], params['skills'])
+        if _wants_stream():
+            company_module = get_module(CompanyModule)
+            return _sse_response(company_module.stream_narrate_stats(stats, **params), '/api/thong-ke-cong-ty/stats', [("stats", {"stats": stats})])
+        if _wants_narrative():
+            company_module = get_module(CompanyModule)
+            return jsonify({"stats": stats, "narrative": company_module.narrate_stats(stats, **params)})
+        
+        return jsonify({"stats": stats})
+    except LLMOverloaded as e:
+        return _overloaded_response(e)
+    except DeadlineExceeded:
+        return _timeout_response()
+    except Exception as e:
+        print(f"Error in /api/thong-ke-cong-ty/stats: {str(e)}")
+        return jsonify({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}), 500
+
 @app.route('/api/tao-cv', methods=['POST'])
 def api_tao_cv():
     try:
@@ -142,9 +438,9 @@ def api_tao_cv():
         if not data:
             return jsonify({"error": "Không có dữ liệu được gửi lên"}), 400
             
-        cv_module = CVModule()
+        cv_module = get_module(CVModule)
         
-        result = cv_module.create_cv(
+        params = dict(
             name=data.get('name', ''),
             email=data.get('email', ''),
             phone=data.get('phone', ''),
@@ -152,11 +448,84 @@ def api_tao_cv():
             experience=data.get('experience', ''),
             skills=data.get('skills', '')
         )
+        if _wants_stream():
+            return _sse_response(cv_module.stream_create_cv(**params), '/api/tao-cv')
+        
+        result = cv_module.create_cv(**params)
         
         return jsonify({"cv": result})
+    except LLMOverloaded as e:
+        return _overloaded_response(e)
+    except DeadlineExceeded:
+        return _timeout_response()
     except Exception as e:
         print(f"Error in /api/tao-cv: {str(e)}")
         return jsonify({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}), 500
 
+@app.route('/api/xep-hang-cv', methods=['POST'])
+def api_xep_hang_cv():
+    try:
+        data = request.json
+        if not data:
+            return jsonify({"error": "Không có dữ liệu được gửi lên"}), 400
+        
+        cvs = data.get('cvs', [])
+        jds = data.get('jds', [])
+        if not cvs or not jds:
+            return jsonify({"error": "Cần ít nhất một CV và một mô tả công việc"}), 400
+        
+        try:
+            top_n = _int_param(data, 'top_n', TOP_N, 1, len(cvs))
+        except ValueError:
+            return jsonify({"error": "top_n phải là số nguyên"}), 400
+        
+        matcher = get_module(CVMatcher)
+        
+        results = matcher.match(
+            cvs,
+            jds,
+            top_n=top_n,
+            evaluate=bool(data.get('evaluate', False))
+        )
+        
+        return jsonify({"results": results})
+    except LLMOverloaded as e:
+        return _overloaded_response(e)
+    except DeadlineExceeded:
+        return _timeout_response()
+    except Exception as e:
+        print(f"Error in /api/xep-hang-cv: {str(e)}")
+        return jsonify({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}), 500
+
+@app.route('/api/jobs', methods=['POST'])
+def api_submit_job():
+    try:
+        data = request.json
+        if not data:
+            return jsonify({"error": "Không có dữ liệu được gửi lên"}), 400
+        
+        try:
+            job_id = get_job_queue().submit(data.get('task', ''), data.get('params', {}))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        status_url = f"/api/jobs/{job_id}"
+        return jsonify({"job_id": job_id, "status": "queued", "status_url": status_url}), 202, {"Location": status_url}
+    except Exception as e:
+        print(f"Error in /api/jobs: {str(e)}")
+        return jsonify({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def api_get_job(job_id):
+    try:
+        job = get_job_queue().get(job_id)
+        if job is None:
+            return jsonify({"error": "Không tìm thấy tác vụ hoặc kết quả đã hết hạn"}), 404
+        
+        return jsonify(job)
+    except Exception as e:
+        print(f"Error in /api/jobs/{job_id}: {str(e)}")
+        return jsonify({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}), 500
+
 if __name__ == '__main__':
     app.run(debug=True, port=8501)
\ No newline at end of file
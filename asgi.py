@@ -0,0 +1,550 @@
+"""Chế độ phục vụ bất đồng bộ (ASGI) cho Job Assistant Agent.
+
+Cùng các route như `app.py` nhưng mọi lời gọi LLM chạy trên `ainvoke`/`astream`,
+nên một process có thể giữ hàng trăm request đang chờ model mà không chiếm worker.
+Số lời gọi LLM đồng thời được giới hạn bởi `LLM_MAX_CONCURRENCY`.
+
+Chạy: uvicorn asgi:app --host 0.0.0.0 --port 8501 --workers 2
+"""
+from quart import Quart, Response, g, render_template, request, jsonify
+from quart_cors import cors
+from quart.wrappers.response import IterableBody
+import asyncio
+import os
+import time
+from dotenv import load_dotenv
+from agent.job_agent import JobAssistantAgent, JobModule, EmailModule, CVModule, CompanyModule, STRUCTURED_OUTPUT
+from agent.llm_client import get_module
+from agent.matching import TOP_N, CVMatcher
+from agent.job_queue import get_job_queue
+from agent.rate_limiter import LLMOverloaded
+from agent.deadline import DeadlineExceeded, request_budget, start_deadline
+from agent.metrics import CONTENT_TYPE, REGISTRY, observe_request, server_timing, start_request
+from agent.tracing import awrap_stream, end_trace, start_trace, traceparent
+from agent.company_data import get_company_data
+from agent.batch_eval import BATCH_DIR, CONCURRENCY as BATCH_CONCURRENCY, Checkpoint, batch_id, normalize_cvs, aiter_evaluate, summarize
+from agent.mail_merge import BATCH_SIZE as MAIL_MERGE_BATCH_SIZE, MAX_COMPANIES as MAIL_MERGE_MAX_COMPANIES, normalize_companies, aiter_merge, summarize as summarize_merge
+from agent.utils import get_openai_api_key, format_sse
+from agent import warmup
+
+# Load environment variables
+load_dotenv()
+
+# Initialize Quart app
+app = Quart(__name__)
+
+# Cấu hình CORS
+app = cors(
+    app,
+    allow_origin=["http://127.0.0.1:5500", "http://localhost:5500"],
+    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_headers=["Content-Type", "Authorization"]
+)
+
+# Check if OpenAI API key is available
+try:
+    api_key = get_openai_api_key()
+except ValueError as e:
+    print(f"Error: {str(e)}")
+    api_key = None
+
+# Agent (4 module và đồ thị LangGraph) được tạo khi dùng lần đầu hoặc làm nóng ở nền
+def __getattr__(name):
+    if name == 'agent':
+        return get_module(JobAssistantAgent)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+warmup.start()
+
+# Endpoint không áp thời hạn cho cả request
+_NO_DEADLINE = {'api_danh_gia_cv_batch', 'api_submit_job', 'api_get_job'}
+
+@app.before_request
+async def _start_timing():
+    g.request_start = time.perf_counter()
+    start_request()
+    g.trace = start_trace(f"{request.method} {request.path}", request.headers.get('traceparent'), method=request.method, path=request.path)
+    # Lô đánh giá CV chạy lâu theo thiết kế, chỉ giới hạn từng lời gọi LLM
+    budget = None if request.endpoint in _NO_DEADLINE else request_budget(_wants_stream(), request.headers.get('X-Request-Timeout'))
+    start_deadline(budget)
+
+@app.after_request
+async def _record_timing(response):
+    """Ghi số liệu của request và gắn header Server-Timing (stream chỉ tính đến khi trả header)"""
+    elapsed = time.perf_counter() - g.request_start
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    observe_request(endpoint, request.method, response.status_code, elapsed)
+    response.headers['Server-Timing'] = server_timing(elapsed)
+    # Trace của response stream kết thúc khi gửi xong phần thân
+    g.trace.set(endpoint=endpoint, status_code=response.status_code)
+    header = traceparent(g.trace)
+    if header:
+        response.headers['traceparent'] = header
+    if isinstance(response.response, IterableBody):
+        response.response.iter = awrap_stream(response.response.iter, g.trace)
+    else:
+        end_trace(g.trace)
+    return response
+
+@app.route('/metrics')
+async def metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+@app.route('/')
+async def index():
+    return await render_template('index.html')
+
+@app.route('/tim-viec')
+async def tim_viec():
+    return await render_template('tim_viec.html')
+
+@app.route('/viet-email')
+async def viet_email():
+    return await render_template('viet_email.html')
+
+@app.route('/danh-gia-cv')
+async def danh_gia_cv():
+    return await render_template('danh_gia_cv.html')
+
+@app.route('/thong-ke-cong-ty')
+async def thong_ke_cong_ty():
+    return await render_template('thong_ke_cong_ty.html')
+
+@app.route('/tao-cv')
+async def tao_cv():
+    return await render_template('tao_cv.html')
+
+def _wants_stream() -> bool:
+    """Client yêu cầu chế độ stream qua ?stream=1"""
+    return request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+def _wants_structured() -> bool:
+    """Trả về dữ liệu có cấu trúc (?format=structured hoặc STRUCTURED_OUTPUT=1 khi không stream)"""
+    output_format = request.args.get('format', '').lower()
+    if output_format:
+        return output_format == 'structured'
+    return STRUCTURED_OUTPUT and not _wants_stream()
+
+def _wants_narrative() -> bool:
+    """Kèm nhận xét của LLM cho số liệu thống kê (?narrative=1; chế độ stream luôn kèm)"""
+    return request.args.get('narrative', '').lower() in ('1', 'true', 'yes')
+
+def _int_param(data, name: str, default: int, low: int, high: int) -> int:
+    """Tham số nguyên `name` của body JSON, giới hạn trong [low, high]; ValueError nếu không phải số nguyên"""
+    value = data.get(name, default)
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(name)
+    return max(low, min(int(value), high))
+
+def _overloaded_response(e: LLMOverloaded):
+    """503 kèm Retry-After khi hàng chờ gọi LLM đã đầy"""
+    return jsonify({
+        "error": "Hệ thống đang quá tải, vui lòng thử lại sau",
+        "retry_after": e.retry_after
+    }), 503, {"Retry-After": str(e.retry_after)}
+
+def _timeout_response():
+    """504 khi request vượt quá thời hạn cho phép"""
+    return jsonify({"error": "Hết thời gian xử lý yêu cầu, vui lòng thử lại"}), 504
+
+def _sse_response(chunks, endpoint: str, events=()) -> Response:
+    """Trả về các đoạn văn bản từ model dưới dạng Server-Sent Events, sau các sự kiện `events` (tên, dữ liệu) nếu có"""
+    async def generate():
+        try:
+            for event, data in events:
+                yield format_sse(data, event=event)
+            async for chunk in chunks:
+                yield format_sse({"text": chunk})
+            yield format_sse({}, event="done")
+        except LLMOverloaded as e:
+            yield format_sse({"error": "Hệ thống đang quá tải, vui lòng thử lại sau", "retry_after": e.retry_after}, event="error")
+        except DeadlineExceeded:
+            yield format_sse({"error": "Hết thời gian xử lý yêu cầu, vui lòng thử lại"}, event="error")
+        except Exception as e:
+            print(f"Error in {endpoint} (stream): {str(e)}")
+            yield format_sse({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}, event="error")
+
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# API endpoints
+@app.route('/api/tim-viec', methods=['POST'])
+async def api_tim_viec():
+    try:
+        data = await request.get_json()
+        if not data:
+            return jsonify({"error": "Không có dữ liệu được gửi lên"}), 400
+
+        job_module = get_module(JobModule)
+
+        params = dict(
+            job_description=data.get('jobDescription', ''),
+            salary=data.get('salary', ''),
+            location=data.get('location', ''),
+            experience=data.get('experience', 0)
+        )
+        if _wants_structured():
+            jobs_data = await job_module.afind_jobs_structured(**params)
+            html = await render_template('partials/job_results.html', **jobs_data)
+            return jsonify({"result": html, "data": jobs_data})
+        if _wants_stream():
+            return _sse_response(job_module.astream_find_jobs(**params), '/api/tim-viec')
+
+        result = await job_module.afind_jobs(**params)
+
+        return jsonify({"result": result})
+    except LLMOverloaded as e:
+        return _overloaded_response(e)
+    except DeadlineExceeded:
+        return _timeout_response()
+    except Exception as e:
+        print(f"Error in /api/tim-viec: {str(e)}")
+        return jsonify({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}), 500
+
+@app.route('/api/viet-email', methods=['POST'])
+async def api_viet_email():
+    try:
+        data = await request.get_json()
+        if not data:
+            return jsonify({"error": "Không có dữ liệu được gửi lên"}), 400
+
+        email_module = get_module(EmailModule)
+
+        params = dict(
+            job_title=data.get('job_title', ''),
+            company=data.get('company', ''),
+            skills=data.get('skills', '')
+        )
+        if _wants_stream():
+            return _sse_response(email_module.astream_application_email(**params), '/api/viet-email')
+
+        result = await email_module.awrite_application_email(**params)
+
+        return jsonify({"email": result})
+    except LLMOverloaded as e:
+        return _overloaded_response(e)
+    except DeadlineExceeded:
+        return _timeout_response()
+    except Exception as e:
+        print(f"Error in /api/viet-email: {str(e)}")
+        return jsonify({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}), 500
+
+@app.route('/api/viet-email/batch', methods=['POST'])
+async def api_viet_email_batch():
+    try:
+        data = await request.get_json()
+        if not data:
+            return jsonify({"error": "Không có dữ liệu được gửi lên"}), 400
+        
+        companies = normalize_companies(data.get('companies', []))
+        if not companies:
+            return jsonify({"error": "Cần ít nhất một công ty"}), 400
+        if len(companies) > MAIL_MERGE_MAX_COMPANIES:
+            return jsonify({"error": f"Tối đa {MAIL_MERGE_MAX_COMPANIES} công ty mỗi lần"}), 400
+        
+        job_title = data.get('job_title', '')
+        skills = data.get('skills', '')
+        try:
+            batch_size = _int_param(data, 'batch_size', MAIL_MERGE_BATCH_SIZE, 1, MAIL_MERGE_BATCH_SIZE)
+        except ValueError:
+            return jsonify({"error": "batch_size phải là số nguyên"}), 400
+        records = aiter_merge(job_title, skills, companies, batch_size)
+        
+        if _wants_stream():
+            async def generate():
+                results = []
+                start = time.perf_counter()
+                try:
+                    async for record in records:
+                        results.append(record)
+                        yield format_sse({"result": record})
+                    yield format_sse({"stats": summarize_merge(results, time.perf_counter() - start, batch_size)}, event="done")
+                except LLMOverloaded as e:
+                    yield format_sse({"error": "Hệ thống đang quá tải, vui lòng thử lại sau", "retry_after": e.retry_after}, event="error")
+                except DeadlineExceeded:
+                    yield format_sse({"error": "Hết thời gian xử lý yêu cầu, vui lòng thử lại"}, event="error")
+                except Exception as e:
+                    print(f"Error in /api/viet-email/batch (stream): {str(e)}")
+                    yield format_sse({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}, event="error")
+            
+            return Response(
+                generate(),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+        
+        start = time.perf_counter()
+        results = [record async for record in records]
+        
+        return jsonify({
+            "emails": results,
+            "stats": summarize_merge(results, time.perf_counter() - start, batch_size)
+        })
+    except LLMOverloaded as e:
+        return _overloaded_response(e)
+    except DeadlineExceeded:
+        return _timeout_response()
+    except Exception as e:
+        print(f"Error in /api/viet-email/batch: {str(e)}")
+        return jsonify({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}), 500
+
+@app.route('/api/danh-gia-cv', methods=['POST'])
+async def api_danh_gia_cv():
+    try:
+        data = await request.get_json()
+        if not data:
+            return jsonify({"error": "Không có dữ liệu được gửi lên"}), 400
+
+        cv_module = get_module(CVModule)
+
+        params = dict(
+            cv_text=data.get('cv_text', ''),
+            job_description=data.get('job_description', '')
+        )
+        if _wants_stream():
+            return _sse_response(cv_module.astream_evaluate_cv(**params), '/api/danh-gia-cv')
+
+        result = await cv_module.aevaluate_cv(**params)
+
+        return jsonify({"evaluation": result})
+    except LLMOverloaded as e:
+        return _overloaded_response(e)
+    except DeadlineExceeded:
+        return _timeout_response()
+    except Exception as e:
+        print(f"Error in /api/danh-gia-cv: {str(e)}")
+        return jsonify({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}), 500
+
+@app.route('/api/danh-gia-cv/batch', methods=['POST'])
+async def api_danh_gia_cv_batch():
+    try:
+        data = await request.get_json()
+        if not data:
+            return jsonify({"error": "Không có dữ liệu được gửi lên"}), 400
+        
+        cvs = normalize_cvs(data.get('cvs', []))
+        if not cvs:
+            return jsonify({"error": "Cần ít nhất một CV"}), 400
+        
+        job_description = data.get('job_description', '')
+        try:
+            concurrency = _int_param(data, 'concurrency', BATCH_CONCURRENCY, 1, BATCH_CONCURRENCY)
+        except ValueError:
+            return jsonify({"error": "concurrency phải là số nguyên"}), 400
+        # Gửi lại cùng một lô sẽ tiếp tục từ các kết quả đã có
+        current_batch = batch_id(cvs, job_description)
+        checkpoint = Checkpoint(os.path.join(BATCH_DIR, f"{current_batch}.jsonl"))
+        records = aiter_evaluate(cvs, job_description, checkpoint, concurrency)
+        
+        if _wants_stream():
+            async def generate():
+                results = []
+                start = time.perf_counter()
+                try:
+                    async for record in records:
+                        results.append(record)
+                        yield format_sse({"result": record})
+                    yield format_sse({"batch_id": current_batch, "stats": summarize(results, time.perf_counter() - start)}, event="done")
+                except Exception as e:
+                    print(f"Error in /api/danh-gia-cv/batch (stream): {str(e)}")
+                    yield format_sse({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}, event="error")
+            
+            return Response(
+                generate(),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+        
+        start = time.perf_counter()
+        results = [record async for record in records]
+        
+        return jsonify({
+            "batch_id": current_batch,
+            "results": results,
+            "stats": summarize(results, time.perf_counter() - start)
+        })
+    except LLMOverloaded as e:
+        return _overloaded_response(e)
+    except DeadlineExceeded:
+        return _timeout_response()
+    except Exception as e:
+        print(f"Error in /api/danh-gia-cv/batch: {str(e)}")
+        return jsonify({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}), 500
+
+@app.route('/api/thong-ke-cong-ty', methods=['POST'])
+async def api_thong_ke_cong_ty():
+    try:
+        data = await request.get_json()
+        if not data:
+            return jsonify({"error": "Không có dữ liệu được gửi lên"}), 400
+
+        company_module = get_module(CompanyModule)
+
+        params = dict(
+            skills=data.get('skills', ''),
+            industry=data.get('industry', ''),
+            location=data.get('location', '')
+        )
+        if _wants_structured():
+            companies_data = await company_module.afind_top_companies_structured(**params)
+            html = await render_template('partials/company_results.html', **companies_data)
+            return jsonify({"companies": html, "data": companies_data})
+        if _wants_stream():
+            return _sse_response(company_module.astream_top_companies(**params), '/api/thong-ke-cong-ty')
+
+        result = await company_module.afind_top_companies(**params)
+
+        return jsonify({"companies": result})
+    except LLMOverloaded as e:
+        return _overloaded_response(e)
+    except DeadlineExceeded:
+        return _timeout_response()
+    except Exception as e:
+        print(f"Error in /api/thong-ke-cong-ty: {str(e)}")
+        return jsonify({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}), 500
+
+@app.route('/api/thong-ke-cong-ty/stats', methods=['POST'])
+async def api_thong_ke_cong_ty_stats():
+    try:
+        # {} là hợp lệ: không lọc, trả về thống kê toàn bộ dữ liệu
+        data = await request.get_json(silent=True)
+        if data is None:
+            return jsonify({"error": "Không có dữ liệu được gửi lên"}), 400
+
+        # Lần đầu (hoặc khi file dữ liệu đổi) phải đọc file, không chạy trên event loop
+        company_data = await asyncio.to_thread(get_company_data)
+        if company_data is None:
+            return jsonify({"error": "Chưa có dữ liệu công ty (COMPANY_DATA)"}), 404
+
+        params = dict(
+            skills=data.get('skills', ''),
+            industry=data.get('industry', ''),
+            location=data.get('location', '')
+        )
+        stats = company_data.stats(params['industry'], params['location'], params['skills'])
+        if _wants_stream():
+            company_module = get_module(CompanyModule)
+            return _sse_response(company_module.astream_narrate_stats(stats, **params), '/api/thong-ke-cong-ty/stats', [("stats", {"stats": stats})])
+        if _wants_narrative():
+            company_module = get_module(CompanyModule)
+            return jsonify({"stats": stats, "narrative": await company_module.anarrate_stats(stats, **params)})
+
+        return jsonify({"stats": stats})
+    except LLMOverloaded as e:
+        return _overloaded_response(e)
+    except DeadlineExceeded:
+        return _timeout_response()
+    except Exception as e:
+        print(f"Error in /api/thong-ke-cong-ty/stats: {str(e)}")
+        return jsonify({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}), 500
+
+@app.route('/api/tao-cv', methods=['POST'])
+async def api_tao_cv():
+    try:
+        data = await request.get_json()
+        if not data:
+            return jsonify({"error": "Không có dữ liệu được gửi lên"}), 400
+
+        cv_module = get_module(CVModule)
+
+        params = dict(
+            name=data.get('name', ''),
+            email=data.get('email', ''),
+            phone=data.get('phone', ''),
+            education=data.get('education', ''),
+            experience=data.get('experience', ''),
+            skills=data.get('skills', '')
+        )
+        if _wants_stream():
+            return _sse_response(cv_module.astream_create_cv(**params), '/api/tao-cv')
+
+        result = await cv_module.acreate_cv(**params)
+
+        return jsonify({"cv": result})
+    except LLMOverloaded as e:
+        return _overloaded_response(e)
+    except DeadlineExceeded:
+        return _timeout_response()
+    except Exception as e:
+        print(f"Error in /api/tao-cv: {str(e)}")
+        return jsonify({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}), 500
+
+@app.route('/api/xep-hang-cv', methods=['POST'])
+async def api_xep_hang_cv():
+    try:
+        data = await request.get_json()
+        if not data:
+            return jsonify({"error": "Không có dữ liệu được gửi lên"}), 400
+        
+        cvs = data.get('cvs', [])
+        jds = data.get('jds', [])
+        if not cvs or not jds:
+            return jsonify({"error": "Cần ít nhất một CV và một mô tả công việc"}), 400
+        
+        try:
+            top_n = _int_param(data, 'top_n', TOP_N, 1, len(cvs))
+        except ValueError:
+            return jsonify({"error": "top_n phải là số nguyên"}), 400
+        
+        matcher = get_module(CVMatcher)
+        
+        results = await matcher.amatch(
+            cvs,
+            jds,
+            top_n=top_n,
+            evaluate=bool(data.get('evaluate', False))
+        )
+        
+        return jsonify({"results": results})
+    except LLMOverloaded as e:
+        return _overloaded_response(e)
+    except DeadlineExceeded:
+        return _timeout_response()
+    except Exception as e:
+        print(f"Error in /api/xep-hang-cv: {str(e)}")
+        return jsonify({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}), 500
+
+@app.route('/api/jobs', methods=['POST'])
+async def api_submit_job():
+    try:
+        data = await request.get_json()
+        if not data:
+            return jsonify({"error": "Không có dữ liệu được gửi lên"}), 400
+        
+        try:
+            job_id = get_job_queue().submit(data.get('task', ''), data.get('params', {}))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        status_url = f"/api/jobs/{job_id}"
+        return jsonify({"job_id": job_id, "status": "queued", "status_url": status_url}), 202, {"Location": status_url}
+    except Exception as e:
+        print(f"Error in /api/jobs: {str(e)}")
+        return jsonify({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+async def api_get_job(job_id):
+    try:
+        job = get_job_queue().get(job_id)
+        if job is None:
+            return jsonify({"error": "Không tìm thấy tác vụ hoặc kết quả đã hết hạn"}), 404
+        
+        return jsonify(job)
+    except Exception as e:
+        print(f"Error in /api/jobs/{job_id}: {str(e)}")
+        return jsonify({"error": "Có lỗi xảy ra khi xử lý yêu cầu"}), 500
+
+if __name__ == '__main__':
+    import uvicorn
+    workers = int(os.getenv("ASGI_WORKERS", "1"))
+    # Các worker chia nhau hạn mức RPM/TPM (agent.rate_limiter)
+    os.environ.setdefault("WEB_CONCURRENCY", str(workers))
+    uvicorn.run(
+        "asgi:app",
+        host=os.getenv("HOST", "127.0.0.1"),
+        port=int(os.getenv("PORT", "8501")),
+        workers=workers
+    )
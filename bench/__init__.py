@@ -0,0 +1 @@
+"""Benchmark offline cho ứng dụng với server LLM giả lập (xem `python -m bench --help`)."""
@@ -0,0 +1,462 @@
+"""Server giả lập OpenAI chat completions/embeddings để benchmark không tốn quota.
+
+Độ trễ đến token đầu tiên theo phân phối log-normal (trung vị `ttft_ms`, độ lệch
+`ttft_sigma`) cộng thời gian đọc prompt (`prefill_tps` token/giây), sau đó sinh `tokens` token (trung bình) với tốc độ `tps` token/giây,
+phần đầu prompt đã gặp (từ 1024 token, theo khối 128 token như OpenAI) được tính là
+token cache (`cached_tokens` trong usage) và không tốn thời gian đọc,
+hỗ trợ stream (kèm usage khi client yêu cầu) và tool calling: tham số được sinh
+theo JSON schema của tool. Lỗi 429 có thể được chèn ngẫu nhiên (`rate_429`) hoặc
+khi vượt `rpm` request/phút, kèm header Retry-After.
+
+    python -m bench.fake_llm --port 8999 --ttft-ms 400 --tps 60 --tokens 250
+    OPENAI_BASE_URL=http://127.0.0.1:8999/v1 OPENAI_API_KEY=sk-fake python app.py
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+WORDS = (
+    "kinh nghiệm phát triển phần mềm kỹ năng python dữ liệu hệ thống dự án công ty "
+    "ứng viên vị trí mức lương làm việc nhóm môi trường cơ hội thăng tiến yêu cầu "
+    "trách nhiệm quản lý giải pháp khách hàng chất lượng hiệu quả đào tạo"
+).split()
+
+ROUTE_KEYWORDS = (
+    ("write_email", ("email", "thư")),
+    ("create_cv", ("tạo cv", "viết cv", "tạo hồ sơ")),
+    ("evaluate_cv", ("đánh giá", "cv")),
+    ("find_companies", ("công ty", "doanh nghiệp")),
+)
+
+
+class FakeLLMConfig:
+    """Tham số hành vi của server giả lập"""
+
+    def __init__(self, ttft_ms: float = 300.0, ttft_sigma: float = 0.4, tps: float = 80.0, tokens: int = 200,
+                 rate_429: float = 0.0, rpm: int = 0, retry_after: float = 1.0, embedding_ms: float = 30.0,
+                 list_items: int = 3, prefill_tps: float = 0.0, prompt_cache: bool = True, seed: Optional[int] = None):
+        self.ttft_ms = ttft_ms
+        self.ttft_sigma = ttft_sigma
+        self.tps = tps
+        self.tokens = tokens
+        self.rate_429 = rate_429
+        self.rpm = rpm
+        self.retry_after = retry_after
+        self.embedding_ms = embedding_ms
+        self.list_items = list_items
+        self.prefill_tps = prefill_tps
+        self.prompt_cache = prompt_cache
+        self.random = random.Random(seed)
+
+    def ttft(self) -> float:
+        if self.ttft_sigma <= 0:
+            return self.ttft_ms / 1000
+        return self.random.lognormvariate(math.log(max(self.ttft_ms, 1e-3)), self.ttft_sigma) / 1000
+
+    def prefill(self, prompt_tokens: int) -> float:
+        return prompt_tokens / self.prefill_tps if self.prefill_tps > 0 else 0.0
+
+    def completion_tokens(self) -> int:
+        return max(1, int(self.random.gauss(self.tokens, self.tokens * 0.2)))
+
+    def token_delay(self) -> float:
+        return 1 / self.tps if self.tps > 0 else 0.0
+
+
+class PromptCache:
+    """Cache prefix prompt như provider: prefix từ `min_tokens`, khớp theo khối `block_tokens`"""
+
+    CHARS_PER_TOKEN = 4
+
+    def __init__(self, min_tokens: int = 1024, block_tokens: int = 128, size: int = 100_000):
+        self.min_chars = min_tokens * self.CHARS_PER_TOKEN
+        self.block_chars = block_tokens * self.CHARS_PER_TOKEN
+        self.size = size
+        self._lock = threading.Lock()
+        self._prefixes: set = set()
+
+    def lookup(self, prompt: str) -> int:
+        """Số token ở đầu `prompt` đã có trong cache, sau đó lưu các prefix của `prompt`"""
+        if len(prompt) < self.min_chars:
+            return 0
+        digest = hashlib.sha1()
+        digest.update(prompt[:self.min_chars].encode("utf-8"))
+        keys = [digest.hexdigest()]
+        for start in range(self.min_chars, len(prompt) - self.block_chars + 1, self.block_chars):
+            digest.update(prompt[start:start + self.block_chars].encode("utf-8"))
+            keys.append(digest.hexdigest())
+        with self._lock:
+            hits = 0
+            while hits < len(keys) and keys[hits] in self._prefixes:
+                hits += 1
+            if len(self._prefixes) > self.size:
+                self._prefixes.clear()
+            self._prefixes.update(keys)
+        if not hits:
+            return 0
+        return (self.min_chars + (hits - 1) * self.block_chars) // self.CHARS_PER_TOKEN
+
+
+class FakeLLMStats:
+    """Số liệu phía server: số request, lỗi 429, số request đồng thời lớn nhất"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.chat = 0
+        self.embeddings = 0
+        self.rate_limited = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._window: deque = deque()
+
+    def begin(self) -> None:
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def end(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def over_rpm(self, rpm: int) -> bool:
+        """Ghi nhận một lời gọi chat; True nếu đã vượt `rpm` trong 60 giây gần nhất"""
+        now = time.monotonic()
+        with self._lock:
+            while self._window and now - self._window[0] > 60:
+                self._window.popleft()
+            if rpm and len(self._window) >= rpm:
+                return True
+            self._window.append(now)
+            return False
+
+    def add(self, **counts: int) -> None:
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "chat": self.chat,
+                "embeddings": self.embeddings,
+                "rate_limited": self.rate_limited,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cached_tokens": self.cached_tokens,
+                "peak_in_flight": self.peak_in_flight,
+            }
+
+
+def _prompt_text(messages: List[Dict[str, Any]]) -> str:
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            content = " ".join(str(part.get("text", "")) for part in content if isinstance(part, dict))
+        parts.append(str(content or ""))
+    return "\n".join(parts)
+
+
+def _user_request(prompt: str) -> str:
+    """Phần yêu cầu của người dùng trong prompt (dòng `Yêu cầu: ...`) để chọn chức năng"""
+    match = re.search(r"Yêu cầu:\s*(.+)", prompt)
+    return (match.group(1) if match else prompt).lower()
+
+
+def _route(prompt: str) -> str:
+    text = _user_request(prompt)
+    for route, keywords in ROUTE_KEYWORDS:
+        if any(keyword in text for keyword in keywords):
+            return route
+    return "find_jobs"
+
+
+def _list_count(config: FakeLLMConfig, prompt: str) -> int:
+    """Số phần tử của danh sách: theo dòng `Số công ty: N` của prompt (email hàng loạt) nếu có"""
+    match = re.search(r"Số công ty:\s*(\d+)", prompt)
+    return int(match.group(1)) if match else config.list_items
+
+
+def _listed_companies(prompt: str) -> List[str]:
+    """Tên công ty theo các dòng `1. Tên (ghi chú)` sau dòng `Số công ty: N`"""
+    if "Số công ty:" not in prompt:
+        return []
+    listing = prompt[prompt.index("Số công ty:"):]
+    return [name.strip() for name in re.findall(r"^\d+\.\s*([^(\n]+)", listing, re.M)]
+
+
+def _words(config: FakeLLMConfig, count: int) -> List[str]:
+    return [config.random.choice(WORDS) for _ in range(count)]
+
+
+def _text_reply(config: FakeLLMConfig, prompt: str) -> List[str]:
+    """Nội dung trả lời chia theo token (mỗi từ là một token)"""
+    if "Trả về một trong các giá trị sau" in prompt:
+        return [_route(prompt)]
+    if "JSON" in prompt:
+        # Prompt trích xuất tham số: trả về đúng các khóa trong mẫu JSON của prompt
+        template = prompt[prompt.index("JSON"):]
+        keys = dict.fromkeys(re.findall(r'"(\w+)"\s*:', template))
+        values = {key: "2" if key == "experience" else " ".join(_words(config, 3)) for key in keys}
+        return [json.dumps(values, ensure_ascii=False)]
+    return [word + " " for word in _words(config, config.completion_tokens())]
+
+
+def _resolve(schema: Dict[str, Any], defs: Dict[str, Any]) -> Dict[str, Any]:
+    ref = schema.get("$ref")
+    if ref:
+        return _resolve(defs[ref.rsplit("/", 1)[-1]], defs)
+    return schema
+
+
+def _sample(schema: Dict[str, Any], defs: Dict[str, Any], config: FakeLLMConfig, prompt: str) -> Any:
+    """Giá trị hợp lệ theo JSON schema (đủ để pydantic validate)"""
+    schema = _resolve(schema, defs)
+    for key in ("anyOf", "oneOf"):
+        if key in schema:
+            options = [o for o in schema[key] if _resolve(o, defs).get("type") != "null"]
+            return _sample(options[0] if options else {"type": "null"}, defs, config, prompt)
+    if "enum" in schema:
+        route = _route(prompt)
+        return route if route in schema["enum"] else schema["enum"][0]
+    kind = schema.get("type", "object")
+    if kind == "object":
+        return {
+            key: _sample(sub, defs, config, prompt)
+            for key, sub in schema.get("properties", {}).items()
+        }
+    if kind == "array":
+        items = [_sample(schema.get("items", {}), defs, config, prompt) for _ in range(_list_count(config, prompt))]
+        # Email hàng loạt: mỗi phần tử mang tên công ty trong danh sách của prompt
+        for item, name in zip(items, _listed_companies(prompt)):
+            if isinstance(item, dict) and "company" in item:
+                item["company"] = name
+        return items
+    if kind == "integer":
+        low, high = schema.get("minimum", 1), schema.get("maximum", 100)
+        return config.random.randint(int(low), int(high))
+    if kind == "number":
+        return round(config.random.uniform(schema.get("minimum", 0), schema.get("maximum", 100)), 1)
+    if kind == "boolean":
+        return True
+    if kind == "null":
+        return None
+    return " ".join(_words(config, max(2, config.completion_tokens() // 20)))
+
+
+def _tool_arguments(config: FakeLLMConfig, body: Dict[str, Any], prompt: str) -> Tuple[str, Dict[str, Any]]:
+    function = body["tools"][0]["function"]
+    parameters = function.get("parameters", {})
+    return function["name"], _sample(parameters, parameters.get("$defs", {}), config, prompt)
+
+
+def _embedding(text: str, dims: int = 64) -> List[float]:
+    digest = b""
+    seed = text.encode("utf-8")
+    while len(digest) < dims:
+        seed = hashlib.sha256(seed).digest()
+        digest += seed
+    return [(b - 127.5) / 127.5 for b in digest[:dims]]
+
+
+def make_handler(config: FakeLLMConfig, stats: FakeLLMStats):
+    prompt_cache = PromptCache()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+        def _json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _chunk(self, payload: bytes) -> None:
+            self.wfile.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+            self.wfile.flush()
+
+        def do_GET(self) -> None:
+            if self.path.rstrip("/").endswith("/stats"):
+                self._json(200, stats.snapshot())
+            else:
+                self._json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self) -> None:
+            stats.begin()
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path.endswith("/embeddings"):
+                    self._embeddings(body)
+                elif self.path.endswith("/chat/completions"):
+                    self._chat(body)
+                else:
+                    self._json(404, {"error": {"message": "not found"}})
+            finally:
+                stats.end()
+
+        def _embeddings(self, body: Dict[str, Any]) -> None:
+            inputs = body.get("input", [])
+            inputs = inputs if isinstance(inputs, list) else [inputs]
+            time.sleep(config.embedding_ms / 1000)
+            stats.add(embeddings=1)
+            self._json(200, {
+                "object": "list",
+                "model": body.get("model", "fake"),
+                "data": [{"object": "embedding", "index": i, "embedding": _embedding(str(text))} for i, text in enumerate(inputs)],
+                "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+            })
+
+        def _chat(self, body: Dict[str, Any]) -> None:
+            stats.add(chat=1)
+            if stats.over_rpm(config.rpm) or config.random.random() < config.rate_429:
+                stats.add(rate_limited=1)
+                self._json(429, {"error": {"message": "Rate limit reached (fake)", "type": "rate_limit_error", "code": "rate_limit_exceeded"}},
+                           {"Retry-After": f"{config.retry_after:g}", "retry-after-ms": str(int(config.retry_after * 1000))})
+                return
+
+            prompt = _prompt_text(body.get("messages", []))
+            prompt_tokens = len(prompt) // 4 + 1
+            model = body.get("model", "fake")
+            base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": model}
+            cached_tokens = prompt_cache.lookup(prompt) if config.prompt_cache else 0
+            time.sleep(config.ttft() + config.prefill(prompt_tokens - cached_tokens))
+
+            if body.get("tools"):
+                name, arguments = _tool_arguments(config, body, prompt)
+                content = json.dumps(arguments, ensure_ascii=False)
+                tokens = [content]
+                completion_tokens = len(content) // 4 + 1
+                time.sleep(completion_tokens * config.token_delay())
+                message = {"role": "assistant", "content": None, "tool_calls": [
+                    {"id": "call_fake", "type": "function", "function": {"name": name, "arguments": content}}
+                ]}
+            else:
+                tokens = _text_reply(config, prompt)
+                limit = body.get("max_completion_tokens") or body.get("max_tokens")
+                if limit:
+                    tokens = tokens[:limit]
+                completion_tokens = len(tokens)
+                message = {"role": "assistant", "content": "".join(tokens)}
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            }
+            stats.add(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, cached_tokens=cached_tokens)
+
+            if not body.get("stream") or body.get("tools"):
+                if not body.get("tools"):
+                    time.sleep(completion_tokens * config.token_delay())
+                self._json(200, {**base, "object": "chat.completion", "usage": usage,
+                                 "choices": [{"index": 0, "message": message, "finish_reason": "stop"}]})
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for i, token in enumerate(tokens):
+                    if i:
+                        time.sleep(config.token_delay())
+                    chunk = {**base, "object": "chat.completion.chunk",
+                             "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+                    self._chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                done = {**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                self._chunk(f"data: {json.dumps(done)}\n\n".encode())
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    final = {**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}
+                    self._chunk(f"data: {json.dumps(final)}\n\n".encode())
+                self._chunk(b"data: [DONE]\n\n")
+                self._chunk(b"")
+            except (BrokenPipeError, ConnectionResetError):
+                # Client ngắt kết nối giữa lúc stream
+                pass
+
+    return Handler
+
+
+class FakeLLMServer:
+    """Server giả lập chạy trong thread nền (dùng trong bench) hoặc ở tiến trình riêng"""
+
+    def __init__(self, config: Optional[FakeLLMConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or FakeLLMConfig()
+        self.stats = FakeLLMStats()
+        self.httpd = ThreadingHTTPServer((host, port), make_handler(self.config, self.stats))
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeLLMServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--ttft-ms", type=float, default=300.0, help="Trung vị thời gian đến token đầu tiên (ms)")
+    parser.add_argument("--ttft-sigma", type=float, default=0.4, help="Độ lệch log-normal của TTFT (0: cố định)")
+    parser.add_argument("--tps", type=float, default=80.0, help="Tốc độ sinh token/giây (0: tức thì)")
+    parser.add_argument("--tokens", type=int, default=200, help="Số token trung bình của câu trả lời")
+    parser.add_argument("--prefill-tps", type=float, default=0.0, help="Tốc độ đọc prompt token/giây (0: tức thì)")
+    parser.add_argument("--no-prompt-cache", action="store_true", help="Không giả lập cache prefix prompt")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Tỉ lệ lời gọi trả về 429")
+    parser.add_argument("--rpm", type=int, default=0, help="Trả về 429 khi vượt số lời gọi/phút (0: không giới hạn)")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def config_from_args(args: argparse.Namespace) -> FakeLLMConfig:
+    return FakeLLMConfig(
+        ttft_ms=args.ttft_ms, ttft_sigma=args.ttft_sigma, tps=args.tps, tokens=args.tokens, prefill_tps=args.prefill_tps,
+        prompt_cache=not args.no_prompt_cache,
+        rate_429=args.rate_429, rpm=args.rpm, retry_after=args.retry_after, seed=args.seed,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m bench.fake_llm", description="Server giả lập OpenAI cho benchmark")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8999)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    server = FakeLLMServer(config_from_args(args), args.host, args.port)
+    print(f"Fake LLM: {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
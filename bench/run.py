@@ -0,0 +1,395 @@
+"""Chạy benchmark, lưu kết quả theo commit và so sánh giữa các lần chạy.
+
+Mặc định server giả lập LLM (`bench.fake_llm`) và ứng dụng (`app.py` hoặc
+`asgi.py`) chạy cùng process, ứng dụng lắng nghe trên một cổng cục bộ và được
+gọi qua HTTP bởi httpx; bộ nhớ đo được là của cả process. Với `--url`, benchmark
+gọi tới server đang chạy sẵn (đã trỏ `OPENAI_BASE_URL` tới `python -m bench.fake_llm`)
+và không đo bộ nhớ, không chạy kịch bản `process`.
+
+    python -m bench run                                  # mọi kịch bản mặc định
+    python -m bench run -w tim_viec_stream -n 200 -c 32 --app asgi
+    python -m bench compare                              # hai lần chạy gần nhất
+    python -m bench compare results/a.json results/b.json --fail-on-regression
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from bench.fake_llm import FakeLLMServer, add_config_arguments, config_from_args
+from bench.workloads import DEFAULT, WORKLOADS, write_companies
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Phân vị q (0-100) theo nội suy tuyến tính"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def rss_mb() -> Optional[float]:
+    """Bộ nhớ đang dùng (RSS) của process"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS trả về byte, Linux trả về KB
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def _git(*args: str) -> str:
+    try:
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _configure_env(llm_url: str, keep_cache: bool) -> None:
+    """Trỏ ứng dụng tới server giả lập; phải gọi trước khi import app/asgi"""
+    os.environ["OPENAI_BASE_URL"] = llm_url
+    os.environ["OPENAI_API_KEY"] = os.environ.get("BENCH_OPENAI_API_KEY", "sk-fake")
+    os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="bench-cache-"))
+    os.environ.setdefault("JOB_WORKERS", "0")
+    os.environ.setdefault("TRACE_SAMPLE_RATE", "0")
+    if "COMPANY_DATA" not in os.environ:
+        os.environ["COMPANY_DATA"] = write_companies(os.path.join(os.environ["CACHE_DIR"], "companies.csv"))
+    if not keep_cache:
+        os.environ.setdefault("LLM_CACHE", "0")
+        os.environ.setdefault("SEMANTIC_CACHE", "0")
+
+
+def _serve_flask(port: int) -> Any:
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    import app as flask_app
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args: Any) -> None:
+            pass
+
+    server = make_server("127.0.0.1", port, flask_app.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, name="bench-flask", daemon=True).start()
+
+    def process(query: str) -> Awaitable[str]:
+        return asyncio.to_thread(flask_app.agent.process, query)
+
+    return process
+
+
+def _serve_asgi(port: int) -> Any:
+    import uvicorn
+    import asgi as asgi_app
+
+    server = uvicorn.Server(uvicorn.Config(asgi_app.app, host="127.0.0.1", port=port, log_level="warning", lifespan="off"))
+    threading.Thread(target=server.run, name="bench-asgi", daemon=True).start()
+    deadline = time.time() + 30
+    while not server.started and time.time() < deadline:
+        time.sleep(0.05)
+    # HTTP client và semaphore dùng chung của agent gắn với event loop của uvicorn,
+    # nên `aprocess` phải chạy trên loop đó chứ không phải loop của bench
+    loop = server.servers[0].get_loop()
+
+    def process(query: str) -> Awaitable[str]:
+        return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(asgi_app.agent.aprocess(query), loop))
+
+    return process
+
+
+async def _http_request(client: Any, workload: Dict[str, Any], i: int) -> Tuple[float, Optional[float], int]:
+    """Thời gian hoàn tất, thời gian đến byte đầu tiên của phần thân và mã trạng thái"""
+    start = time.perf_counter()
+    first = None
+    async with client.stream("POST", workload["path"], json=workload["payload"](i)) as response:
+        status = response.status_code
+        async for chunk in response.aiter_bytes():
+            if first is None and chunk:
+                first = time.perf_counter() - start
+            if workload.get("stream") and b"event: error" in chunk:
+                status = 599
+    return time.perf_counter() - start, first, status
+
+
+async def _process_request(process: Callable[[str], Awaitable[str]], workload: Dict[str, Any], i: int) -> Tuple[float, Optional[float], int]:
+    start = time.perf_counter()
+    await process(workload["query"](i))
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed, 200
+
+
+async def _run_workload(name: str, args: argparse.Namespace, base_url: str,
+                        process: Optional[Callable[[str], Awaitable[str]]], fake: Optional[FakeLLMServer]) -> Dict[str, Any]:
+    import httpx
+
+    workload = WORKLOADS[name]
+
+    def index(i: int) -> int:
+        # Một phần request dùng lại dữ liệu của request đầu tiên
+        return 0 if i % 100 < args.repeat * 100 else i
+
+    latencies: List[float] = []
+    ttfbs: List[float] = []
+    statuses: Dict[str, int] = {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    # Pool mặc định của asyncio.to_thread nhỏ hơn số request đồng thời khi máy ít CPU
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=args.concurrency))
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout,
+                                 limits=httpx.Limits(max_connections=args.concurrency * 2)) as client:
+        async def one(i: int, record: bool) -> None:
+            async with semaphore:
+                try:
+                    if "query" in workload:
+                        elapsed, first, status = await _process_request(process, workload, index(i))
+                    else:
+                        elapsed, first, status = await _http_request(client, workload, index(i))
+                except Exception as e:
+                    elapsed, first, status = 0.0, None, 0
+                    if record:
+                        print(f"  {name}: {type(e).__name__}: {e}")
+            if not record:
+                return
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if status == 200:
+                latencies.append(elapsed)
+                if first is not None:
+                    ttfbs.append(first)
+
+        # Dữ liệu của lượt khởi động không trùng với các request được đo
+        await asyncio.gather(*(one(args.requests + i, False) for i in range(args.warmup)))
+        rss_before = rss_mb()
+        llm_before = fake.stats.snapshot() if fake else None
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i, True) for i in range(args.requests)))
+        duration = time.perf_counter() - start
+
+    ok = len(latencies)
+    result: Dict[str, Any] = {
+        "requests": args.requests,
+        "ok": ok,
+        "errors": args.requests - ok,
+        "status": statuses,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(ok / duration, 3) if duration else None,
+    }
+    for label, values in (("latency_ms", latencies), ("ttfb_ms", ttfbs)):
+        result[label] = {
+            "mean": round(sum(values) / len(values) * 1000, 2) if values else None,
+            **{f"p{q}": round(percentile(values, q) * 1000, 2) if values else None for q in (50, 95, 99)},
+            "max": round(max(values) * 1000, 2) if values else None,
+        }
+    rss_after = rss_mb()
+    if rss_after is not None and rss_before is not None:
+        result["memory_mb"] = {"rss": round(rss_after, 1), "rss_delta": round(rss_after - rss_before, 1), "peak_rss": round(peak_rss_mb(), 1)}
+    if fake:
+        llm_after = fake.stats.snapshot()
+        delta = {key: llm_after[key] - llm_before[key] for key in ("chat", "embeddings", "rate_limited", "prompt_tokens", "completion_tokens", "cached_tokens")}
+        delta["chat_per_request"] = round(delta["chat"] / args.requests, 2)
+        delta["peak_in_flight"] = llm_after["peak_in_flight"]
+        result["llm"] = delta
+    return result
+
+
+def _print_result(name: str, result: Dict[str, Any]) -> None:
+    latency, ttfb = result["latency_ms"], result["ttfb_ms"]
+    memory = result.get("memory_mb", {})
+    print(
+        f"{name:22} {result['throughput_rps'] or 0:8.2f} req/s  "
+        f"p50 {latency['p50'] or 0:8.1f}  p95 {latency['p95'] or 0:8.1f}  p99 {latency['p99'] or 0:8.1f} ms  "
+        f"ttfb p50 {ttfb['p50'] or 0:7.1f} ms  lỗi {result['errors']:3}  "
+        f"rss {memory.get('rss', 0):7.1f} MB  llm/req {result.get('llm', {}).get('chat_per_request', '-')}"
+    )
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    names = args.workload or DEFAULT
+    unknown = [name for name in names if name not in WORKLOADS]
+    if unknown:
+        raise SystemExit(f"Kịch bản không tồn tại: {', '.join(unknown)} (có: {', '.join(WORKLOADS)})")
+
+    fake = None
+    process = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+        names = [name for name in names if "query" not in WORKLOADS[name]]
+    else:
+        llm_url = args.llm_url
+        if llm_url is None:
+            fake = FakeLLMServer(config_from_args(args)).start()
+            llm_url = fake.base_url
+        _configure_env(llm_url, args.keep_cache)
+        port = _free_port()
+        process = _serve_asgi(port) if args.app == "asgi" else _serve_flask(port)
+        base_url = f"http://127.0.0.1:{port}"
+
+    results = {}
+    for name in names:
+        result = asyncio.run(_run_workload(name, args, base_url, process, fake))
+        results[name] = result
+        _print_result(name, result)
+
+    record = {
+        "label": args.label,
+        "commit": _git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "branch": _git("rev-parse", "--abbrev-ref", "HEAD"),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {
+            "app": "url" if args.url else args.app,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "repeat": args.repeat,
+            "fake_llm": None if fake is None else {
+                "ttft_ms": args.ttft_ms, "ttft_sigma": args.ttft_sigma, "tps": args.tps, "tokens": args.tokens,
+                "rate_429": args.rate_429, "rpm": args.rpm, "prefill_tps": args.prefill_tps,
+                "prompt_cache": not args.no_prompt_cache,
+            },
+        },
+        "workloads": results,
+    }
+    if not args.no_save:
+        os.makedirs(args.results_dir, exist_ok=True)
+        suffix = f"-{args.label}" if args.label else ""
+        path = os.path.join(args.results_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{record['commit'] or 'nogit'}{suffix}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+        print(f"Đã lưu kết quả: {os.path.relpath(path)}")
+    return record
+
+
+def _load(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _change(old: Optional[float], new: Optional[float]) -> Optional[float]:
+    if not old or new is None:
+        return None
+    return (new - old) / old * 100
+
+
+# (chỉ số, cách lấy giá trị, True nếu giá trị lớn hơn là tốt hơn)
+COMPARED = [
+    ("req/s", lambda r: r["throughput_rps"], True),
+    ("p50", lambda r: r["latency_ms"]["p50"], False),
+    ("p95", lambda r: r["latency_ms"]["p95"], False),
+    ("p99", lambda r: r["latency_ms"]["p99"], False),
+    ("ttfb p50", lambda r: r["ttfb_ms"]["p50"], False),
+    ("rss MB", lambda r: r.get("memory_mb", {}).get("rss"), False),
+    ("llm/req", lambda r: r.get("llm", {}).get("chat_per_request"), False),
+]
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any], threshold: float) -> List[str]:
+    """In bảng so sánh hai lần chạy, trả về danh sách chỉ số bị chậm đi quá `threshold` %"""
+    print(f"Cũ: {old['commit']}{' (dirty)' if old.get('dirty') else ''} {old['date']} {old.get('label') or ''}")
+    print(f"Mới: {new['commit']}{' (dirty)' if new.get('dirty') else ''} {new['date']} {new.get('label') or ''}")
+    if old.get("config") != new.get("config"):
+        print("Lưu ý: cấu hình benchmark của hai lần chạy khác nhau")
+    regressions = []
+    for name, result in new["workloads"].items():
+        before = old["workloads"].get(name)
+        if before is None:
+            continue
+        print(f"\n{name}")
+        for metric, get, higher_is_better in COMPARED:
+            try:
+                a, b = get(before), get(result)
+            except (KeyError, TypeError):
+                continue
+            if a is None or b is None:
+                continue
+            change = _change(a, b)
+            worse = change is not None and (change < -threshold if higher_is_better else change > threshold)
+            flag = "  << chậm hơn" if worse else ""
+            if worse:
+                regressions.append(f"{name} {metric}")
+            print(f"  {metric:9} {a:10.2f} -> {b:10.2f}  {'' if change is None else f'{change:+6.1f}%'}{flag}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Benchmark offline với server LLM giả lập")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_cmd = sub.add_parser("run", help="Chạy benchmark và lưu kết quả")
+    run_cmd.add_argument("-w", "--workload", action="append", help=f"Kịch bản (lặp lại được): {', '.join(WORKLOADS)}")
+    run_cmd.add_argument("-n", "--requests", type=int, default=50, help="Số request mỗi kịch bản")
+    run_cmd.add_argument("-c", "--concurrency", type=int, default=8)
+    run_cmd.add_argument("--warmup", type=int, default=2)
+    run_cmd.add_argument("--repeat", type=float, default=0.0, help="Tỉ lệ request lặp lại cùng dữ liệu (đo cache, gộp lời gọi)")
+    run_cmd.add_argument("--app", choices=["flask", "asgi"], default="flask")
+    run_cmd.add_argument("--url", help="Gọi tới server đang chạy thay vì chạy ứng dụng trong process")
+    run_cmd.add_argument("--llm-url", help="Dùng server LLM giả lập đang chạy thay vì tạo mới")
+    run_cmd.add_argument("--keep-cache", action="store_true", help="Giữ cấu hình cache của môi trường (mặc định tắt cache)")
+    run_cmd.add_argument("--timeout", type=float, default=300.0)
+    run_cmd.add_argument("--label", default="")
+    run_cmd.add_argument("--results-dir", default=RESULTS_DIR)
+    run_cmd.add_argument("--no-save", action="store_true")
+    add_config_arguments(run_cmd)
+
+    compare_cmd = sub.add_parser("compare", help="So sánh hai kết quả (mặc định hai lần chạy gần nhất)")
+    compare_cmd.add_argument("old", nargs="?")
+    compare_cmd.add_argument("new", nargs="?")
+    compare_cmd.add_argument("--threshold", type=float, default=10.0, help="Ngưỡng chậm đi (%%) để báo hồi quy")
+    compare_cmd.add_argument("--fail-on-regression", action="store_true", help="Thoát với mã 1 nếu có hồi quy")
+    compare_cmd.add_argument("--results-dir", default=RESULTS_DIR)
+
+    list_cmd = sub.add_parser("list", help="Các kết quả đã lưu")
+    list_cmd.add_argument("--results-dir", default=RESULTS_DIR)
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        run(args)
+        # Không chờ các thread nền của ứng dụng (server, pool kết nối) khi thoát
+        sys.stdout.flush()
+        os._exit(0)
+    saved = sorted(glob.glob(os.path.join(args.results_dir, "*.json")))
+    if args.command == "list":
+        for path in saved:
+            record = _load(path)
+            print(f"{os.path.basename(path):48} {record['commit']}{'*' if record.get('dirty') else ' '} {', '.join(record['workloads'])}")
+        return
+    if args.old and args.new:
+        old_path, new_path = args.old, args.new
+    elif args.old:
+        if not saved:
+            raise SystemExit("Chưa có kết quả nào")
+        old_path, new_path = args.old, saved[-1]
+    else:
+        if len(saved) < 2:
+            raise SystemExit("Cần ít nhất hai kết quả để so sánh")
+        old_path, new_path = saved[-2], saved[-1]
+    regressions = compare(_load(old_path), _load(new_path), args.threshold)
+    if regressions:
+        print(f"\nChậm hơn quá {args.threshold:g}%: {', '.join(regressions)}")
+        if args.fail_on_regression:
+            sys.exit(1)
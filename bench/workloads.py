@@ -0,0 +1,174 @@
+"""Kịch bản tải cho từng endpoint và cho `JobAssistantAgent.process`.
+
+Mỗi kịch bản là một dict: `path` (endpoint), `payload(i)` (dữ liệu của request
+thứ i), `stream` (đọc response dạng SSE) hoặc `query(i)` cho kịch bản gọi thẳng
+`process`. Dữ liệu khác nhau theo i để không trúng cache hay bị gộp lời gọi, trừ
+khi benchmark chủ động lặp lại request (`--repeat`).
+"""
+import csv
+from typing import Any, Dict, List
+
+JOB_TITLES = ["Python Developer", "Data Engineer", "Frontend Developer", "DevOps Engineer", "QA Engineer", "Product Manager"]
+LOCATIONS = ["Hà Nội", "TP. Hồ Chí Minh", "Đà Nẵng", "Remote"]
+COMPANIES = ["FPT Software", "VNG", "Viettel", "Tiki", "MoMo", "Shopee"]
+SKILLS = ["Python, Django, PostgreSQL", "React, TypeScript", "Kubernetes, Terraform, AWS", "Spark, Airflow, SQL", "Selenium, Pytest"]
+
+CV_TEMPLATE = """NGUYỄN VĂN {n}
+Email: ungvien{n}@example.com | Điện thoại: 0900 000 {n:03d}
+
+MỤC TIÊU NGHỀ NGHIỆP
+Trở thành {title} có kinh nghiệm, đóng góp vào các sản phẩm có hàng triệu người dùng.
+
+KINH NGHIỆM LÀM VIỆC
+{company} (2021 - nay) - {title}
+- Phát triển và vận hành các dịch vụ backend phục vụ 2 triệu người dùng mỗi ngày
+- Giảm 40% thời gian phản hồi API bằng cache và tối ưu truy vấn
+- Hướng dẫn 3 thành viên mới trong nhóm
+
+Công ty khởi nghiệp ABC (2019 - 2021) - Lập trình viên
+- Xây dựng hệ thống quản lý đơn hàng, tích hợp thanh toán
+- Viết kiểm thử tự động, nâng độ bao phủ lên 80%
+
+HỌC VẤN
+Đại học Bách khoa Hà Nội - Kỹ sư Công nghệ thông tin (2015 - 2019)
+
+KỸ NĂNG
+{skills}, Git, Docker, Linux, làm việc nhóm, tiếng Anh giao tiếp
+"""
+
+QUERIES = [
+    "Tìm việc {title} lương trên 20 triệu ở {location}",
+    "Viết email ứng tuyển vị trí {title} tại {company}",
+    "Đánh giá CV của tôi cho vị trí {title}: {skills}, 3 năm kinh nghiệm",
+    "Công ty nào ở {location} đang tuyển {title}?",
+    "Tạo CV cho vị trí {title}, kỹ năng {skills}",
+]
+
+
+def _pick(items: List[str], i: int) -> str:
+    return items[i % len(items)]
+
+
+def _fields(i: int) -> Dict[str, Any]:
+    return {
+        "n": i,
+        "title": f"{_pick(JOB_TITLES, i)} #{i}",
+        "location": _pick(LOCATIONS, i // 2),
+        "company": _pick(COMPANIES, i // 3),
+        "skills": _pick(SKILLS, i),
+    }
+
+
+def cv_text(i: int) -> str:
+    return CV_TEMPLATE.format(**_fields(i))
+
+
+def long_cv_text(i: int, jobs: int = 80) -> str:
+    """CV nhiều trang: nhiều vị trí, header lặp ở mỗi trang và phần rập khuôn cuối CV"""
+    f = _fields(i)
+    lines = [f"NGUYỄN VĂN {i}", f"Email: ungvien{i}@example.com | Điện thoại: 0900 000 {i:03d}", "",
+             "MỤC TIÊU NGHỀ NGHIỆP", f"Trở thành {f['title']} dẫn dắt đội ngũ kỹ thuật.", "", "KINH NGHIỆM LÀM VIỆC"]
+    for k in range(jobs):
+        lines.append(f"{_pick(COMPANIES, i + k)} ({2024 - 2 * k - 2} - {2024 - 2 * k}) - {_pick(JOB_TITLES, i + k)}")
+        lines += [f"- Phụ trách mảng {_pick(SKILLS, i + k + j)} cho dự án {k}-{j}, phục vụ {j + 1} triệu người dùng mỗi ngày" for j in range(6)]
+        lines.append("")
+        if k % 4 == 3:
+            lines += [f"NGUYỄN VĂN {i}", f"Trang {k // 4 + 1}", ""]
+    lines += ["HỌC VẤN", "Đại học Bách khoa Hà Nội - Kỹ sư Công nghệ thông tin", "", f"KỸ NĂNG\n{f['skills']}, Git, Docker", "",
+              "NGƯỜI THAM CHIẾU", "Sẽ cung cấp khi được yêu cầu", "", "Tôi xin cam đoan những thông tin trên là đúng sự thật."]
+    return "\n".join(lines)
+
+
+INDUSTRIES = ["Công nghệ thông tin", "Tài chính - Ngân hàng", "Thương mại điện tử", "Viễn thông", "Giáo dục", "Y tế"]
+
+
+def write_companies(path: str, rows: int = 5000) -> str:
+    """Bộ dữ liệu công ty giả lập (CSV) cho `COMPANY_DATA`"""
+    tags = sorted({tag.strip() for skills in SKILLS for tag in skills.split(",")} | {"Java", "Go", "Docker", "Git"})
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["name", "industry", "location", "size", "skills", "open_positions"])
+        for i in range(rows):
+            skills = [tags[(i * 7 + k * 3) % len(tags)] for k in range(2 + i % 4)]
+            writer.writerow([f"Công ty {i}", _pick(INDUSTRIES, i // 3), _pick(LOCATIONS, i // 2),
+                             (i * 37) % 8000 + 10, ", ".join(skills), i % 25])
+    return path
+
+
+def _find_jobs(i: int) -> Dict[str, Any]:
+    f = _fields(i)
+    return {"jobDescription": f"{f['title']}, {f['skills']}", "salary": "20-30 triệu", "location": f["location"], "experience": i % 6}
+
+
+def _write_email(i: int) -> Dict[str, Any]:
+    f = _fields(i)
+    return {"job_title": f["title"], "company": f["company"], "skills": f["skills"]}
+
+
+def _write_emails(i: int, companies: int = 20) -> Dict[str, Any]:
+    f = _fields(i)
+    return {
+        "job_title": f["title"],
+        "skills": f["skills"],
+        "companies": [{"company": f"{_pick(COMPANIES, i + k)} #{k}", "note": _pick(LOCATIONS, k)} for k in range(companies)],
+    }
+
+
+def _evaluate_cv(i: int) -> Dict[str, Any]:
+    f = _fields(i)
+    return {"cv_text": cv_text(i), "job_description": f"Tuyển {f['title']} yêu cầu {f['skills']}"}
+
+
+def _evaluate_long_cv(i: int) -> Dict[str, Any]:
+    f = _fields(i)
+    return {"cv_text": long_cv_text(i), "job_description": f"Tuyển {f['title']} yêu cầu {f['skills']}"}
+
+
+def _companies(i: int) -> Dict[str, Any]:
+    f = _fields(i)
+    return {"skills": f["skills"], "industry": "Công nghệ thông tin", "location": f["location"]}
+
+
+def _create_cv(i: int) -> Dict[str, Any]:
+    f = _fields(i)
+    return {
+        "name": f"Nguyễn Văn {i}",
+        "email": f"ungvien{i}@example.com",
+        "phone": f"0900 000 {i:03d}",
+        "education": "Đại học Bách khoa Hà Nội, Kỹ sư CNTT",
+        "experience": f"3 năm làm {f['title']} tại {f['company']}",
+        "skills": f["skills"],
+    }
+
+
+def _rank_cvs(i: int) -> Dict[str, Any]:
+    return {
+        "cvs": [{"id": f"cv{i}-{k}", "text": cv_text(i * 10 + k)} for k in range(10)],
+        "jds": [f"Tuyển {_pick(JOB_TITLES, i + k)} yêu cầu {_pick(SKILLS, i + k)}" for k in range(2)],
+        "top_n": 3,
+    }
+
+
+def _query(i: int) -> str:
+    return _pick(QUERIES, i).format(**_fields(i))
+
+
+WORKLOADS: Dict[str, Dict[str, Any]] = {
+    "tim_viec": {"path": "/api/tim-viec", "payload": _find_jobs},
+    "tim_viec_stream": {"path": "/api/tim-viec?stream=1", "payload": _find_jobs, "stream": True},
+    "tim_viec_structured": {"path": "/api/tim-viec?format=structured", "payload": _find_jobs},
+    "viet_email": {"path": "/api/viet-email", "payload": _write_email},
+    "viet_email_stream": {"path": "/api/viet-email?stream=1", "payload": _write_email, "stream": True},
+    "viet_email_hang_loat": {"path": "/api/viet-email/batch", "payload": _write_emails},
+    "danh_gia_cv": {"path": "/api/danh-gia-cv", "payload": _evaluate_cv},
+    "danh_gia_cv_stream": {"path": "/api/danh-gia-cv?stream=1", "payload": _evaluate_cv, "stream": True},
+    "danh_gia_cv_dai": {"path": "/api/danh-gia-cv", "payload": _evaluate_long_cv},
+    "thong_ke_cong_ty": {"path": "/api/thong-ke-cong-ty", "payload": _companies},
+    "thong_ke_cong_ty_so_lieu": {"path": "/api/thong-ke-cong-ty/stats", "payload": _companies},
+    "tao_cv": {"path": "/api/tao-cv", "payload": _create_cv},
+    "xep_hang_cv": {"path": "/api/xep-hang-cv", "payload": _rank_cvs},
+    "process": {"query": _query},
+}
+
+# Kịch bản chạy mặc định: mỗi nhóm endpoint một kịch bản và luồng xử lý qua đồ thị
+DEFAULT = ["tim_viec", "tim_viec_stream", "viet_email", "danh_gia_cv", "thong_ke_cong_ty", "tao_cv", "xep_hang_cv", "process"]
@@ -0,0 +1,65 @@
+// Gọi API ở chế độ stream (Server-Sent Events) và hiển thị văn bản ngay khi nhận được.
+// onText(toànBộVănBản, đoạnMới) được gọi sau mỗi đoạn; Promise trả về toàn bộ văn bản.
+// onEvent(tênSựKiện, dữLiệu) (không bắt buộc) nhận các sự kiện khác, vd. "stats".
+function streamSSE(url, body, onText, onEvent) {
+    const streamUrl = url + (url.indexOf("?") === -1 ? "?" : "&") + "stream=1";
+    return fetch(streamUrl, {
+        method: "POST",
+        headers: {
+            "Content-Type": "application/json",
+            Accept: "text/event-stream",
+        },
+        body: JSON.stringify(body),
+    }).then((response) => {
+        if (!response.ok || !response.body) {
+            throw new Error("HTTP " + response.status);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        let text = "";
+
+        function handleEvent(raw) {
+            let event = "message";
+            const dataLines = [];
+            raw.split("\n").forEach((line) => {
+                if (line.startsWith("event:")) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith("data:")) {
+                    dataLines.push(line.slice(5).trimStart());
+                }
+            });
+            const payload = dataLines.length
+                ? JSON.parse(dataLines.join("\n"))
+                : {};
+
+            if (event === "error") {
+                throw new Error(payload.error || "Stream error");
+            }
+            if (event === "message" && payload.text) {
+                text += payload.text;
+                onText(text, payload.text);
+            } else if (event !== "message" && event !== "done" && onEvent) {
+                onEvent(event, payload);
+            }
+        }
+
+        function pump() {
+            return reader.read().then(({ done, value }) => {
+                if (done) {
+                    return text;
+                }
+                buffer += decoder.decode(value, { stream: true });
+                let boundary;
+                while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+                    handleEvent(buffer.slice(0, boundary));
+                    buffer = buffer.slice(boundary + 2);
+                }
+                return pump();
+            });
+        }
+
+        return pump();
+    });
+}